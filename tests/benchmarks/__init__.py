@@ -0,0 +1,5 @@
+"""Benchmarks measuring yapapi's own overhead against an in-process yagna stand-in.
+
+The benchmarks are plain scripts (`bench_*.py`) so they're not collected by pytest;
+run them with e.g. `python -m tests.benchmarks.bench_engine --help`.
+"""
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""End-to-end throughput benchmark of `Golem.execute_tasks` and `Golem.run_service`.
+
+Runs yapapi against `FakeYagna`, so the numbers reflect the overhead of yapapi itself
+(market negotiations, agreements, worker scheduling, payments) rather than of the network.
+
+Usage::
+
+    python -m tests.benchmarks.bench_engine tasks --tasks 1000 --providers 50 --max-workers 20
+    python -m tests.benchmarks.bench_engine services --instances 20
+    python -m tests.benchmarks.bench_engine tasks --latency 0.01 --fail create_agreement=0.1
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import AsyncIterable, Dict, Optional
+
+from dataclasses import dataclass
+
+from tests.benchmarks.fake_yagna import FakeYagna, FakeYagnaConfig, fake_gftp_on_path
+from tests.benchmarks.metrics import LoopLagMonitor, Stopwatch, peak_rss_mib, report, summarize
+from yapapi import Golem, Task, WorkContext, events
+from yapapi.payload import Payload
+from yapapi.props import inf
+from yapapi.props.base import constraint
+from yapapi.services import Service, ServiceState
+
+
+@dataclass
+class BenchPayload(Payload):
+    runtime: str = constraint(inf.INF_RUNTIME_NAME, default="vm")
+
+
+class EventCounter:
+    """Event consumer counting the emitted events by their class name.
+
+    Additionally it tracks the number of running workers and records the time it took
+    to reach `full_capacity` running workers, measured from the first event.
+    """
+
+    def __init__(self, full_capacity: Optional[int] = None):
+        self.counts: Counter = Counter()
+        self.full_capacity = full_capacity
+        self.running_workers = 0
+        self.peak_workers = 0
+        self.time_to_full_capacity: Optional[float] = None
+        self._started_at: Optional[float] = None
+
+    def __call__(self, event: events.Event) -> None:
+        self.counts[type(event).__name__] += 1
+        now = time.perf_counter()
+        if self._started_at is None:
+            self._started_at = now
+        if isinstance(event, events.WorkerStarted):
+            self.running_workers += 1
+            self.peak_workers = max(self.peak_workers, self.running_workers)
+            if self.running_workers == self.full_capacity and self.time_to_full_capacity is None:
+                self.time_to_full_capacity = now - self._started_at
+        elif isinstance(event, events.WorkerFinished):
+            self.running_workers -= 1
+
+
+def _golem(yagna: FakeYagna, counter: EventCounter, args: argparse.Namespace) -> Golem:
+    return Golem(
+        budget=1000.0,
+        api_config=yagna.api_config,
+        event_consumer=counter,
+        subnet_tag="benchmark",
+        payment_driver="erc20",
+        payment_network="goerli",
+        proposal_concurrency=args.proposal_concurrency,
+    )
+
+
+def _common_results(
+    elapsed: float, counter: EventCounter, lag: LoopLagMonitor, yagna: FakeYagna
+) -> Dict[str, object]:
+    lag_stats = summarize(lag.samples)
+    return {
+        "elapsed [s]": elapsed,
+        "proposals received": counter.counts["ProposalReceived"],
+        "proposals/sec": counter.counts["ProposalReceived"] / elapsed,
+        "agreements confirmed": counter.counts["AgreementConfirmed"],
+        "invoices accepted": yagna.invoices_accepted,
+        "loop lag mean [ms]": lag_stats["mean"] * 1000,
+        "loop lag p99 [ms]": lag_stats["p99"] * 1000,
+        "loop lag max [ms]": lag_stats["max"] * 1000,
+        "peak RSS [MiB]": peak_rss_mib(),
+        "REST calls": sum(yagna.calls.values()),
+        "injected failures": sum(yagna.failures_injected.values()),
+    }
+
+
+async def bench_tasks(args: argparse.Namespace, config: FakeYagnaConfig) -> None:
+    async def worker(ctx: WorkContext, tasks: AsyncIterable[Task]):
+        async for task in tasks:
+            script = ctx.new_script()
+            future_result = script.run("/bin/true")
+            yield script
+            task.accept_result(result=await future_result)
+
+    counter = EventCounter(full_capacity=args.max_workers)
+    async with FakeYagna(config) as yagna, LoopLagMonitor() as lag:
+        with Stopwatch() as total:
+            async with _golem(yagna, counter, args) as golem:
+                with Stopwatch() as compute:
+                    completed = 0
+                    async for _ in golem.execute_tasks(
+                        worker,
+                        [Task(data=n) for n in range(args.tasks)],
+                        payload=BenchPayload(),
+                        max_workers=args.max_workers,
+                        task_prefetch=args.task_prefetch,
+                        agreement_parallelism=args.agreement_parallelism,
+                        timeout=timedelta(seconds=args.timeout),
+                    ):
+                        completed += 1
+
+    results = {
+        "tasks completed": completed,
+        "tasks/sec": completed / compute.elapsed,
+        "peak workers": counter.peak_workers,
+        "time to full capacity [s]": counter.time_to_full_capacity,
+        "shutdown [s]": total.elapsed - compute.elapsed,
+    }
+    results.update(_common_results(total.elapsed, counter, lag, yagna))
+    report(f"execute_tasks: {args.tasks} tasks, max_workers={args.max_workers}", results)
+
+
+class BenchService(Service):
+    """A service that runs a fixed number of trivial scripts and then stops."""
+
+    scripts = 10
+
+    async def run(self):
+        for _ in range(self.scripts):
+            script = self._ctx.new_script()
+            script.run("/bin/true")
+            yield script
+
+
+async def bench_services(args: argparse.Namespace, config: FakeYagnaConfig) -> None:
+    BenchService.scripts = args.scripts
+    counter = EventCounter()
+    async with FakeYagna(config) as yagna, LoopLagMonitor() as lag:
+        with Stopwatch() as total:
+            async with _golem(yagna, counter, args) as golem:
+                cluster = await golem.run_service(
+                    BenchService, num_instances=args.instances, payload=BenchPayload()
+                )
+                with Stopwatch() as startup:
+                    while not all(s.state == ServiceState.running for s in cluster.instances):
+                        await asyncio.sleep(0.01)
+                while any(s.state != ServiceState.terminated for s in cluster.instances):
+                    await asyncio.sleep(0.01)
+                cluster.stop()
+
+    results = {
+        "instances": args.instances,
+        "time to all running [s]": startup.elapsed,
+        "scripts sent": counter.counts["ScriptSent"],
+        "scripts/sec": counter.counts["ScriptSent"] / total.elapsed,
+    }
+    results.update(_common_results(total.elapsed, counter, lag, yagna))
+    report(f"run_service: {args.instances} instances x {args.scripts} scripts", results)
+
+
+def _parse_failures(specs) -> Dict[str, float]:
+    failures = {}
+    for spec in specs or []:
+        operation, _, probability = spec.partition("=")
+        failures[operation] = float(probability)
+    return failures
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--providers", type=int, default=20, help="number of fake providers")
+    parser.add_argument("--offer-rate", type=float, default=100.0, help="offers/sec per demand")
+    parser.add_argument("--latency", type=float, default=0.0, help="REST call latency [s]")
+    parser.add_argument(
+        "--command-duration", type=float, default=0.0, help="exe script command duration [s]"
+    )
+    parser.add_argument(
+        "--fail",
+        action="append",
+        metavar="OPERATION=PROBABILITY",
+        help=(
+            "inject HTTP 500 errors, e.g. `create_agreement=0.1`; `*=P` applies to all calls,"
+            " including the ones made on startup, which abort the benchmark when they fail"
+        ),
+    )
+    parser.add_argument(
+        "--proposal-concurrency", type=int, default=5, help="proposals handled concurrently per job"
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--timeout", type=float, default=600.0, help="job timeout [s]")
+
+    subparsers = parser.add_subparsers(dest="scenario", required=True)
+    tasks = subparsers.add_parser("tasks", help="benchmark Golem.execute_tasks")
+    tasks.add_argument("--tasks", type=int, default=100)
+    tasks.add_argument("--max-workers", type=int, default=10)
+    tasks.add_argument("--task-prefetch", type=int, default=1)
+    tasks.add_argument("--agreement-parallelism", type=int, default=5)
+    services = subparsers.add_parser("services", help="benchmark Golem.run_service")
+    services.add_argument("--instances", type=int, default=10)
+    services.add_argument("--scripts", type=int, default=10, help="scripts per instance")
+    return parser
+
+
+def main() -> None:
+    args = build_parser().parse_args()
+    config = FakeYagnaConfig(
+        providers=args.providers,
+        offer_rate=args.offer_rate,
+        latency=args.latency,
+        command_duration=args.command_duration,
+        failures=_parse_failures(args.fail),
+        seed=args.seed,
+    )
+    bench = bench_tasks if args.scenario == "tasks" else bench_services
+    with fake_gftp_on_path():
+        asyncio.run(bench(args, config))
+
+
+if __name__ == "__main__":
+    main()
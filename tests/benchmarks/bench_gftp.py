@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""Benchmark of concurrent JSON-RPC requests to `gftp server`.
+
+Each worker repeatedly makes the requests an executor's worker makes for a task: it publishes
+the task's input (`gftp publish`), creates a destination for its output (`gftp receive`)
+and closes the input's URL (`gftp close`). The `gftp server` is replaced with
+`tests.benchmarks.fake_gftp`, which takes `--delay` seconds to handle each request,
+with `--server-workers` requests handled concurrently.
+
+Use `--serialize` to allow only one request in flight at a time, as the client did before
+it was pipelined.
+
+Usage::
+
+    python -m tests.benchmarks.bench_gftp --workers 50 --tasks 20 --delay 0.002
+    python -m tests.benchmarks.bench_gftp --workers 50 --tasks 20 --delay 0.002 --serialize
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+from tests.benchmarks.fake_yagna import fake_gftp_on_path
+from tests.benchmarks.metrics import LoopLagMonitor, Stopwatch, report, summarize
+from yapapi.storage import gftp
+
+
+class _SerialDriver:
+    """Makes the requests of a `GftpDriver` one at a time, each waiting for its response."""
+
+    def __init__(self, driver: gftp.GftpDriver):
+        self._driver = driver
+        self._lock = asyncio.Lock()
+
+    async def publish(self, **kwargs):
+        async with self._lock:
+            return await self._driver.publish(**kwargs)
+
+    async def receive(self, **kwargs):
+        async with self._lock:
+            return await self._driver.receive(**kwargs)
+
+    async def close(self, **kwargs):
+        async with self._lock:
+            return await self._driver.close(**kwargs)
+
+
+async def _worker(
+    driver: gftp.GftpDriver, input_file: Path, output_dir: Path, tasks: int, latencies: List[float]
+) -> None:
+    for task in range(tasks):
+        started_at = time.perf_counter()
+        [link] = await driver.publish(files=[str(input_file)])
+        latencies.append(time.perf_counter() - started_at)
+        started_at = time.perf_counter()
+        await driver.receive(output_file=str(output_dir / f"{input_file.name}-{task}"))
+        latencies.append(time.perf_counter() - started_at)
+        started_at = time.perf_counter()
+        await driver.close(urls=[link["url"]])
+        latencies.append(time.perf_counter() - started_at)
+
+
+async def bench(args: argparse.Namespace, temp_dir: Path) -> None:
+    input_files = []
+    for worker_id in range(args.workers):
+        input_file = temp_dir / f"input-{worker_id}"
+        input_file.write_bytes(f"input {worker_id}".encode())
+        input_files.append(input_file)
+
+    latencies: List[float] = []
+    async with gftp.service() as service:
+        driver = _SerialDriver(service) if args.serialize else service
+        async with LoopLagMonitor() as lag:
+            with Stopwatch() as total:
+                await asyncio.gather(
+                    *[
+                        _worker(driver, input_file, temp_dir, args.tasks, latencies)  # type: ignore
+                        for input_file in input_files
+                    ]
+                )
+
+    requests = summarize(latencies)
+    report(
+        f"gftp: {args.workers} workers x {args.tasks} tasks, delay={args.delay}s,"
+        f" server workers={args.server_workers}, serialize={args.serialize}",
+        {
+            "requests/sec": len(latencies) / total.elapsed,
+            "request p50 [ms]": requests["p50"] * 1000,
+            "request p99 [ms]": requests["p99"] * 1000,
+            "loop lag max [ms]": summarize(lag.samples)["max"] * 1000,
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--tasks", type=int, default=20, help="tasks done by each worker")
+    parser.add_argument(
+        "--delay", type=float, default=0.002, help="time gftp takes to handle a request [s]"
+    )
+    parser.add_argument(
+        "--server-workers", type=int, default=8, help="requests gftp handles concurrently"
+    )
+    parser.add_argument("--serialize", action="store_true")
+    args = parser.parse_args()
+    os.environ["FAKE_GFTP_DELAY"] = str(args.delay)
+    os.environ["FAKE_GFTP_WORKERS"] = str(args.server_workers)
+    with fake_gftp_on_path(), tempfile.TemporaryDirectory(prefix="bench-gftp-") as temp_dir:
+        asyncio.run(bench(args, Path(temp_dir)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Benchmark of the engine's debit note and invoice processing with many agreements.
+
+Drives `_Engine` payment processing directly, with an in-memory payment API, so the numbers
+reflect the cost of routing and bookkeeping rather than of the REST calls. Use `--latency`
+to simulate the time of the REST calls instead.
+
+Usage::
+
+    python -m tests.benchmarks.bench_payments --jobs 200 --agreements 10000 --notes 50000
+    python -m tests.benchmarks.bench_payments --notes 2000 --latency 0.05 --parallelism 50
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import AsyncIterator, Dict, List
+from unittest import mock
+
+from ya_payment import models as payment_models
+
+from tests.benchmarks.metrics import LoopLagMonitor, Stopwatch, peak_rss_mib, report, summarize
+from yapapi.config import ApiConfig
+from yapapi.engine import Job, _Engine
+from yapapi.rest.payment import DebitNote, EventCursor, Invoice
+from yapapi.strategy import LeastExpensiveLinearPayuMS
+
+PAYER_ADDR = "0xrequestor"
+PAYMENT_PLATFORM = "erc20-goerli-tglm"
+
+
+class FakeAgreement:
+    """The parts of `yapapi.rest.market.Agreement` used by the payment processing."""
+
+    def __init__(self, agreement_id: str):
+        self.id = agreement_id
+        self.terminated = False
+
+    def get_requestor_property(self, _key: str):
+        return None
+
+
+class FakePaymentApi:
+    """In-memory replacement of `yapapi.rest.Payment` and of the underlying `RequestorApi`."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.debit_notes: Dict[str, DebitNote] = {}
+        self.accepted = 0
+
+    async def _call(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def incoming_debit_note_ids(self, cursor: EventCursor) -> AsyncIterator[str]:
+        for debit_note_id in self.debit_notes:
+            cursor.received(debit_note_id, datetime.now(timezone.utc))
+            yield debit_note_id
+
+    async def debit_note(self, debit_note_id: str) -> DebitNote:
+        await self._call()
+        return self.debit_notes[debit_note_id]
+
+    async def accept_debit_note(self, _debit_note_id, _acceptance) -> None:
+        await self._call()
+        self.accepted += 1
+
+    async def accept_invoice(self, _invoice_id, _acceptance) -> None:
+        await self._call()
+        self.accepted += 1
+
+
+def _debit_note(api: FakePaymentApi, n: int, agreement_id: str, activity_id: str) -> DebitNote:
+    base = payment_models.DebitNote(
+        debit_note_id=f"debit-note-{n}",
+        issuer_id="provider",
+        recipient_id="requestor",
+        payee_addr="0xprovider",
+        payer_addr=PAYER_ADDR,
+        payment_platform=PAYMENT_PLATFORM,
+        timestamp=datetime.now(timezone.utc),
+        agreement_id=agreement_id,
+        activity_id=activity_id,
+        total_amount_due=str(n),
+        status="RECEIVED",
+    )
+    return DebitNote(api, base)  # type: ignore
+
+
+def _invoice(api: FakePaymentApi, agreement_id: str) -> Invoice:
+    base = payment_models.Invoice(
+        invoice_id=f"invoice-{agreement_id}",
+        issuer_id="provider",
+        recipient_id="requestor",
+        payee_addr="0xprovider",
+        payer_addr=PAYER_ADDR,
+        payment_platform=PAYMENT_PLATFORM,
+        timestamp=datetime.now(timezone.utc),
+        agreement_id=agreement_id,
+        activity_ids=[],
+        amount="1",
+        payment_due_date=datetime.now(timezone.utc),
+        status="RECEIVED",
+    )
+    return Invoice(api, base)  # type: ignore
+
+
+async def bench(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    api = FakePaymentApi(args.latency)
+    engine = _Engine(
+        budget=Decimal(1000),
+        strategy=LeastExpensiveLinearPayuMS(),
+        event_consumer=lambda _event: None,
+        api_config=ApiConfig(app_key="benchmark"),
+        payment_parallelism=args.parallelism,
+    )
+    engine._payment_api = api  # type: ignore
+    engine._market_api = mock.Mock()
+    engine.allocations.add(
+        mock.Mock(
+            id="allocation",
+            amount=Decimal(10**12),
+            payment_address=PAYER_ADDR,
+            payment_platform=PAYMENT_PLATFORM,
+        )
+    )
+
+    expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+    jobs = [Job(engine, expiration, payload=mock.Mock()) for _ in range(args.jobs)]
+    for job in jobs:
+        engine.add_job(job)
+
+    agreement_ids: List[str] = []
+    with Stopwatch() as setup:
+        for n in range(args.agreements):
+            job = jobs[n % len(jobs)]
+            agreement = FakeAgreement(f"agreement-{n}")
+            engine._all_agreements[agreement.id] = agreement  # type: ignore
+            engine._invoice_manager.add_agreement(job, agreement)  # type: ignore
+            engine.accept_debit_notes_for_agreement(job.id, agreement.id)
+            engine.debit_note_rates.activity_started(f"activity-{n}", agreement.id)
+            agreement_ids.append(agreement.id)
+
+    for n in range(args.notes):
+        agreement_n = rng.randrange(args.agreements)
+        api.debit_notes[f"debit-note-{n}"] = _debit_note(
+            api, n, agreement_ids[agreement_n], f"activity-{agreement_n}"
+        )
+
+    invoice_latencies = []
+    async with LoopLagMonitor() as lag:
+        with Stopwatch() as notes:
+            await engine._process_debit_notes()
+
+        with Stopwatch() as invoices:
+            for agreement_id in agreement_ids:
+                started = time.perf_counter()
+                engine._invoice_manager.add_invoice(_invoice(api, agreement_id))
+                await engine.accept_payments_for_agreement("", agreement_id)
+                invoice_latencies.append(time.perf_counter() - started)
+
+    invoice_stats = summarize(invoice_latencies)
+    stats = engine.payment_stats
+    report(
+        f"payments: {args.jobs} jobs, {args.agreements} agreements, {args.notes} debit notes, "
+        f"parallelism={args.parallelism}",
+        {
+            "setup [s]": setup.elapsed,
+            "debit notes/sec": args.notes / notes.elapsed,
+            "debit note queue mean [ms]": stats.debit_note_queue.mean * 1000,
+            "debit note processing mean [ms]": stats.debit_note_processing.mean * 1000,
+            "debit note accept mean [ms]": stats.debit_note_acceptance.mean * 1000,
+            "invoices/sec": args.agreements / invoices.elapsed,
+            "invoice mean [us]": invoice_stats["mean"] * 1e6,
+            "invoice p99 [us]": invoice_stats["p99"] * 1e6,
+            "payments accepted": api.accepted,
+            "loop lag max [ms]": summarize(lag.samples)["max"] * 1000,
+            "peak RSS [MiB]": peak_rss_mib(),
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--jobs", type=int, default=100)
+    parser.add_argument("--agreements", type=int, default=10000)
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0, help="payment API call latency [s]")
+    parser.add_argument(
+        "--parallelism", type=int, default=10, help="debit notes processed concurrently"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
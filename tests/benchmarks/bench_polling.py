@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""Benchmark of the latency of short scripts whose results are retrieved with `PollingBatch`.
+
+Each worker sends a sequence of short scripts to its own activity, served by an in-memory
+replacement of the yagna activity API, and iterates over the results with the real
+`yapapi.rest.activity.PollingBatch`. The report includes the overhead of each script,
+i.e. the time from the moment its last command finishes on the provider until its result
+is returned, and the number of GetExecBatchResults calls per script.
+
+The fake server can honour `commandIndex` (`--server command-index`, like current yagna),
+long-poll only until the batch has any results (`--server long-poll`) or return at once
+(`--server immediate`).
+
+Usage::
+
+    python -m tests.benchmarks.bench_polling --workers 50 --scripts 20 --commands 3
+    python -m tests.benchmarks.bench_polling --server immediate --command-duration 0.2
+    python -m tests.benchmarks.bench_polling --min-interval 3 --max-interval 3  # fixed interval
+"""
+import argparse
+import asyncio
+import itertools
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+from unittest import mock
+
+from dataclasses import dataclass
+
+from ya_activity import models as yaa
+
+from tests.benchmarks.metrics import LoopLagMonitor, Stopwatch, report, summarize
+from yapapi.rest.activity import Activity, PollingBatch
+
+
+@dataclass
+class _Batch:
+    size: int
+    started_at: float
+
+
+class FakeActivityApi:
+    """In-memory replacement of `ya_activity.RequestorControlApi` running batches of commands."""
+
+    def __init__(self, server: str, command_duration: float, latency: float = 0.0):
+        self.server = server
+        self.command_duration = command_duration
+        self.latency = latency
+        self.batches: Dict[str, _Batch] = {}
+        self.calls = 0
+        self._batch_ids = (f"batch-{n}" for n in itertools.count())
+
+    def _done(self, batch: _Batch) -> int:
+        elapsed = asyncio.get_event_loop().time() - batch.started_at
+        return min(batch.size, int(elapsed / self.command_duration))
+
+    def finished_at(self, batch_id: str, idx: int) -> float:
+        """Return the loop time at which the command `idx` of a batch has finished."""
+        batch = self.batches[batch_id]
+        return batch.started_at + (idx + 1) * self.command_duration
+
+    async def call_exec(self, _activity_id: str, request: yaa.ExeScriptRequest) -> str:
+        await asyncio.sleep(self.latency)
+        batch_id = next(self._batch_ids)
+        self.batches[batch_id] = _Batch(
+            len(json.loads(request.text)), asyncio.get_event_loop().time()
+        )
+        return batch_id
+
+    async def get_exec_batch_results(
+        self,
+        _activity_id: str,
+        batch_id: str,
+        command_index: Optional[int] = None,
+        timeout: float = 0.0,
+        _request_timeout: Optional[float] = None,
+    ) -> List[yaa.ExeScriptCommandResult]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        batch = self.batches[batch_id]
+        if self.server == "command-index" and command_index is not None:
+            wait_for = command_index + 1
+        elif self.server == "long-poll":
+            wait_for = 1
+        else:
+            wait_for = 0
+        if self._done(batch) < wait_for:
+            loop = asyncio.get_event_loop()
+            finish_at = batch.started_at + wait_for * self.command_duration
+            await asyncio.sleep(min(timeout, finish_at - loop.time()))
+        return [
+            yaa.ExeScriptCommandResult(
+                index=idx,
+                event_date=datetime.now(timezone.utc),
+                result="Ok",
+                is_batch_finished=idx == batch.size - 1,
+            )
+            for idx in range(self._done(batch))
+        ]
+
+
+async def _worker(api: FakeActivityApi, args: argparse.Namespace, overheads: List[float]) -> None:
+    loop = asyncio.get_event_loop()
+    activity = Activity(api, mock.Mock(), "activity", stream_events=False)  # type: ignore
+    script = [{"run": {"entry_point": "/bin/true", "args": []}}] * args.commands
+    for _ in range(args.scripts):
+        batch = await activity.send(script)
+        async for _event_class, kwargs in batch:
+            if kwargs["cmd_idx"] == args.commands - 1:
+                overheads.append(loop.time() - api.finished_at(batch.id, kwargs["cmd_idx"]))
+
+
+async def bench(args: argparse.Namespace) -> None:
+    PollingBatch.MIN_POLL_INTERVAL = args.min_interval
+    PollingBatch.MAX_POLL_INTERVAL = args.max_interval
+    api = FakeActivityApi(args.server, args.command_duration, args.latency)
+    overheads: List[float] = []
+
+    async with LoopLagMonitor() as lag:
+        with Stopwatch() as total:
+            await asyncio.gather(*[_worker(api, args, overheads) for _ in range(args.workers)])
+
+    scripts = args.workers * args.scripts
+    overhead = summarize(overheads)
+    report(
+        f"polling: {args.workers} workers x {args.scripts} scripts x {args.commands} commands,"
+        f" server={args.server}, command duration={args.command_duration}s,"
+        f" latency={args.latency}s",
+        {
+            "scripts/sec": scripts / total.elapsed,
+            "overhead mean [ms]": overhead["mean"] * 1000,
+            "overhead p50 [ms]": overhead["p50"] * 1000,
+            "overhead p99 [ms]": overhead["p99"] * 1000,
+            "overhead max [ms]": overhead["max"] * 1000,
+            "GetExecBatchResults calls/script": api.calls / scripts,
+            "loop lag max [ms]": summarize(lag.samples)["max"] * 1000,
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=50)
+    parser.add_argument("--scripts", type=int, default=20, help="scripts sent by each worker")
+    parser.add_argument("--commands", type=int, default=3, help="commands in each script")
+    parser.add_argument(
+        "--command-duration", type=float, default=0.02, help="time of each command [s]"
+    )
+    parser.add_argument(
+        "--server", choices=["command-index", "long-poll", "immediate"], default="command-index"
+    )
+    parser.add_argument("--latency", type=float, default=0.001, help="activity API latency [s]")
+    parser.add_argument("--min-interval", type=float, default=PollingBatch.MIN_POLL_INTERVAL)
+    parser.add_argument("--max-interval", type=float, default=PollingBatch.MAX_POLL_INTERVAL)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
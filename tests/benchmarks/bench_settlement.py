@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Benchmark of payment settlement: a replay of debit notes and invoices through the engine.
+
+A synthetic stream of debit note and invoice events is served by an in-memory replacement
+of the yagna payment API, and consumed by `_Engine` through the real `yapapi.rest.Payment`
+(with long polling of the events), until all the events are processed. The report includes
+the throughput, the end-to-end latencies (from publishing an event until the document is
+accepted) and the engine's own timing histograms.
+
+Usage::
+
+    python -m tests.benchmarks.bench_settlement --notes 100000 --agreements 10000
+    python -m tests.benchmarks.bench_settlement --rate 5000 --latency 0.005 --parallelism 50
+"""
+import argparse
+import asyncio
+import bisect
+import gc
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Tuple
+from unittest import mock
+
+import ya_payment.models as yap
+
+from tests.benchmarks.bench_payments import PAYER_ADDR, PAYMENT_PLATFORM, FakeAgreement
+from tests.benchmarks.metrics import LoopLagMonitor, Stopwatch, peak_rss_mib, report, summarize
+from yapapi import rest
+from yapapi.config import ApiConfig
+from yapapi.engine import Job, _Engine
+from yapapi.strategy import LeastExpensiveLinearPayuMS
+from yapapi.utils import LatencyStats
+
+MAX_EVENTS_PER_POLL = 1000
+
+
+class _EventStream:
+    def __init__(self):
+        self.events: List[Any] = []
+        self.dates: List[datetime] = []
+        self.published_at: Dict[str, float] = {}
+        self.new_events = asyncio.Event()
+
+    def publish(self, event, document_id: str) -> None:
+        self.events.append(event)
+        self.dates.append(event.event_date)
+        self.published_at[document_id] = time.perf_counter()
+        self.new_events.set()
+
+    async def get(self, after: datetime, poll_timeout: float) -> list:
+        start = bisect.bisect_right(self.dates, after)
+        if start == len(self.events):
+            self.new_events.clear()
+            try:
+                await asyncio.wait_for(self.new_events.wait(), poll_timeout)
+            except asyncio.TimeoutError:
+                return []
+            start = bisect.bisect_right(self.dates, after)
+        return self.events[start : start + MAX_EVENTS_PER_POLL]
+
+
+class FakeRequestorApi:
+    """In-memory replacement of `ya_payment.RequestorApi`, including its `ApiClient`."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.api_client = self
+        self.debit_notes: Dict[str, yap.DebitNote] = {}
+        self.invoices: Dict[str, yap.Invoice] = {}
+        self.debit_note_events = _EventStream()
+        self.invoice_events = _EventStream()
+        self.debit_note_latencies: List[float] = []
+        self.invoice_latencies: List[float] = []
+        self._last_event_date = datetime.now(timezone.utc)
+
+    def _event_date(self) -> datetime:
+        self._last_event_date = max(
+            datetime.now(timezone.utc), self._last_event_date + timedelta(microseconds=1)
+        )
+        return self._last_event_date
+
+    def publish_debit_note(self, debit_note: yap.DebitNote) -> None:
+        self.debit_notes[debit_note.debit_note_id] = debit_note
+        event = yap.DebitNoteReceivedEvent(
+            event_date=self._event_date(), debit_note_id=debit_note.debit_note_id
+        )
+        self.debit_note_events.publish(event, debit_note.debit_note_id)
+
+    def publish_invoice(self, invoice: yap.Invoice) -> None:
+        self.invoices[invoice.invoice_id] = invoice
+        event = yap.InvoiceReceivedEvent(
+            event_date=self._event_date(), invoice_id=invoice.invoice_id
+        )
+        self.invoice_events.publish(event, invoice.invoice_id)
+
+    async def _call(self) -> None:
+        # Suspend also without latency, as a real request would
+        await asyncio.sleep(self.latency)
+
+    async def call_api(self, path: str, _method: str, query_params, **_kwargs) -> list:
+        await self._call()
+        params = dict(query_params)
+        stream = self.debit_note_events if path == "/debitNoteEvents" else self.invoice_events
+        return await stream.get(params["afterTimestamp"], params["pollTimeout"])
+
+    async def get_debit_note(self, debit_note_id: str) -> yap.DebitNote:
+        await self._call()
+        return self.debit_notes[debit_note_id]
+
+    async def accept_debit_note(self, debit_note_id: str, _acceptance) -> None:
+        await self._call()
+        published_at = self.debit_note_events.published_at[debit_note_id]
+        self.debit_note_latencies.append(time.perf_counter() - published_at)
+
+    async def get_invoice(self, invoice_id: str) -> yap.Invoice:
+        await self._call()
+        return self.invoices[invoice_id]
+
+    async def accept_invoice(self, invoice_id: str, _acceptance) -> None:
+        await self._call()
+        published_at = self.invoice_events.published_at[invoice_id]
+        self.invoice_latencies.append(time.perf_counter() - published_at)
+
+
+def _payment_doc(agreement_id: str) -> dict:
+    return dict(
+        issuer_id="provider",
+        recipient_id="requestor",
+        payee_addr="0xprovider",
+        payer_addr=PAYER_ADDR,
+        payment_platform=PAYMENT_PLATFORM,
+        timestamp=datetime.now(timezone.utc),
+        agreement_id=agreement_id,
+        status="RECEIVED",
+    )
+
+
+def _synthetic_stream(notes: int, agreements: int, seed: int) -> List[Tuple[str, Any]]:
+    """Return a shuffled stream of debit notes and invoices of `agreements` agreements.
+
+    The debit notes of each agreement have growing cumulative amounts and the invoice
+    of an agreement follows all its debit notes.
+    """
+
+    rng = random.Random(seed)
+    notes_per_agreement = [0] * agreements
+    for _ in range(notes):
+        notes_per_agreement[rng.randrange(agreements)] += 1
+    remaining = list(notes_per_agreement)
+    pending = list(range(agreements))
+    documents: List[Tuple[str, Any]] = []
+    while pending:
+        index = rng.randrange(len(pending))
+        n = pending[index]
+        agreement_id = f"agreement-{n}"
+        if remaining[n]:
+            remaining[n] -= 1
+            count = notes_per_agreement[n] - remaining[n]
+            debit_note = yap.DebitNote(
+                debit_note_id=f"debit-note-{n}-{count}",
+                activity_id=f"activity-{n}",
+                total_amount_due=str(Decimal(count) / 1000),
+                **_payment_doc(agreement_id),
+            )
+            documents.append(("debit_note", debit_note))
+        else:
+            invoice = yap.Invoice(
+                invoice_id=f"invoice-{n}",
+                activity_ids=[f"activity-{n}"],
+                amount=str(Decimal(notes_per_agreement[n] + 1) / 1000),
+                payment_due_date=datetime.now(timezone.utc),
+                **_payment_doc(agreement_id),
+            )
+            documents.append(("invoice", invoice))
+            pending[index] = pending[-1]
+            pending.pop()
+    return documents
+
+
+async def _replay(api: FakeRequestorApi, documents: List[Tuple[str, Any]], rate: float) -> None:
+    chunk = max(1, int(rate / 100)) if rate else MAX_EVENTS_PER_POLL
+    for start in range(0, len(documents), chunk):
+        for kind, document in documents[start : start + chunk]:
+            if kind == "debit_note":
+                api.publish_debit_note(document)
+            else:
+                api.publish_invoice(document)
+        await asyncio.sleep(chunk / rate if rate else 0)
+
+
+async def _processed(cursor, stream: _EventStream) -> None:
+    while not stream.dates or cursor.position != stream.dates[-1]:
+        await asyncio.sleep(0.01)
+
+
+def _histogram_summary(stats: LatencyStats) -> str:
+    return (
+        f"n={stats.count} mean={stats.mean * 1000:.3f} p50={stats.percentile(50) * 1000:.3f}"
+        f" p99={stats.percentile(99) * 1000:.3f} max={stats.max * 1000:.3f} [ms]"
+    )
+
+
+async def bench(args: argparse.Namespace) -> None:
+    api = FakeRequestorApi(args.latency)
+    engine = _Engine(
+        budget=Decimal(10**9),
+        strategy=LeastExpensiveLinearPayuMS(),
+        event_consumer=lambda _event: None,
+        api_config=ApiConfig(app_key="benchmark"),
+        payment_parallelism=args.parallelism,
+    )
+    payment_api = rest.Payment(
+        mock.Mock(), debit_note_latency=engine.payment_stats.debit_note_fetch
+    )
+    payment_api._api = api  # type: ignore
+    engine._payment_api = payment_api
+    engine._market_api = mock.Mock()
+    engine.allocations.add(
+        mock.Mock(
+            id="allocation",
+            amount=Decimal(10**9),
+            payment_address=PAYER_ADDR,
+            payment_platform=PAYMENT_PLATFORM,
+        )
+    )
+
+    expiration = datetime.now(timezone.utc) + timedelta(hours=1)
+    jobs = [Job(engine, expiration, payload=mock.Mock()) for _ in range(args.jobs)]
+    for job in jobs:
+        engine.add_job(job)
+    for n in range(args.agreements):
+        job = jobs[n % len(jobs)]
+        agreement = FakeAgreement(f"agreement-{n}")
+        engine._all_agreements[agreement.id] = agreement  # type: ignore
+        engine._invoice_manager.add_agreement(job, agreement)  # type: ignore
+        engine.accept_debit_notes_for_agreement(job.id, agreement.id)
+        engine._invoice_manager.set_payable(agreement.id)
+        engine.debit_note_rates.activity_started(f"activity-{n}", agreement.id)
+
+    documents = _synthetic_stream(args.notes, args.agreements, args.seed)
+    # Keep the full collections of the synthetic data out of the measured loop lag
+    gc.freeze()
+    cursors = engine._payment_cursors
+    # Start before the first event, even if the consumers don't poll before it's published
+    cursors.debit_notes.position = cursors.invoices.position = datetime.now(timezone.utc)
+    loop = asyncio.get_event_loop()
+    async with LoopLagMonitor() as lag:
+        with Stopwatch() as total:
+            consumers = [
+                loop.create_task(engine._process_debit_notes()),
+                loop.create_task(engine._process_invoices()),
+            ]
+            await _replay(api, documents, args.rate)
+            await asyncio.gather(
+                _processed(cursors.debit_notes, api.debit_note_events),
+                _processed(cursors.invoices, api.invoice_events),
+            )
+        for task in consumers:
+            task.cancel()
+        await asyncio.gather(*consumers, return_exceptions=True)
+
+    notes = summarize(api.debit_note_latencies)
+    invoices = summarize(api.invoice_latencies)
+    stats = engine.payment_stats
+    report(
+        f"settlement: {args.notes} debit notes, {args.agreements} agreements,"
+        f" rate={args.rate or 'burst'}, latency={args.latency}s, parallelism={args.parallelism}",
+        {
+            "documents/sec": len(documents) / total.elapsed,
+            "debit notes accepted": len(api.debit_note_latencies),
+            # Debit notes processed after the agreement's invoice are ignored
+            "debit notes ignored": args.notes - len(api.debit_note_latencies),
+            "debit note e2e p50 [ms]": notes["p50"] * 1000,
+            "debit note e2e p99 [ms]": notes["p99"] * 1000,
+            "invoices accepted": len(api.invoice_latencies),
+            "invoice e2e p50 [ms]": invoices["p50"] * 1000,
+            "invoice e2e p99 [ms]": invoices["p99"] * 1000,
+            "debit note queue": _histogram_summary(stats.debit_note_queue),
+            "debit note processing": _histogram_summary(stats.debit_note_processing),
+            "Payment.debit_note": _histogram_summary(stats.debit_note_fetch),
+            "debit note acceptance": _histogram_summary(stats.debit_note_acceptance),
+            "invoice settlement": _histogram_summary(stats.invoice_settlement),
+            "loop lag max [ms]": summarize(lag.samples)["max"] * 1000,
+            "peak RSS [MiB]": peak_rss_mib(),
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=100000)
+    parser.add_argument("--agreements", type=int, default=10000)
+    parser.add_argument("--jobs", type=int, default=10)
+    parser.add_argument(
+        "--rate", type=float, default=0.0, help="documents published per second, 0 for a burst"
+    )
+    parser.add_argument("--latency", type=float, default=0.0, help="payment API call latency [s]")
+    parser.add_argument(
+        "--parallelism", type=int, default=10, help="debit notes processed concurrently"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
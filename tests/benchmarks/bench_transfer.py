@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Benchmark of transfers of large files through `GftpProvider`.
+
+A file of `--size` MiB is uploaded, or downloaded, with `GftpProvider`, with `gftp server`
+replaced by `tests.benchmarks.fake_gftp`. The report includes the throughput and the event
+loop lag during the transfer, i.e. how long other workers may be stalled by it.
+
+The upload methods are:
+
+* `file`: `GftpProvider.upload_file`, which publishes the file as it is,
+* `stream`: `GftpProvider.upload_stream` with the file read by the generic
+  `InputStorageProvider.upload_file`, as done by storage providers that can't publish files,
+* `bytes`: `GftpProvider.upload_bytes` with the file's content read in memory beforehand.
+
+For a download, the file is written to the destination created by `GftpProvider`, as `gftp`
+would do when receiving it, and then retrieved by the requestor with:
+
+* `file`: `GftpDestination.download_file`, to a file in `--target-dir`,
+* `stream`: the generic `Destination.download_file`, which writes the `download_stream`,
+* `bytes`: `GftpDestination.download_bytes`.
+
+Usage::
+
+    python -m tests.benchmarks.bench_transfer --size 1024 --method stream
+    python -m tests.benchmarks.bench_transfer --size 256 --method bytes
+    python -m tests.benchmarks.bench_transfer --download --size 1024 --method file
+    python -m tests.benchmarks.bench_transfer --download --method file --target-dir /dev/shm
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+from pathlib import Path
+
+from tests.benchmarks.fake_yagna import fake_gftp_on_path
+from tests.benchmarks.metrics import LoopLagMonitor, Stopwatch, peak_rss_mib, report, summarize
+from yapapi.storage import Destination, InputStorageProvider, gftp
+
+
+def _create_file(path: Path, size: int) -> None:
+    block = os.urandom(2**20)
+    with open(path, "wb") as f:
+        for _ in range(size):
+            f.write(block)
+
+
+async def _upload(args: argparse.Namespace, temp_dir: Path, lag: LoopLagMonitor) -> float:
+    path = temp_dir / "input"
+    _create_file(path, args.size)
+    data = path.read_bytes() if args.method == "bytes" else b""
+
+    async with gftp.GftpProvider(tmpdir=str(temp_dir / "provider")) as provider:
+        async with lag:
+            with Stopwatch() as total:
+                if args.method == "file":
+                    source = await provider.upload_file(path)
+                elif args.method == "stream":
+                    source = await InputStorageProvider.upload_file(provider, path)
+                else:
+                    source = await provider.upload_bytes(data)
+        await provider.release_source(source)
+    return total.elapsed
+
+
+async def _download(args: argparse.Namespace, temp_dir: Path, lag: LoopLagMonitor) -> float:
+    target = Path(args.target_dir or temp_dir) / f"bench-transfer-output-{os.getpid()}"
+    try:
+        async with gftp.GftpProvider(tmpdir=str(temp_dir / "provider")) as provider:
+            destination = await provider.new_destination()
+            assert isinstance(destination, gftp.GftpDestination)
+            _create_file(Path(destination._link["file"]), args.size)
+            async with lag:
+                with Stopwatch() as total:
+                    if args.method == "file":
+                        await destination.download_file(target)
+                    elif args.method == "stream":
+                        await Destination.download_file(destination, target)
+                    else:
+                        data = await destination.download_bytes(limit=args.size * 2**20)
+                        assert len(data) == args.size * 2**20
+    finally:
+        if target.exists():
+            target.unlink()
+    return total.elapsed
+
+
+async def bench(args: argparse.Namespace, temp_dir: Path) -> None:
+    lag = LoopLagMonitor()
+    if args.download:
+        elapsed = await _download(args, temp_dir, lag)
+    else:
+        elapsed = await _upload(args, temp_dir, lag)
+
+    lags = summarize(lag.samples)
+    report(
+        f"transfer: {'download' if args.download else 'upload'} of {args.size} MiB,"
+        f" method={args.method}",
+        {
+            "MiB/sec": args.size / elapsed,
+            "loop lag p99 [ms]": lags["p99"] * 1000,
+            "loop lag max [ms]": lags["max"] * 1000,
+            "peak RSS [MiB]": peak_rss_mib(),
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=1024, help="size of the file [MiB]")
+    parser.add_argument("--method", choices=["file", "stream", "bytes"], default="stream")
+    parser.add_argument("--download", action="store_true")
+    parser.add_argument(
+        "--target-dir", help="directory of the downloaded file, the temporary directory by default"
+    )
+    args = parser.parse_args()
+    with fake_gftp_on_path(), tempfile.TemporaryDirectory(prefix="bench-transfer-") as temp_dir:
+        (Path(temp_dir) / "provider").mkdir()
+        asyncio.run(bench(args, Path(temp_dir)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""Benchmark of transfers and listings with `DavStorageProvider`.
+
+A blob of `--size` MiB is uploaded to, and then downloaded from, a `FakeWebDav` server
+running in the same process, which limits the bandwidth of every single request
+(`--bandwidth`), as a link that a single TCP stream can't fill does. Then the directory
+is listed `--listings` times by concurrent workers. The report includes the throughput
+of the transfers and the number of PROPFIND requests made for the listings.
+
+Use `--max-parallel 1` to download one range at a time, `--no-ranges` to make the server
+ignore ranges, so that the blob is downloaded with a single request, and `--listing-ttl 0`
+to disable the cache of the listings.
+
+Usage::
+
+    python -m tests.benchmarks.bench_webdav --size 256 --bandwidth 32 --max-parallel 8
+    python -m tests.benchmarks.bench_webdav --size 256 --bandwidth 32 --no-ranges
+    python -m tests.benchmarks.bench_webdav --size 16 --listing-ttl 0
+"""
+import argparse
+import asyncio
+import os
+
+import aiohttp
+
+from tests.benchmarks.fake_webdav import FakeWebDav, FakeWebDavConfig
+from tests.benchmarks.metrics import Stopwatch, report
+from yapapi.storage.webdav import DavStorageProvider
+
+
+async def bench(args: argparse.Namespace) -> None:
+    size = args.size * 2**20
+    data = os.urandom(size)
+    config = FakeWebDavConfig(
+        latency=args.latency, bandwidth=args.bandwidth * 2**20, ranges=not args.no_ranges
+    )
+    async with FakeWebDav(config) as dav, aiohttp.ClientSession() as client:
+        provider = await DavStorageProvider.for_directory(
+            client,
+            dav.url,
+            "bench",
+            part_size=args.part_size * 2**20,
+            max_parallel=args.max_parallel,
+            listing_ttl=args.listing_ttl,
+        )
+        with Stopwatch() as upload:
+            source = await provider.upload_bytes(data)
+
+        # Download the blob from a destination, as if a provider had uploaded it there
+        destination = await provider.new_destination()
+        dav.resources[destination.upload_url[len(dav.url) - 1 :]] = dav.resources[
+            source.download_url[len(dav.url) - 1 :]
+        ]
+        with Stopwatch() as download:
+            downloaded = await destination.download_bytes(limit=size)
+        assert downloaded == data
+
+        async def list_directory(count: int) -> None:
+            for _ in range(count):
+                await provider.prop_find()
+                await asyncio.sleep(0.001)
+
+        with Stopwatch() as listing:
+            await asyncio.gather(
+                *[list_directory(args.listings // args.workers) for _ in range(args.workers)]
+            )
+
+    report(
+        f"webdav: {args.size} MiB, bandwidth={args.bandwidth} MiB/s per request,"
+        f" latency={args.latency}s, part size={args.part_size} MiB,"
+        f" max parallel={args.max_parallel}, ranges={not args.no_ranges},"
+        f" listing ttl={args.listing_ttl}s",
+        {
+            "upload MiB/sec": args.size / upload.elapsed,
+            "download MiB/sec": args.size / download.elapsed,
+            "GET requests": dav.calls["GET"],
+            "listings/sec": args.listings / listing.elapsed,
+            "PROPFIND requests": dav.calls["PROPFIND"],
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=256, help="size of the blob [MiB]")
+    parser.add_argument(
+        "--bandwidth", type=float, default=32.0, help="bandwidth of a single request [MiB/s]"
+    )
+    parser.add_argument("--latency", type=float, default=0.002, help="request latency [s]")
+    parser.add_argument("--part-size", type=int, default=8, help="size of a range [MiB]")
+    parser.add_argument("--max-parallel", type=int, default=8)
+    parser.add_argument("--no-ranges", action="store_true")
+    parser.add_argument("--listings", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=10, help="workers listing the directory")
+    parser.add_argument("--listing-ttl", type=float, default=5.0)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""A stand-in for the `gftp server` JSON-RPC service.
+
+Reads newline-delimited JSON-RPC 2.0 requests from stdin and writes the responses to stdout,
+like the real `gftp server` does, but doesn't expose anything over the network.
+Use `fake_yagna.fake_gftp_on_path()` to make `yapapi.storage.gftp` start it instead of `gftp`.
+
+The environment variable `FAKE_GFTP_DELAY` sets the time in seconds it takes to handle each
+request, and `FAKE_GFTP_WORKERS` the number of requests handled concurrently. With more than
+one worker, the responses may be written in a different order than the requests were read.
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+NODE_ID = "0x" + "f" * 40
+VERSION = "0.7.3 (fake)"
+
+
+def _publish(files):
+    links = []
+    for file in files:
+        with open(file, "rb") as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        links.append({"file": file, "url": f"gftp://{NODE_ID}/{digest}"})
+    return links
+
+
+def _receive(output_file):
+    return {"file": output_file, "url": f"gftp://{NODE_ID}/{uuid.uuid4().hex}"}
+
+
+METHODS = {
+    "version": lambda: VERSION,
+    "publish": _publish,
+    "close": lambda urls: ["ok" for _ in urls],
+    "receive": _receive,
+    "upload": lambda file, url: None,
+    "shutdown": lambda: "ok",
+}
+
+
+DELAY = float(os.environ.get("FAKE_GFTP_DELAY", 0))
+WORKERS = int(os.environ.get("FAKE_GFTP_WORKERS", 1))
+
+
+def handle(request: Dict[str, Any]) -> Dict[str, Any]:
+    if DELAY:
+        time.sleep(DELAY)
+    response: Dict[str, Any] = {"jsonrpc": "2.0", "id": request.get("id")}
+    try:
+        params = request.get("params") or {}
+        response["result"] = METHODS[request["method"]](**params)
+    except Exception as e:
+        response["error"] = {"code": -32000, "message": str(e)}
+    return response
+
+
+def main() -> None:
+    if sys.argv[1:] != ["server"]:
+        sys.exit("usage: gftp server")
+    output_lock = threading.Lock()
+
+    def respond(request: Dict[str, Any]) -> None:
+        response = json.dumps(handle(request)) + "\n"
+        with output_lock:
+            sys.stdout.write(response)
+            sys.stdout.flush()
+
+    with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            if request["method"] == "shutdown":
+                # Respond after all the other requests
+                executor.shutdown(wait=True)
+                respond(request)
+                break
+            executor.submit(respond, request)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""An in-process stand-in for a WebDAV server.
+
+`FakeWebDav` serves the subset of WebDAV used by `yapapi.storage.webdav.DavStorageProvider`
+(MKCOL, PUT, GET with single byte ranges and `If-Range`, HEAD and PROPFIND with depth 1)
+from memory.
+The bandwidth of every single request can be limited (see `FakeWebDavConfig`), to model
+a link that a single TCP stream can't fill.
+
+Example::
+
+    async with FakeWebDav(FakeWebDavConfig(bandwidth=50 * 2**20)) as dav:
+        async with aiohttp.ClientSession() as client:
+            provider = await DavStorageProvider.for_directory(client, dav.url, "data")
+            ...
+"""
+import asyncio
+import itertools
+import logging
+import re
+from collections import Counter
+from datetime import datetime, timezone
+from email.utils import format_datetime
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+from aiohttp import web
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+_RANGE = re.compile(r"bytes=(\d+)-(\d*)$")
+
+
+@dataclass
+class FakeWebDavConfig:
+    """Behaviour of the simulated WebDAV server."""
+
+    latency: float = 0.0
+    """Delay (in seconds) added before handling every request."""
+
+    bandwidth: float = 0.0
+    """Maximum number of bytes per second sent or received by every request, 0 for no limit."""
+
+    ranges: bool = True
+    """Whether GET requests with a `Range` header are answered with the requested range."""
+
+
+class FakeWebDav:
+    """A stand-in for a WebDAV server serving resources stored in memory."""
+
+    CHUNK_SIZE = 64 * 1024
+    """Size of the chunks in which request and response bodies are read and written."""
+
+    def __init__(self, config: Optional[FakeWebDavConfig] = None, host: str = "127.0.0.1"):
+        self.config = config or FakeWebDavConfig()
+        self._host = host
+        self._port: Optional[int] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._versions = itertools.count(1)
+
+        self.resources: Dict[str, Tuple[bytes, datetime]] = {}
+        """Contents and modification times of the stored files, keyed by their path."""
+
+        self.etags: Dict[str, str] = {}
+        """Entity tags of the stored files, changed whenever a file is written."""
+
+        self.collections = {"/"}
+        """Paths of the directories, with trailing slashes."""
+
+        self.calls: Counter = Counter()
+        """Number of handled requests, keyed by the HTTP method."""
+
+    @property
+    def url(self) -> str:
+        """Return the URL of the root directory."""
+        assert self._port is not None, "FakeWebDav not started"
+        return f"http://{self._host}:{self._port}/"
+
+    async def start(self) -> None:
+        app = web.Application(client_max_size=0)
+        app.router.add_route("*", "/{path:.*}", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, 0)
+        await site.start()
+        self._port = self._runner.addresses[0][1]
+        logger.debug("FakeWebDav listening on %s", self.url)
+
+    async def stop(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeWebDav":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    async def _throttle(self, started_at: float, transferred: int) -> None:
+        if self.config.bandwidth:
+            loop = asyncio.get_event_loop()
+            await asyncio.sleep(started_at + transferred / self.config.bandwidth - loop.time())
+
+    async def _handle(self, request: web.Request) -> web.StreamResponse:
+        self.calls[request.method] += 1
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        handler = {
+            "MKCOL": self._mkcol,
+            "PUT": self._put,
+            "GET": self._get,
+            "HEAD": self._get,
+            "PROPFIND": self._propfind,
+        }.get(request.method)
+        if handler is None:
+            return web.Response(status=405)
+        return await handler(request)
+
+    async def _mkcol(self, request: web.Request) -> web.Response:
+        path = request.path.rstrip("/") + "/"
+        if path in self.collections or path[:-1] in self.resources:
+            return web.Response(status=405)
+        self.collections.add(path)
+        return web.Response(status=201)
+
+    async def _put(self, request: web.Request) -> web.Response:
+        if request.path.rsplit("/", 1)[0] + "/" not in self.collections:
+            return web.Response(status=409)
+        loop = asyncio.get_event_loop()
+        started_at = loop.time()
+        chunks: List[bytes] = []
+        received = 0
+        async for chunk in request.content.iter_chunked(self.CHUNK_SIZE):
+            chunks.append(chunk)
+            received += len(chunk)
+            await self._throttle(started_at, received)
+        self.resources[request.path] = (b"".join(chunks), datetime.now(timezone.utc))
+        self.etags[request.path] = f'"{next(self._versions)}"'
+        return web.Response(status=201)
+
+    async def _get(self, request: web.Request) -> web.StreamResponse:
+        if request.path not in self.resources:
+            return web.Response(status=404)
+        data, _ = self.resources[request.path]
+        etag = self.etags.setdefault(request.path, f'"{next(self._versions)}"')
+        start, end = 0, len(data)
+        response = web.StreamResponse(status=200, headers={"ETag": etag})
+        match = _RANGE.match(request.headers.get("Range", ""))
+        # A range of a resource changed since `If-Range` was sent isn't served
+        if_range = request.headers.get("If-Range", etag)
+        if match and self.config.ranges and if_range == etag:
+            start = int(match.group(1))
+            if start >= len(data):
+                return web.Response(status=416, headers={"Content-Range": f"bytes */{len(data)}"})
+            if match.group(2):
+                end = min(end, int(match.group(2)) + 1)
+            response.set_status(206)
+            response.headers["Content-Range"] = f"bytes {start}-{end - 1}/{len(data)}"
+        response.headers["Accept-Ranges"] = "bytes"
+        response.content_length = end - start
+        await response.prepare(request)
+        if request.method == "HEAD":
+            return response
+
+        loop = asyncio.get_event_loop()
+        started_at = loop.time()
+        for offset in range(start, end, self.CHUNK_SIZE):
+            chunk_end = min(offset + self.CHUNK_SIZE, end)
+            await response.write(data[offset:chunk_end])
+            await self._throttle(started_at, chunk_end - start)
+        await response.write_eof()
+        return response
+
+    async def _propfind(self, request: web.Request) -> web.Response:
+        path = request.path.rstrip("/") + "/"
+        if path not in self.collections:
+            return web.Response(status=404)
+        entries = [
+            f"<a:response><a:href>{escape(name)}</a:href><a:propstat><a:prop>"
+            f"<a:resourcetype/><a:getcontentlength>{len(data)}</a:getcontentlength>"
+            f"<a:getlastmodified>{format_datetime(modified, usegmt=True)}</a:getlastmodified>"
+            f"</a:prop></a:propstat></a:response>"
+            for name, (data, modified) in self.resources.items()
+            if name.rsplit("/", 1)[0] + "/" == path
+        ]
+        entries.insert(
+            0,
+            f"<a:response><a:href>{escape(path)}</a:href><a:propstat><a:prop>"
+            f"<a:resourcetype><a:collection/></a:resourcetype>"
+            f"</a:prop></a:propstat></a:response>",
+        )
+        body = (
+            f'<?xml version="1.0"?><a:multistatus xmlns:a="DAV:">{"".join(entries)}</a:multistatus>'
+        )
+        return web.Response(status=207, body=body, content_type="text/xml")
@@ -0,0 +1,888 @@
+"""An in-process stand-in for the yagna daemon.
+
+`FakeYagna` serves the subset of the market, activity, payment and net REST APIs that
+yapapi uses, backed by simulated providers. It is meant for measuring yapapi's own overhead,
+so all the "remote" operations complete instantly unless configured otherwise
+(see `FakeYagnaConfig`).
+
+Example::
+
+    async with FakeYagna(FakeYagnaConfig(providers=50)) as yagna:
+        async with Golem(budget=10.0, api_config=yagna.api_config) as golem:
+            ...
+"""
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import random
+import stat
+import sys
+import tempfile
+from collections import Counter, deque
+from datetime import datetime, timezone
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from aiohttp import web
+from dataclasses import dataclass, field
+
+from yapapi.config import ApiConfig
+from yapapi.props import com
+
+logger = logging.getLogger(__name__)
+
+REQUESTOR_ID = "0x" + "1" * 40
+"""Node id (and payment address) of the simulated requestor."""
+
+_ids = itertools.count(1)
+
+
+def _new_id(prefix: str) -> str:
+    return f"{prefix}-{next(_ids)}"
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _ts(dt: Optional[datetime] = None) -> str:
+    return (dt or _now()).isoformat()
+
+
+@dataclass
+class FakeYagnaConfig:
+    """Behaviour of the simulated yagna daemon and the providers behind it."""
+
+    providers: int = 10
+    """Number of simulated provider nodes."""
+
+    offer_rate: float = 100.0
+    """Number of offers per second sent to every demand subscription."""
+
+    latency: float = 0.0
+    """Delay (in seconds) added before handling every REST request."""
+
+    failures: Dict[str, float] = field(default_factory=dict)
+    """Probability of responding with HTTP 500, keyed by the operation name.
+
+    Operation names follow the `ya-aioclient` method names, e.g. `create_agreement`,
+    `wait_for_approval`, `call_exec` or `accept_invoice`. The key `*` matches any operation.
+    """
+
+    command_duration: float = 0.0
+    """Time (in seconds) it takes a provider to execute a single exe script command."""
+
+    multi_activity: bool = True
+    """Whether the providers support multiple activities within one agreement."""
+
+    debit_note_interval: Optional[float] = None
+    """Interval (in seconds) between debit notes sent for each activity, `None` disables them."""
+
+    invoice_amount: Decimal = Decimal("0.001")
+    """Amount of each invoice and debit note issued by the providers."""
+
+    payment_platforms: Tuple[str, ...] = ("erc20-goerli-tglm",)
+    """Payment platforms supported by the providers."""
+
+    max_pending_offers: int = 1000
+    """Maximum number of offers buffered for a subscription, excess offers are dropped."""
+
+    seed: Optional[int] = None
+    """Seed for the random generator used for prices and failure injection."""
+
+
+@dataclass
+class _Provider:
+    id: str
+    name: str
+    properties: Dict[str, Any]
+
+
+@dataclass
+class _Proposal:
+    id: str
+    demand_id: str
+    issuer_id: str
+    properties: Dict[str, Any]
+    constraints: str
+    state: str
+    prev_proposal_id: Optional[str] = None
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "proposalId": self.id,
+            "issuerId": self.issuer_id,
+            "properties": self.properties,
+            "constraints": self.constraints,
+            "state": self.state,
+            "timestamp": _ts(),
+            "prevProposalId": self.prev_proposal_id,
+        }
+
+
+class _Demand:
+    def __init__(self, yagna: "FakeYagna", properties: Dict[str, Any], constraints: str):
+        self.id = _new_id("demand")
+        self.properties = properties
+        self.constraints = constraints
+        self.events: Deque[Dict[str, Any]] = deque(maxlen=yagna.config.max_pending_offers)
+        self.new_events = asyncio.Event()
+        self.offers_sent = 0
+        self._yagna = yagna
+        self._task = asyncio.get_event_loop().create_task(self._send_offers())
+
+    def push(self, proposal: _Proposal) -> None:
+        self.events.append(
+            {"eventType": "ProposalEvent", "eventDate": _ts(), "proposal": proposal.to_json()}
+        )
+        self.new_events.set()
+
+    async def _send_offers(self) -> None:
+        providers = self._yagna.providers
+        interval = 1.0 / self._yagna.config.offer_rate if self._yagna.config.offer_rate else 0
+        for provider in itertools.cycle(providers):
+            proposal = _Proposal(
+                id=_new_id("offer"),
+                demand_id=self.id,
+                issuer_id=provider.id,
+                properties=provider.properties,
+                constraints="",
+                state="Initial",
+            )
+            self._yagna.proposals[proposal.id] = proposal
+            self.push(proposal)
+            self.offers_sent += 1
+            await asyncio.sleep(interval)
+
+    def close(self) -> None:
+        self._task.cancel()
+
+
+@dataclass
+class _Agreement:
+    id: str
+    provider: _Provider
+    demand_properties: Dict[str, Any]
+    offer_properties: Dict[str, Any]
+    valid_to: str
+    state: str = "Proposal"
+    activities: int = 0
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "agreementId": self.id,
+            "demand": {
+                "demandId": _new_id("demand"),
+                "requestorId": REQUESTOR_ID,
+                "properties": self.demand_properties,
+                "constraints": "",
+                "timestamp": _ts(),
+            },
+            "offer": {
+                "offerId": _new_id("offer"),
+                "providerId": self.provider.id,
+                "properties": self.offer_properties,
+                "constraints": "",
+                "timestamp": _ts(),
+            },
+            "validTo": self.valid_to,
+            "state": self.state,
+            "timestamp": _ts(),
+        }
+
+
+@dataclass
+class _Batch:
+    id: str
+    commands: List[Dict[str, Any]]
+    started_at: float
+
+    def results(self, now: float, command_duration: float) -> List[Dict[str, Any]]:
+        if command_duration:
+            done = min(len(self.commands), int((now - self.started_at) / command_duration))
+        else:
+            done = len(self.commands)
+        return [
+            {
+                "index": idx,
+                "eventDate": _ts(),
+                "result": "Ok",
+                "stdout": "",
+                "stderr": "",
+                "message": None,
+                "isBatchFinished": idx == len(self.commands) - 1,
+            }
+            for idx in range(done)
+        ]
+
+    def finished_at(self, command_duration: float) -> float:
+        return self.started_at + len(self.commands) * command_duration
+
+
+@dataclass
+class _Activity:
+    id: str
+    agreement: _Agreement
+    batches: Dict[str, _Batch] = field(default_factory=dict)
+    state: str = "Ready"
+    debit_notes_task: Optional[asyncio.Task] = None
+
+
+class _EventLog:
+    """Timestamped payment events with long-polling support."""
+
+    def __init__(self):
+        self._events: List[Tuple[datetime, Dict[str, Any]]] = []
+        self._cond = asyncio.Condition()
+
+    async def add(self, event: Dict[str, Any]) -> None:
+        ts = _now()
+        event["eventDate"] = _ts(ts)
+        async with self._cond:
+            self._events.append((ts, event))
+            self._cond.notify_all()
+
+    def _after(self, after: Optional[datetime], max_events: int) -> List[Dict[str, Any]]:
+        return [ev for ts, ev in self._events if after is None or ts > after][:max_events]
+
+    async def get(
+        self, after: Optional[datetime], timeout: float, max_events: int
+    ) -> List[Dict[str, Any]]:
+        async with self._cond:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._cond.wait_for(lambda: bool(self._after(after, max_events))), timeout
+                )
+            return self._after(after, max_events)
+
+
+def _float_param(request: web.Request, *names: str, default: float = 0.0) -> float:
+    for name in names:
+        if name in request.query:
+            return float(request.query[name])
+    return default
+
+
+def _datetime_param(request: web.Request, name: str) -> Optional[datetime]:
+    value = request.query.get(name)
+    if not value:
+        return None
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class FakeYagna:
+    """A stand-in for the yagna daemon serving its REST API from the current event loop."""
+
+    def __init__(self, config: Optional[FakeYagnaConfig] = None, host: str = "127.0.0.1"):
+        self.config = config or FakeYagnaConfig()
+        self._host = host
+        self._port: Optional[int] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._random = random.Random(self.config.seed)
+
+        self.providers = [self._new_provider(n) for n in range(self.config.providers)]
+        self._providers_by_id = {p.id: p for p in self.providers}
+        self.demands: Dict[str, _Demand] = {}
+        self.proposals: Dict[str, _Proposal] = {}
+        self.agreements: Dict[str, _Agreement] = {}
+        self.activities: Dict[str, _Activity] = {}
+        self.allocations: Dict[str, Dict[str, Any]] = {}
+        self.invoices: Dict[str, Dict[str, Any]] = {}
+        self.debit_notes: Dict[str, Dict[str, Any]] = {}
+        self.networks: Dict[str, Dict[str, Any]] = {}
+        self._invoice_events = _EventLog()
+        self._debit_note_events = _EventLog()
+
+        self.calls: Counter = Counter()
+        """Number of handled requests, keyed by the operation name."""
+
+        self.failures_injected: Counter = Counter()
+        """Number of injected failures, keyed by the operation name."""
+
+    def _new_provider(self, n: int) -> _Provider:
+        provider_id = "0x" + f"{n + 1:040x}"
+        name = f"fake-provider-{n}"
+        properties: Dict[str, Any] = {
+            "golem.node.id.name": name,
+            "golem.runtime.name": "vm",
+            "golem.srv.caps.multi-activity": self.config.multi_activity,
+            com.SCHEME: com.BillingScheme.PAYU.value,
+            com.PRICE_MODEL: com.PriceModel.LINEAR.value,
+            com.DEFINED_USAGES: [com.Counter.CPU.value, com.Counter.TIME.value],
+            com.LINEAR_COEFFS: [
+                round(self._random.uniform(0.00001, 0.0001), 6),
+                round(self._random.uniform(0.00001, 0.0001), 6),
+                0.0,
+            ],
+        }
+        for platform in self.config.payment_platforms:
+            properties[f"golem.com.payment.platform.{platform}.address"] = provider_id
+        if self.config.debit_note_interval:
+            properties["golem.com.scheme.payu.debit-note.interval-sec?"] = 120
+        return _Provider(id=provider_id, name=name, properties=properties)
+
+    # Lifecycle
+
+    @property
+    def url(self) -> str:
+        """Return the base URL of the REST API."""
+        assert self._port is not None, "FakeYagna not started"
+        return f"http://{self._host}:{self._port}"
+
+    @property
+    def api_config(self) -> ApiConfig:
+        """Return `ApiConfig` pointing to this instance."""
+        return ApiConfig(app_key="fake-yagna-app-key", api_url=self.url)
+
+    async def start(self) -> None:
+        app = web.Application(middlewares=[self._middleware])
+        app.add_routes(self._routes())
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self._host, 0)
+        await site.start()
+        self._port = self._runner.addresses[0][1]
+        logger.debug("FakeYagna listening on %s", self.url)
+
+    async def stop(self) -> None:
+        for demand in self.demands.values():
+            demand.close()
+        for activity in self.activities.values():
+            if activity.debit_notes_task:
+                activity.debit_notes_task.cancel()
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def __aenter__(self) -> "FakeYagna":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    # Request handling
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        operation = request.match_info.route.name or "unknown"
+        self.calls[operation] += 1
+        if self.config.latency:
+            await asyncio.sleep(self.config.latency)
+        probability = self.config.failures.get(operation, self.config.failures.get("*", 0.0))
+        if probability and self._random.random() < probability:
+            self.failures_injected[operation] += 1
+            return web.json_response({"message": "Injected failure"}, status=500)
+        return await handler(request)
+
+    def _routes(self) -> List[web.RouteDef]:
+        market = "/market-api/v1"
+        activity = "/activity-api/v1"
+        payment = "/payment-api/v1"
+        net = "/net-api/v1"
+        return [
+            web.get("/me", self._identity, name="identity"),
+            # market
+            web.post(f"{market}/demands", self._subscribe_demand, name="subscribe_demand"),
+            web.delete(
+                f"{market}/demands/{{sid}}", self._unsubscribe_demand, name="unsubscribe_demand"
+            ),
+            web.get(
+                f"{market}/demands/{{sid}}/events", self._collect_offers, name="collect_offers"
+            ),
+            web.post(
+                f"{market}/demands/{{sid}}/proposals/{{pid}}",
+                self._counter_proposal,
+                name="counter_proposal_demand",
+            ),
+            web.post(
+                f"{market}/demands/{{sid}}/proposals/{{pid}}/reject",
+                self._reject_proposal,
+                name="reject_proposal_offer",
+            ),
+            web.post(f"{market}/agreements", self._create_agreement, name="create_agreement"),
+            web.get(f"{market}/agreements/{{aid}}", self._get_agreement, name="get_agreement"),
+            web.post(
+                f"{market}/agreements/{{aid}}/confirm",
+                self._confirm_agreement,
+                name="confirm_agreement",
+            ),
+            web.post(
+                f"{market}/agreements/{{aid}}/wait",
+                self._wait_for_approval,
+                name="wait_for_approval",
+            ),
+            web.post(
+                f"{market}/agreements/{{aid}}/terminate",
+                self._terminate_agreement,
+                name="terminate_agreement",
+            ),
+            # activity
+            web.post(f"{activity}/activity", self._create_activity, name="create_activity"),
+            web.delete(
+                f"{activity}/activity/{{aid}}", self._destroy_activity, name="destroy_activity"
+            ),
+            web.post(f"{activity}/activity/{{aid}}/exec", self._call_exec, name="call_exec"),
+            web.get(
+                f"{activity}/activity/{{aid}}/exec/{{bid}}",
+                self._get_exec_batch_results,
+                name="get_exec_batch_results",
+            ),
+            web.get(
+                f"{activity}/activity/{{aid}}/state",
+                self._get_activity_state,
+                name="get_activity_state",
+            ),
+            # payment
+            web.post(f"{payment}/allocations", self._create_allocation, name="create_allocation"),
+            web.get(f"{payment}/allocations", self._get_allocations, name="get_allocations"),
+            web.get(f"{payment}/allocations/{{aid}}", self._get_allocation, name="get_allocation"),
+            web.delete(
+                f"{payment}/allocations/{{aid}}",
+                self._release_allocation,
+                name="release_allocation",
+            ),
+            web.get(
+                f"{payment}/demandDecorations",
+                self._get_demand_decorations,
+                name="get_demand_decorations",
+            ),
+            web.get(
+                f"{payment}/requestorAccounts",
+                self._get_requestor_accounts,
+                name="get_requestor_accounts",
+            ),
+            web.get(
+                f"{payment}/invoiceEvents", self._get_invoice_events, name="get_invoice_events"
+            ),
+            web.get(f"{payment}/invoices/{{iid}}", self._get_invoice, name="get_invoice"),
+            web.post(
+                f"{payment}/invoices/{{iid}}/accept", self._accept_invoice, name="accept_invoice"
+            ),
+            web.get(
+                f"{payment}/debitNoteEvents",
+                self._get_debit_note_events,
+                name="get_debit_note_events",
+            ),
+            web.get(f"{payment}/debitNotes/{{did}}", self._get_debit_note, name="get_debit_note"),
+            web.post(
+                f"{payment}/debitNotes/{{did}}/accept",
+                self._accept_debit_note,
+                name="accept_debit_note",
+            ),
+            # net
+            web.post(f"{net}/net", self._create_network, name="create_network"),
+            web.delete(f"{net}/net/{{nid}}", self._remove_network, name="remove_network"),
+            web.post(f"{net}/net/{{nid}}/addresses", self._no_content, name="add_address"),
+            web.post(f"{net}/net/{{nid}}/nodes", self._no_content, name="add_node"),
+            web.delete(f"{net}/net/{{nid}}/nodes/{{node}}", self._no_content, name="remove_node"),
+        ]
+
+    @staticmethod
+    def _not_found(what: str) -> web.Response:
+        return web.json_response({"message": f"{what} not found"}, status=404)
+
+    async def _no_content(self, _request: web.Request) -> web.Response:
+        return web.Response(status=204)
+
+    async def _identity(self, _request: web.Request) -> web.Response:
+        return web.json_response({"identity": REQUESTOR_ID, "name": "fake-requestor"})
+
+    # Market
+
+    async def _subscribe_demand(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        demand = _Demand(self, body["properties"], body["constraints"])
+        self.demands[demand.id] = demand
+        return web.json_response(demand.id, status=201)
+
+    async def _unsubscribe_demand(self, request: web.Request) -> web.Response:
+        demand = self.demands.pop(request.match_info["sid"], None)
+        if not demand:
+            return self._not_found("Subscription")
+        demand.close()
+        return web.Response(status=204)
+
+    async def _collect_offers(self, request: web.Request) -> web.Response:
+        demand = self.demands.get(request.match_info["sid"])
+        if not demand:
+            return self._not_found("Subscription")
+        timeout = _float_param(request, "timeout", default=5.0)
+        max_events = int(_float_param(request, "maxEvents", default=10))
+        if not demand.events:
+            demand.new_events.clear()
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(demand.new_events.wait(), timeout)
+        events = []
+        while demand.events and len(events) < max_events:
+            events.append(demand.events.popleft())
+        return web.json_response(events)
+
+    async def _counter_proposal(self, request: web.Request) -> web.Response:
+        demand = self.demands.get(request.match_info["sid"])
+        offer = self.proposals.get(request.match_info["pid"])
+        if not demand or not offer:
+            return self._not_found("Proposal")
+        body = await request.json()
+        ours = _Proposal(
+            id=_new_id("proposal"),
+            demand_id=demand.id,
+            issuer_id=REQUESTOR_ID,
+            properties=body["properties"],
+            constraints=body["constraints"],
+            state="Draft",
+            prev_proposal_id=offer.id,
+        )
+        self.proposals[ours.id] = ours
+        draft = _Proposal(
+            id=_new_id("offer"),
+            demand_id=demand.id,
+            issuer_id=offer.issuer_id,
+            properties=offer.properties,
+            constraints="",
+            state="Draft",
+            prev_proposal_id=ours.id,
+        )
+        self.proposals[draft.id] = draft
+        demand.push(draft)
+        return web.json_response(ours.id, status=201)
+
+    async def _reject_proposal(self, request: web.Request) -> web.Response:
+        if not self.proposals.pop(request.match_info["pid"], None):
+            return self._not_found("Proposal")
+        return web.Response(status=204)
+
+    async def _create_agreement(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        draft = self.proposals.get(body["proposalId"])
+        if not draft or draft.state != "Draft" or not draft.prev_proposal_id:
+            return self._not_found("Proposal")
+        ours = self.proposals[draft.prev_proposal_id]
+        agreement = _Agreement(
+            id=_new_id("agreement"),
+            provider=self._providers_by_id[draft.issuer_id],
+            demand_properties=ours.properties,
+            offer_properties=draft.properties,
+            valid_to=body["validTo"],
+        )
+        self.agreements[agreement.id] = agreement
+        return web.json_response(agreement.id, status=201)
+
+    async def _get_agreement(self, request: web.Request) -> web.Response:
+        agreement = self.agreements.get(request.match_info["aid"])
+        if not agreement:
+            return self._not_found("Agreement")
+        return web.json_response(agreement.to_json())
+
+    async def _confirm_agreement(self, request: web.Request) -> web.Response:
+        agreement = self.agreements.get(request.match_info["aid"])
+        if not agreement:
+            return self._not_found("Agreement")
+        agreement.state = "Pending"
+        return web.Response(status=204)
+
+    async def _wait_for_approval(self, request: web.Request) -> web.Response:
+        agreement = self.agreements.get(request.match_info["aid"])
+        if not agreement:
+            return self._not_found("Agreement")
+        agreement.state = "Approved"
+        return web.json_response("Approved")
+
+    async def _terminate_agreement(self, request: web.Request) -> web.Response:
+        agreement = self.agreements.get(request.match_info["aid"])
+        if not agreement:
+            return self._not_found("Agreement")
+        await self._terminate(agreement)
+        return web.Response(status=204)
+
+    async def _terminate(self, agreement: _Agreement) -> None:
+        if agreement.state == "Terminated":
+            return
+        agreement.state = "Terminated"
+        if agreement.activities:
+            await self._issue_invoice(agreement)
+
+    # Activity
+
+    async def _create_activity(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        agreement_id = body if isinstance(body, str) else body["agreementId"]
+        agreement = self.agreements.get(agreement_id)
+        if not agreement or agreement.state != "Approved":
+            return self._not_found("Agreement")
+        activity = _Activity(id=_new_id("activity"), agreement=agreement)
+        agreement.activities += 1
+        if self.config.debit_note_interval:
+            activity.debit_notes_task = asyncio.get_event_loop().create_task(
+                self._send_debit_notes(activity)
+            )
+        self.activities[activity.id] = activity
+        return web.json_response(activity.id, status=201)
+
+    async def _destroy_activity(self, request: web.Request) -> web.Response:
+        activity = self.activities.get(request.match_info["aid"])
+        if not activity:
+            return self._not_found("Activity")
+        activity.state = "Terminated"
+        if activity.debit_notes_task:
+            activity.debit_notes_task.cancel()
+        if not self.config.multi_activity:
+            await self._terminate(activity.agreement)
+        return web.Response(status=204)
+
+    async def _call_exec(self, request: web.Request) -> web.Response:
+        activity = self.activities.get(request.match_info["aid"])
+        if not activity or activity.state == "Terminated":
+            return self._not_found("Activity")
+        body = await request.json()
+        batch = _Batch(
+            id=_new_id("batch"),
+            commands=json.loads(body["text"]),
+            started_at=asyncio.get_event_loop().time(),
+        )
+        activity.batches[batch.id] = batch
+        return web.json_response(batch.id)
+
+    async def _get_exec_batch_results(self, request: web.Request) -> web.StreamResponse:
+        activity = self.activities.get(request.match_info["aid"])
+        batch = activity.batches.get(request.match_info["bid"]) if activity else None
+        if not activity or not batch:
+            return self._not_found("Batch")
+        if request.headers.get("Accept") == "text/event-stream":
+            return await self._stream_exec_batch_results(request, batch)
+
+        loop = asyncio.get_event_loop()
+        timeout = _float_param(request, "timeout", default=0.0)
+        # Long-poll until the command with `commandIndex`, by default the first one, is finished
+        wait_for = int(_float_param(request, "commandIndex", default=0.0)) + 1
+        duration = self.config.command_duration
+        if duration and len(batch.results(loop.time(), duration)) < wait_for:
+            finish_at = batch.started_at + min(wait_for, len(batch.commands)) * duration
+            await asyncio.sleep(max(0.0, min(timeout, finish_at - loop.time())))
+        return web.json_response(batch.results(loop.time(), duration))
+
+    async def _stream_exec_batch_results(
+        self, request: web.Request, batch: _Batch
+    ) -> web.StreamResponse:
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(idx: int, kind: Dict[str, Any]) -> None:
+            data = json.dumps({"batchId": batch.id, "index": idx, "timestamp": _ts(), "kind": kind})
+            await response.write(f"event: runtime\ndata: {data}\n\n".encode())
+
+        loop = asyncio.get_event_loop()
+        for idx, command in enumerate(batch.commands):
+            await send(idx, {"started": {"command": command}})
+            finish_at = batch.started_at + (idx + 1) * self.config.command_duration
+            if finish_at > loop.time():
+                await asyncio.sleep(finish_at - loop.time())
+            await send(idx, {"finished": {"return_code": 0, "message": None}})
+        await response.write_eof()
+        return response
+
+    async def _get_activity_state(self, request: web.Request) -> web.Response:
+        activity = self.activities.get(request.match_info["aid"])
+        if not activity:
+            return self._not_found("Activity")
+        return web.json_response({"state": [activity.state, None]})
+
+    # Payment
+
+    async def _create_allocation(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        allocation_id = _new_id("allocation")
+        body.update(
+            allocationId=allocation_id,
+            spentAmount="0",
+            remainingAmount=body["totalAmount"],
+        )
+        self.allocations[allocation_id] = body
+        return web.json_response(body, status=201)
+
+    async def _get_allocations(self, _request: web.Request) -> web.Response:
+        return web.json_response(list(self.allocations.values()))
+
+    async def _get_allocation(self, request: web.Request) -> web.Response:
+        allocation = self.allocations.get(request.match_info["aid"])
+        if not allocation:
+            return self._not_found("Allocation")
+        return web.json_response(allocation)
+
+    async def _release_allocation(self, request: web.Request) -> web.Response:
+        if not self.allocations.pop(request.match_info["aid"], None):
+            return self._not_found("Allocation")
+        return web.Response(status=204)
+
+    async def _get_demand_decorations(self, request: web.Request) -> web.Response:
+        ids = request.query.getall("allocationIds", [])
+        ids = [i for id_list in ids for i in id_list.split(",")]
+        platforms = {
+            self.allocations[i]["paymentPlatform"]: self.allocations[i]["address"]
+            for i in ids
+            if i in self.allocations
+        }
+        return web.json_response(
+            {
+                "properties": [
+                    {"key": f"golem.com.payment.platform.{platform}.address", "value": address}
+                    for platform, address in platforms.items()
+                ],
+                "constraints": [
+                    f"(golem.com.payment.platform.{platform}.address=*)" for platform in platforms
+                ],
+            }
+        )
+
+    async def _get_requestor_accounts(self, _request: web.Request) -> web.Response:
+        accounts = []
+        for platform in self.config.payment_platforms:
+            driver, network, token = platform.split("-", 2)
+            accounts.append(
+                {
+                    "platform": platform,
+                    "address": REQUESTOR_ID,
+                    "driver": driver,
+                    "network": network,
+                    "token": token,
+                    "send": True,
+                    "receive": False,
+                }
+            )
+        return web.json_response(accounts)
+
+    def _payment_doc(self, agreement: _Agreement) -> Dict[str, Any]:
+        platform = agreement.demand_properties.get(
+            "golem.com.payment.chosen-platform", self.config.payment_platforms[0]
+        )
+        return {
+            "issuerId": agreement.provider.id,
+            "recipientId": REQUESTOR_ID,
+            "payeeAddr": agreement.provider.id,
+            "payerAddr": REQUESTOR_ID,
+            "paymentPlatform": platform,
+            "timestamp": _ts(),
+            "agreementId": agreement.id,
+            "status": "RECEIVED",
+        }
+
+    async def _issue_invoice(self, agreement: _Agreement) -> None:
+        invoice_id = _new_id("invoice")
+        invoice = self._payment_doc(agreement)
+        invoice.update(
+            invoiceId=invoice_id,
+            activityIds=[],
+            amount=str(self.config.invoice_amount),
+            paymentDueDate=_ts(),
+        )
+        self.invoices[invoice_id] = invoice
+        await self._invoice_events.add(
+            {"eventType": "InvoiceReceivedEvent", "invoiceId": invoice_id}
+        )
+
+    async def _send_debit_notes(self, activity: _Activity) -> None:
+        assert self.config.debit_note_interval
+        total = Decimal(0)
+        while True:
+            await asyncio.sleep(self.config.debit_note_interval)
+            total += self.config.invoice_amount
+            debit_note_id = _new_id("debit-note")
+            debit_note = self._payment_doc(activity.agreement)
+            debit_note.update(
+                debitNoteId=debit_note_id,
+                activityId=activity.id,
+                totalAmountDue=str(total),
+            )
+            self.debit_notes[debit_note_id] = debit_note
+            await self._debit_note_events.add(
+                {"eventType": "DebitNoteReceivedEvent", "debitNoteId": debit_note_id}
+            )
+
+    async def _get_events(self, request: web.Request, log: _EventLog) -> web.Response:
+        events = await log.get(
+            _datetime_param(request, "afterTimestamp"),
+            _float_param(request, "pollTimeout", "timeout", default=0.0),
+            int(_float_param(request, "maxEvents", default=sys.maxsize)),
+        )
+        return web.json_response(events)
+
+    async def _get_invoice_events(self, request: web.Request) -> web.Response:
+        return await self._get_events(request, self._invoice_events)
+
+    async def _get_debit_note_events(self, request: web.Request) -> web.Response:
+        return await self._get_events(request, self._debit_note_events)
+
+    async def _get_invoice(self, request: web.Request) -> web.Response:
+        invoice = self.invoices.get(request.match_info["iid"])
+        if not invoice:
+            return self._not_found("Invoice")
+        return web.json_response(invoice)
+
+    async def _accept_invoice(self, request: web.Request) -> web.Response:
+        invoice = self.invoices.get(request.match_info["iid"])
+        if not invoice:
+            return self._not_found("Invoice")
+        invoice["status"] = "ACCEPTED"
+        return web.Response(status=204)
+
+    async def _get_debit_note(self, request: web.Request) -> web.Response:
+        debit_note = self.debit_notes.get(request.match_info["did"])
+        if not debit_note:
+            return self._not_found("Debit note")
+        return web.json_response(debit_note)
+
+    async def _accept_debit_note(self, request: web.Request) -> web.Response:
+        debit_note = self.debit_notes.get(request.match_info["did"])
+        if not debit_note:
+            return self._not_found("Debit note")
+        debit_note["status"] = "ACCEPTED"
+        return web.Response(status=204)
+
+    # Net
+
+    async def _create_network(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        body["id"] = _new_id("net")
+        self.networks[body["id"]] = body
+        return web.json_response(body, status=201)
+
+    async def _remove_network(self, request: web.Request) -> web.Response:
+        if not self.networks.pop(request.match_info["nid"], None):
+            return self._not_found("Network")
+        return web.Response(status=204)
+
+    # Stats
+
+    @property
+    def invoices_accepted(self) -> int:
+        return sum(1 for invoice in self.invoices.values() if invoice["status"] == "ACCEPTED")
+
+    @property
+    def debit_notes_accepted(self) -> int:
+        return sum(1 for dn in self.debit_notes.values() if dn["status"] == "ACCEPTED")
+
+
+@contextlib.contextmanager
+def fake_gftp_on_path() -> Iterator[Path]:
+    """Put a `gftp` executable running `tests.benchmarks.fake_gftp` first on the `PATH`."""
+
+    project_root = Path(__file__).resolve().parents[2]
+    with tempfile.TemporaryDirectory(prefix="fake-gftp-") as bin_dir:
+        script = Path(bin_dir) / "gftp"
+        script.write_text(
+            "#!/bin/sh\n"
+            f'PYTHONPATH="{project_root}" '
+            f'exec "{sys.executable}" -m tests.benchmarks.fake_gftp "$@"\n'
+        )
+        script.chmod(script.stat().st_mode | stat.S_IEXEC)
+        old_path = os.environ.get("PATH", "")
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{old_path}"
+        try:
+            yield script
+        finally:
+            os.environ["PATH"] = old_path
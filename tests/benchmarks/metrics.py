@@ -0,0 +1,108 @@
+"""Measurement helpers shared by the benchmark scripts."""
+import asyncio
+import resource
+import sys
+import time
+from typing import Dict, List, Optional, Sequence, Union
+
+Number = Union[int, float]
+
+
+def peak_rss_mib() -> float:
+    """Return the peak resident set size of the current process, in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # `ru_maxrss` is in bytes on macOS and in kilobytes elsewhere
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def percentile(values: Sequence[Number], pct: float) -> float:
+    """Return the `pct`-th percentile of `values` (nearest-rank method)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return float(ordered[rank])
+
+
+def summarize(values: Sequence[Number]) -> Dict[str, float]:
+    """Return count, mean and tail percentiles of `values`."""
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else 0.0,
+        "p50": percentile(values, 50),
+        "p99": percentile(values, 99),
+        "max": float(max(values)) if values else 0.0,
+    }
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up a task sleeping for `interval` seconds.
+
+    The lag is a good proxy of the time spent in blocking, synchronous code between
+    two `await` points.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self._interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self._sleep_started: Optional[float] = None
+        self.samples: List[float] = []
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            self._sleep_started = loop.time()
+            await asyncio.sleep(self._interval)
+            self.samples.append(max(0.0, loop.time() - self._sleep_started - self._interval))
+
+    def start(self) -> None:
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            # Include the lag of the last sleep, e.g. if a block that never yields has just ended
+            if self._sleep_started is not None:
+                lag = asyncio.get_event_loop().time() - self._sleep_started - self._interval
+                if lag > 0:
+                    self.samples.append(lag)
+                self._sleep_started = None
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def __aenter__(self) -> "LoopLagMonitor":
+        self.start()
+        # Let the task start sleeping, or the lag of a block that never yields is not measured
+        await asyncio.sleep(0)
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+
+class Stopwatch:
+    """Context manager measuring the wall-clock time of the enclosed block."""
+
+    def __init__(self):
+        self.start: float = 0.0
+        self.elapsed: float = 0.0
+
+    def __enter__(self) -> "Stopwatch":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.elapsed = time.perf_counter() - self.start
+
+
+def report(title: str, results: Dict[str, object]) -> None:
+    """Print benchmark `results` as an aligned table."""
+    print(f"\n== {title}")
+    width = max((len(key) for key in results), default=0)
+    for key, value in results.items():
+        if isinstance(value, float):
+            value = f"{value:.4f}"
+        print(f"  {key:<{width}}  {value}")
@@ -0,0 +1,63 @@
+"""Smoke tests running yapapi against `FakeYagna`."""
+from datetime import timedelta
+
+import pytest
+
+from tests.benchmarks.bench_engine import BenchPayload, EventCounter
+from tests.benchmarks.fake_yagna import FakeYagna, FakeYagnaConfig, fake_gftp_on_path
+from yapapi import Golem, Task, events
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("max_workers", [1, 2])
+async def test_execute_tasks(max_workers: int):
+    async def worker(ctx, tasks):
+        async for task in tasks:
+            script = ctx.new_script()
+            future_result = script.run("/bin/echo", str(task.data))
+            yield script
+            task.accept_result(result=(await future_result).success)
+
+    counter = EventCounter()
+    jobs = set()
+
+    def event_consumer(event: events.Event) -> None:
+        counter(event)
+        if isinstance(event, events.JobEvent):
+            jobs.add(event.job)
+
+    with fake_gftp_on_path():
+        async with FakeYagna(FakeYagnaConfig(providers=3, seed=0)) as yagna:
+            async with Golem(
+                budget=10.0, api_config=yagna.api_config, event_consumer=event_consumer
+            ) as golem:
+                results = {
+                    task.data: task.result
+                    async for task in golem.execute_tasks(
+                        worker,
+                        [Task(data=n) for n in range(5)],
+                        payload=BenchPayload(),
+                        max_workers=max_workers,
+                        timeout=timedelta(minutes=1),
+                    )
+                }
+
+    assert results == {n: True for n in range(5)}
+    assert counter.counts["AgreementConfirmed"] >= 1
+    assert yagna.invoices_accepted == counter.counts["AgreementConfirmed"]
+
+    [job] = jobs
+    assert job.worker_stats.started >= counter.counts["WorkerStarted"] >= 1
+    if counter.peak_workers == max_workers:
+        assert job.worker_stats.time_to_full_capacity is not None
+
+
+@pytest.mark.asyncio
+async def test_failure_injection():
+    config = FakeYagnaConfig(providers=1, failures={"identity": 1.0})
+    async with FakeYagna(config) as yagna:
+        with pytest.raises(Exception):
+            async with Golem(budget=10.0, api_config=yagna.api_config):
+                pass
+
+    assert yagna.failures_injected["identity"] == 1
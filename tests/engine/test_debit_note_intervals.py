@@ -1,12 +1,15 @@
+import datetime
 import functools
 import re
-from datetime import datetime, timedelta
+import time
+from typing import Optional
 from unittest import mock
 
 import pytest
 
 from tests.factories.rest.market import AgreementFactory
 from tests.factories.rest.payment import DebitNoteFactory
+from yapapi.debit_note_rate import DebitNoteWindow
 from yapapi.engine import _Engine
 from yapapi.rest.market import Agreement
 from yapapi.rest.payment import DebitNote
@@ -14,7 +17,11 @@ from yapapi.strategy import PROP_DEBIT_NOTE_INTERVAL_SEC, PROP_PAYMENT_TIMEOUT_S
 
 
 def mock_engine(
-    agreement: Agreement, debit_note: DebitNote, num_debit_notes=0, num_payable_debit_notes=0
+    agreement: Agreement,
+    debit_note: DebitNote,
+    started_ago: Optional[float] = None,
+    num_debit_notes=0,
+    num_payable_debit_notes=0,
 ) -> _Engine:
     engine = _Engine(
         budget=0.0,
@@ -24,8 +31,15 @@ def mock_engine(
     )
 
     engine._all_agreements[agreement.id] = agreement  # noqa
-    engine._num_debit_notes[debit_note.activity_id] = num_debit_notes  # noqa
-    engine._num_payable_debit_notes[debit_note.activity_id] = num_payable_debit_notes  # noqa
+    if started_ago is not None:
+        rates = engine.debit_note_rates
+        rates.activity_started(
+            debit_note.activity_id, agreement.id, started_at=time.time() - started_ago
+        )
+        for _ in range(num_debit_notes):
+            rates.debit_note_received(debit_note.activity_id, payable=False)
+        for _ in range(num_payable_debit_notes):
+            rates.debit_note_received(debit_note.activity_id, payable=True)
 
     return engine
 
@@ -153,37 +167,40 @@ def test_verify_debit_note_intervals(
 ):
     agreement = AgreementFactory(**agreement_kwargs)
     debit_note = DebitNoteFactory(_base__agreement_id=agreement.id, **debit_note_kwargs)
-    engine = mock_engine(agreement, debit_note, num_debit_notes, num_payable_debit_notes)
+    engine = mock_engine(agreement, debit_note)
 
-    engine._num_debit_notes[debit_note.activity_id] += 1  # noqa
-    if debit_note.payment_due_date:
-        engine._num_payable_debit_notes[debit_note.activity_id] += 1  # noqa
+    window = DebitNoteWindow(num_debit_notes + 1, duration)
+    payable_window = (
+        DebitNoteWindow(num_payable_debit_notes + 1, duration)
+        if debit_note.payment_due_date
+        else None
+    )
 
-    assert vdni_condition(engine._verify_debit_note_interval(agreement, debit_note, duration))
-    assert vpt_condition(engine._verify_payment_timeout(agreement, debit_note, duration))
+    assert vdni_condition(engine._verify_debit_note_interval(agreement, debit_note, window))
+    assert vpt_condition(engine._verify_payment_timeout(agreement, debit_note, payable_window))
 
 
 @pytest.mark.asyncio
 @pytest.mark.parametrize(
-    "agreement_kwargs, debit_note_kwargs, created_at_cb, "
+    "agreement_kwargs, debit_note_kwargs, started_ago, "
     "num_debit_notes, num_payable_debit_notes, "
     "debit_note_accepted, agreement_terminated",
     [
         # no negotiated debit note intervals, we just accept any non-payable debit notes
-        ({}, {}, datetime.now, 0, 0, True, False),
+        ({}, {}, 0, 0, 0, True, False),
         # the agreement has been terminated, drop the debit note but don't terminate the agreement
-        ({"terminated": True}, {}, datetime.now, 0, 0, False, False),
+        ({"terminated": True}, {}, 0, 0, 0, False, False),
         # we cannot determine when the activity started:
         # don't terminate the agreement but also drop the debit note
-        ({}, {}, lambda: None, 0, 0, False, False),
+        ({}, {}, None, 0, 0, False, False),
         # payable debit note received even though mid-agrement payment have not been negotiated
-        ({}, {"_base__payment_due_date": True}, datetime.now, 0, 0, False, True),
+        ({}, {"_base__payment_due_date": True}, 0, 0, 0, False, True),
         # more than one debit note received before the agreed-upon interval elapsed,
         # we only allow one
         (
             {"details___ref__demand__properties": {PROP_DEBIT_NOTE_INTERVAL_SEC: 100}},
             {},
-            datetime.now,
+            0,
             1,
             0,
             False,
@@ -193,7 +210,7 @@ def test_verify_debit_note_intervals(
         (
             {"details___ref__demand__properties": {PROP_DEBIT_NOTE_INTERVAL_SEC: 100}},
             {},
-            lambda: datetime.now() - timedelta(seconds=100),
+            100,
             0,
             0,
             True,
@@ -203,7 +220,7 @@ def test_verify_debit_note_intervals(
         (
             {"details___ref__demand__properties": {PROP_DEBIT_NOTE_INTERVAL_SEC: 100}},
             {},
-            lambda: datetime.now() - timedelta(seconds=300),
+            300,
             3,
             0,
             True,
@@ -213,7 +230,7 @@ def test_verify_debit_note_intervals(
         (
             {"details___ref__demand__properties": {PROP_DEBIT_NOTE_INTERVAL_SEC: 100}},
             {},
-            lambda: datetime.now() - timedelta(seconds=300),
+            300,
             4,
             0,
             False,
@@ -223,7 +240,7 @@ def test_verify_debit_note_intervals(
         (
             {"details___ref__demand__properties": {PROP_PAYMENT_TIMEOUT_SEC: 100}},
             {"_base__payment_due_date": True},
-            datetime.now,
+            0,
             0,
             1,
             False,
@@ -233,7 +250,7 @@ def test_verify_debit_note_intervals(
         (
             {"details___ref__demand__properties": {PROP_PAYMENT_TIMEOUT_SEC: 100}},
             {"_base__payment_due_date": True},
-            lambda: datetime.now() - timedelta(seconds=100),
+            100,
             0,
             0,
             True,
@@ -243,7 +260,7 @@ def test_verify_debit_note_intervals(
         (
             {"details___ref__demand__properties": {PROP_PAYMENT_TIMEOUT_SEC: 100}},
             {"_base__payment_due_date": True},
-            lambda: datetime.now() - timedelta(seconds=300),
+            300,
             0,
             3,
             True,
@@ -253,7 +270,7 @@ def test_verify_debit_note_intervals(
         (
             {"details___ref__demand__properties": {PROP_PAYMENT_TIMEOUT_SEC: 100}},
             {"_base__payment_due_date": True},
-            lambda: datetime.now() - timedelta(seconds=300),
+            300,
             0,
             4,
             False,
@@ -264,7 +281,7 @@ def test_verify_debit_note_intervals(
 async def test_enforce_debit_note_intervals(
     agreement_kwargs,
     debit_note_kwargs,
-    created_at_cb,
+    started_ago,
     num_debit_notes,
     num_payable_debit_notes,
     debit_note_accepted,
@@ -273,8 +290,37 @@ async def test_enforce_debit_note_intervals(
     job = mock.AsyncMock()
     agreement = AgreementFactory(**agreement_kwargs)
     debit_note = DebitNoteFactory(_base__agreement_id=agreement.id, **debit_note_kwargs)
-    engine = mock_engine(agreement, debit_note, num_debit_notes, num_payable_debit_notes)
-    engine._activity_created_at[debit_note.activity_id] = created_at_cb()
+    engine = mock_engine(
+        agreement, debit_note, started_ago, num_debit_notes, num_payable_debit_notes
+    )
 
     assert await engine._enforce_debit_note_intervals(job, debit_note) == debit_note_accepted
     assert job.agreements_pool._terminate_agreement.called == agreement_terminated
+
+
+@pytest.mark.asyncio
+async def test_enforce_debit_note_intervals_burst_of_timely_notes():
+    """Check that timely debit notes received in a single burst don't terminate the agreement."""
+
+    job = mock.AsyncMock()
+    agreement = AgreementFactory(
+        details___ref__demand__properties={PROP_DEBIT_NOTE_INTERVAL_SEC: 60}
+    )
+    started_at = datetime.datetime.now() - datetime.timedelta(seconds=1200)
+    debit_notes = [
+        DebitNoteFactory(
+            _base__agreement_id=agreement.id,
+            _base__activity_id="activity",
+            _base__timestamp=started_at + datetime.timedelta(seconds=60 * n),
+        )
+        for n in range(1, 21)
+    ]
+    engine = mock_engine(agreement, debit_notes[0])
+    engine.debit_note_rates.activity_started(
+        "activity", agreement.id, started_at=started_at.timestamp()
+    )
+
+    # All delayed until the last one has been issued
+    for debit_note in debit_notes:
+        assert await engine._enforce_debit_note_intervals(job, debit_note)
+    job.agreements_pool._terminate_agreement.assert_not_called()
@@ -1,9 +1,15 @@
 """Unit tests for `yapapi.engine` module."""
-from unittest.mock import Mock
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+from unittest.mock import AsyncMock, Mock
 
 import pytest
 
 import yapapi.engine
+import yapapi.events
 import yapapi.rest
 from tests.factories.golem import GolemFactory
 from yapapi.engine import Job
@@ -75,3 +81,321 @@ def test_job_id(monkeypatch):
     with pytest.raises(ValueError):
         duplicate_id = used_ids[0]
         Job(engine=Mock(), expiration_time=Mock(), payload=Mock(), id=duplicate_id)
+
+
+@pytest.mark.asyncio
+async def test_handle_all_proposals():
+    """Check that low-score proposals are rejected without waiting for the responses."""
+
+    scores = {"good-1": 1.0, "good-2": 1.0, "good-3": 1.0, "bad-1": -1.0, "bad-2": -1.0}
+    engine = Mock(
+        proposal_concurrency=2,
+        score_offer=AsyncMock(side_effect=lambda proposal: scores[proposal.id]),
+        emit=lambda event_class, **kwargs: event_class(**kwargs),
+    )
+    job = Job(engine=engine, expiration_time=Mock(), payload=Mock())
+
+    confirmations = asyncio.Event()
+    pending = 0
+    max_pending = 0
+
+    async def add_proposal(_score, _proposal):
+        nonlocal pending, max_pending
+        pending += 1
+        max_pending = max(max_pending, pending)
+        await confirmations.wait()
+        pending -= 1
+
+    job.agreements_pool.add_proposal = add_proposal
+
+    proposals = [Mock(id=id, is_draft=True, reject=AsyncMock()) for id in scores]
+    for proposal in proposals:
+        job.unscored_offers.put_nowait((proposal, time.monotonic()))
+
+    handler = asyncio.create_task(job._handle_all_proposals())
+    await asyncio.sleep(0.01)
+
+    # Both low-score proposals are rejected while the responses are still pending
+    for proposal in proposals:
+        assert proposal.reject.called == (scores[proposal.id] < 0)
+    assert job.proposal_stats.rejected_early == 2
+    assert max_pending == 2
+    assert job.proposal_queue_depth == 1
+
+    confirmations.set()
+    await asyncio.sleep(0.01)
+    assert job.proposals_confirmed == 3
+    assert job.proposal_stats.handled == 5
+    assert job.proposal_queue_depth == 0
+
+    handler.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await handler
+
+
+@pytest.mark.asyncio
+async def test_proposals_scored_concurrently():
+    """Check that up to `proposal_concurrency` proposals are scored at the same time."""
+
+    scoring = 0
+    max_scoring = 0
+    scored = asyncio.Event()
+
+    async def score_offer(_proposal):
+        nonlocal scoring, max_scoring
+        scoring += 1
+        max_scoring = max(max_scoring, scoring)
+        await scored.wait()
+        scoring -= 1
+        return -1.0
+
+    engine = Mock(
+        proposal_concurrency=3,
+        score_offer=score_offer,
+        emit=lambda event_class, **kwargs: event_class(**kwargs),
+    )
+    job = Job(engine=engine, expiration_time=Mock(), payload=Mock())
+    for n in range(5):
+        job.unscored_offers.put_nowait((Mock(id=str(n), reject=AsyncMock()), time.monotonic()))
+
+    handler = asyncio.create_task(job._handle_all_proposals())
+    await asyncio.sleep(0.01)
+    assert max_scoring == 3
+    assert job.unscored_offers.qsize() == 2
+
+    scored.set()
+    await asyncio.sleep(0.01)
+    assert max_scoring == 3
+    assert job.proposal_stats.rejected_early == 5
+
+    handler.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await handler
+
+
+@pytest.mark.asyncio
+async def test_recycled_offers_handled_by_workers():
+    """Check that recycled offers are responded to by the bounded pool of proposal workers."""
+
+    engine = Mock(
+        proposal_concurrency=2,
+        score_offer=AsyncMock(return_value=1.0),
+        emit=lambda event_class, **kwargs: event_class(**kwargs),
+    )
+    job = Job(engine=engine, expiration_time=Mock(), payload=Mock())
+    engine._jobs = [job]
+
+    handled = asyncio.Event()
+    handling = 0
+    max_handling = 0
+    ignored_drafts = {}
+
+    async def handle_proposal(proposal, ignore_draft=False, score=None):
+        nonlocal handling, max_handling
+        handling += 1
+        max_handling = max(max_handling, handling)
+        await handled.wait()
+        handling -= 1
+        ignored_drafts[proposal.id] = ignore_draft
+        return Mock(spec=yapapi.events.ProposalResponded)
+
+    job._handle_proposal = handle_proposal
+    for n in range(5):
+        yapapi.engine._Engine.recycle_offer(engine, Mock(id=f"recycled-{n}", is_draft=True))
+    job.unscored_offers.put_nowait((Mock(id="new", is_draft=True), time.monotonic()))
+
+    handler = asyncio.create_task(job._handle_all_proposals())
+    await asyncio.sleep(0.01)
+    assert max_handling == 2
+    handled.set()
+    await asyncio.sleep(0.01)
+
+    # The recycled drafts are responded to, the new one goes to the agreements pool
+    assert ignored_drafts == {**{f"recycled-{n}": True for n in range(5)}, "new": False}
+    assert max_handling == 2
+    assert not job._recycled_proposal_ids
+
+    handler.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await handler
+
+
+@pytest.mark.asyncio
+async def test_debit_note_routing():
+    """Check that the agreements accepting debit notes are indexed by the agreement id."""
+
+    engine = GolemFactory()._engine
+    engine._market_api = Mock()
+    engine.emit = Mock()
+    job = Job(engine=engine, expiration_time=Mock(), payload=Mock())
+    engine.add_job(job)
+    assert engine._get_job_by_id(job.id) is job
+    with pytest.raises(KeyError):
+        engine._get_job_by_id("unknown-job")
+
+    engine.accept_debit_notes_for_agreement(job.id, "agreement-1")
+    assert engine._agreements_accepting_debit_notes == {"agreement-1": job}
+
+
+@pytest.mark.asyncio
+async def test_process_debit_notes_parallelism(caplog):
+    """Check that debit notes are processed concurrently, by at most `payment_parallelism`."""
+
+    engine = GolemFactory(payment_parallelism=3)._engine
+    debit_note_ids = [f"debit-note-{n}" for n in range(10)]
+
+    async def incoming_debit_note_ids(cursor):
+        for debit_note_id in debit_note_ids:
+            cursor.received(debit_note_id, datetime.now(timezone.utc))
+            yield debit_note_id
+
+    engine._payment_api = Mock(incoming_debit_note_ids=incoming_debit_note_ids)
+
+    processing = 0
+    max_processing = 0
+    processed = []
+
+    async def process_debit_note(debit_note_id):
+        nonlocal processing, max_processing
+        processing += 1
+        max_processing = max(max_processing, processing)
+        await asyncio.sleep(0.01)
+        processing -= 1
+        processed.append(debit_note_id)
+        if debit_note_id == "debit-note-0":
+            raise ValueError("Processing failures don't stop the other debit notes")
+
+    engine._process_debit_note = process_debit_note
+    await asyncio.wait_for(engine._process_debit_notes(), timeout=1)
+
+    assert sorted(processed) == sorted(debit_note_ids)
+    assert max_processing == 3
+    assert engine.payment_stats.debit_note_queue.count == 10
+    # The failed debit note isn't marked as processed, so it's retried after a restart
+    assert engine._payment_cursors.debit_notes.pending == 1
+    assert engine._payment_cursors.debit_notes.position is None
+
+    [failure] = [record for record in caplog.records if record.levelno >= logging.WARNING]
+    assert failure.levelno == logging.ERROR
+    assert failure.getMessage() == "Failed to process debit note debit-note-0"
+    assert failure.exc_info[0] is ValueError
+
+
+@pytest.mark.asyncio
+async def test_payment_cursors_save_failure(tmp_path, caplog):
+    """Check that a failure to save the payment event cursors is logged and retried."""
+
+    cursor_path = tmp_path / "missing-dir" / "payment-cursor.json"
+    engine = GolemFactory(payment_cursor_path=cursor_path)._engine
+    engine._payment_cursors.save_interval = 0.01
+    engine._payment_cursors.unpaid_agreements.add("agreement")
+    saver = asyncio.create_task(engine._save_payment_cursors())
+
+    await asyncio.sleep(0.05)
+    assert not saver.done()
+    assert "Failed to save the payment event cursors" in caplog.text
+
+    cursor_path.parent.mkdir()
+    await asyncio.sleep(0.05)
+    assert cursor_path.exists()
+    saver.cancel()
+
+
+@pytest.mark.asyncio
+async def test_unpaid_agreement_paid_after_restart(tmp_path):
+    """Check that an agreement left unpaid is paid by an engine restarted with the cursor file."""
+
+    cursor_path = tmp_path / "payment-cursor.json"
+    engine = GolemFactory(payment_cursor_path=cursor_path)._engine
+    job = Mock(id="job")
+    engine._invoice_manager.add_agreement(job, Mock(id="agreement"))
+    # The engine stops before the invoice for the finished agreement is received
+    await engine.accept_payments_for_agreement(job.id, "agreement")
+    engine._payment_cursors.save(force=True)
+
+    restarted = GolemFactory(payment_cursor_path=cursor_path)._engine
+    allocation = Mock(payment_platform="platform", payment_address="address", amount=10)
+    restarted._allocations.add(allocation)
+    invoices = [
+        Mock(
+            invoice_id=f"invoice-{agreement_id}",
+            agreement_id=agreement_id,
+            amount="1.5",
+            payment_platform="platform",
+            payer_addr="address",
+            status="RECEIVED",
+            accept=AsyncMock(),
+        )
+        for agreement_id in ["other-agreement", "agreement"]
+    ]
+
+    async def incoming_invoices(_parallelism, cursor):
+        for invoice in invoices:
+            cursor.received(invoice.invoice_id, datetime.now(timezone.utc))
+            yield invoice
+
+    restarted._payment_api = Mock(incoming_invoices=incoming_invoices)
+    await asyncio.wait_for(restarted._process_invoices(), timeout=1)
+
+    # Only the invoice of the agreement left unpaid is accepted
+    invoices[0].accept.assert_not_awaited()
+    invoices[1].accept.assert_awaited_once_with(amount=Decimal("1.5"), allocation=allocation)
+    assert not restarted._payment_cursors.unpaid_agreements
+    restarted._payment_cursors.save(force=True)
+    assert not GolemFactory(payment_cursor_path=cursor_path)._engine._resumed_agreements
+
+
+@pytest.mark.asyncio
+async def test_fast_stop():
+    """Check that a shutdown deadline terminates the agreements of the unfinished jobs."""
+
+    engine = GolemFactory(shutdown_timeout=0.4)._engine
+    engine._market_api = Mock()
+    engine.emit = Mock()
+    finished_job = Job(engine=engine, expiration_time=Mock(), payload=Mock())
+    finished_job.finished.set()
+    unfinished_job = Job(engine=engine, expiration_time=Mock(), payload=Mock())
+    for job in (finished_job, unfinished_job):
+        job.agreements_pool.terminate_all = AsyncMock()
+        engine.add_job(job)
+
+    agreement = Mock(id="agreement-1")
+    engine._invoice_manager.add_agreement(unfinished_job, agreement)
+    engine._invoice_manager.set_payable(agreement.id)
+    engine._process_invoices_job = asyncio.get_event_loop().create_task(asyncio.sleep(10))
+    engine._services = {engine._process_invoices_job}
+
+    started_at = time.monotonic()
+    await engine._shutdown(None, None, None)
+
+    assert time.monotonic() - started_at < 1
+    finished_job.agreements_pool.terminate_all.assert_not_awaited()
+    unfinished_job.agreements_pool.terminate_all.assert_awaited_once()
+    assert engine._process_invoices_job.cancelled()
+
+    stats = engine.shutdown_stats
+    assert stats.deadline_exceeded
+    assert set(stats.phases) == {"jobs", "agreements", "payments", "services"}
+    # A half of the deadline is reserved for terminating the agreements
+    assert stats.phases["jobs"] == pytest.approx(0.2, abs=0.1)
+    assert stats.total == pytest.approx(0.4, abs=0.1)
+
+
+@pytest.mark.asyncio
+async def test_shutdown_without_deadline():
+    """Check that without a deadline, the shutdown waits for the jobs to finish."""
+
+    engine = GolemFactory()._engine
+    engine._market_api = Mock()
+    engine.emit = Mock()
+    job = Job(engine=engine, expiration_time=Mock(), payload=Mock())
+    job.agreements_pool.terminate_all = AsyncMock()
+    engine.add_job(job)
+    asyncio.get_event_loop().call_later(0.1, job.finished.set)
+
+    await engine._shutdown(None, None, None)
+    job.agreements_pool.terminate_all.assert_not_awaited()
+    stats = engine.shutdown_stats
+    assert not stats.deadline_exceeded
+    assert list(stats.phases) == ["jobs", "services"]
+    assert stats.phases["jobs"] >= 0.1
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Microbenchmark of `SmartQueue` under a large number of consumers and retried items.
+
+Usage::
+
+    python -m tests.executor.bench_smartq --items 20000 --consumers 200 --retry 0.5
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from tests.benchmarks.metrics import LoopLagMonitor, Stopwatch, peak_rss_mib, report, summarize
+from yapapi.executor._smartq import SmartQueue
+
+
+async def _items(count: int):
+    for n in range(count):
+        yield n
+
+
+async def bench(args: argparse.Namespace) -> None:
+    rng = random.Random(args.seed)
+    q: SmartQueue[int] = SmartQueue(_items(args.items), prefetch=args.prefetch)
+    get_latencies = []
+    counts = {"done": 0, "rescheduled": 0}
+
+    async def worker():
+        with q.new_consumer() as consumer:
+            requested = time.perf_counter()
+            async for handle in consumer:
+                get_latencies.append(time.perf_counter() - requested)
+                # Yield to the other workers, as real workers do while running the batches
+                await asyncio.sleep(0)
+                if rng.random() < args.retry:
+                    counts["rescheduled"] += 1
+                    await q.reschedule(handle)
+                else:
+                    counts["done"] += 1
+                    await q.mark_done(handle)
+                requested = time.perf_counter()
+
+    async with LoopLagMonitor() as lag:
+        with Stopwatch() as total:
+            workers = [asyncio.create_task(worker()) for _ in range(args.consumers)]
+            await q.wait_until_done()
+            await asyncio.gather(*workers)
+        await q.close()
+
+    get_stats = summarize(get_latencies)
+    lag_stats = summarize(lag.samples)
+    operations = len(get_latencies) + counts["done"] + counts["rescheduled"]
+    report(
+        f"SmartQueue: {args.items} items, {args.consumers} consumers, retry={args.retry}, "
+        f"prefetch={args.prefetch}",
+        {
+            "elapsed [s]": total.elapsed,
+            "items done": counts["done"],
+            "reschedules": counts["rescheduled"],
+            "queue operations/sec": operations / total.elapsed,
+            "get mean [ms]": get_stats["mean"] * 1000,
+            "get p99 [ms]": get_stats["p99"] * 1000,
+            "loop lag max [ms]": lag_stats["max"] * 1000,
+            "peak RSS [MiB]": peak_rss_mib(),
+        },
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--consumers", type=int, default=100)
+    parser.add_argument(
+        "--retry", type=float, default=0.3, help="probability that a consumer reschedules an item"
+    )
+    parser.add_argument("--prefetch", type=int, default=1, help="SmartQueue read-ahead depth")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(bench(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
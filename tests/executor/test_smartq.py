@@ -225,3 +225,164 @@ async def test_smartq_finish():
     await q.close()
 
     assert consumed == [0, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_reschedule_wakes_eligible_consumer():
+    """Check that a rescheduled item is handed over to a waiting consumer that may take it."""
+
+    q = SmartQueue(async_iter([1]))
+    loop = asyncio.get_event_loop()
+
+    first = q.new_consumer()
+    second = q.new_consumer()
+    handle = await q.get(first)
+
+    # Both consumers wait for an item, `first` has been waiting longer
+    first_get = loop.create_task(q.get(first))
+    await asyncio.sleep(0.01)
+    second_get = loop.create_task(q.get(second))
+    await asyncio.sleep(0.01)
+    assert q.stats()["waiting consumers"] == 2
+
+    await q.reschedule(handle)
+    second_handle = await asyncio.wait_for(second_get, timeout=1)
+    assert second_handle.data == 1
+    assert not first_get.done()
+
+    await q.mark_done(second_handle)
+    with pytest.raises(StopAsyncIteration):
+        await asyncio.wait_for(first_get, timeout=1)
+    assert q.finished()
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_rescheduled_item_doesnt_swallow_notification():
+    """Check that a consumer taking a rescheduled item wakes another one for a new item."""
+
+    items_ready = asyncio.Event()
+
+    async def tasks():
+        yield 0
+        await items_ready.wait()
+        yield 1
+        # Reschedule item 0 right after item 1 woke up `first`, before `first` runs.
+        # Item 0 has been assigned to `second`, so no waiting consumer is woken for it.
+        await q.reschedule(second_handle)
+        await asyncio.Event().wait()
+
+    q = SmartQueue(tasks())
+    first = q.new_consumer()
+    second = q.new_consumer()
+    second_handle = await q.get(second)
+
+    first_get = asyncio.create_task(q.get(first))
+    await asyncio.sleep(0.01)
+    second_get = asyncio.create_task(q.get(second))
+    await asyncio.sleep(0.01)
+    assert q.stats()["waiting consumers"] == 2
+
+    items_ready.set()
+    first_handle = await asyncio.wait_for(first_get, timeout=1)
+    assert first_handle.data == 0
+    second_handle = await asyncio.wait_for(second_get, timeout=1)
+    assert second_handle.data == 1
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_rescheduled_items_grouped_by_previous_consumers():
+    """Check that a consumer finds a rescheduled item without scanning the ones it has held."""
+
+    q = SmartQueue(async_iter(range(101)), prefetch=101)
+    await asyncio.sleep(0.01)
+    first = q.new_consumer()
+    second = q.new_consumer()
+    for _ in range(100):
+        await q.get(first)
+    second_handle = await q.get(second)
+    await q.reschedule_all(first)
+    await q.reschedule(second_handle)
+
+    assert q.stats()["rescheduled"] == 101
+    assert len(q._rescheduled_by_prev_consumers) == 2
+    handle = await q.get(first)
+    assert handle.data == 100
+    handle = await q.get(second)
+    assert handle.data < 100
+    assert q.stats()["rescheduled"] == 99
+    await q.close()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("prefetch", [1, 3, 10])
+async def test_prefetch(prefetch: int):
+    """Check that the queue reads at most `prefetch` items ahead of the consumers."""
+
+    consumed = []
+
+    async def tasks():
+        for i in range(20):
+            consumed.append(i)
+            yield i
+
+    q = SmartQueue(tasks(), prefetch=prefetch)
+    await asyncio.sleep(0.01)
+    # One more item is pulled from the iterator and waits for free space in the buffer
+    assert len(consumed) == prefetch + 1
+    assert q.stats()["in buffer"] == prefetch
+
+    with q.new_consumer() as consumer:
+        handle = await q.get(consumer)
+        await q.mark_done(handle)
+        await asyncio.sleep(0.01)
+        assert len(consumed) == prefetch + 2
+
+    await q.close()
+
+
+@pytest.mark.asyncio
+async def test_prefetch_wakes_waiting_consumers():
+    """Check that all waiting consumers get an item when several items arrive at once."""
+
+    items_ready = asyncio.Event()
+
+    async def tasks():
+        await items_ready.wait()
+        for i in range(5):
+            yield i
+
+    q = SmartQueue(tasks(), prefetch=5)
+    consumers = [q.new_consumer() for _ in range(5)]
+    gets = [asyncio.create_task(q.get(c)) for c in consumers]
+    await asyncio.sleep(0.01)
+    assert q.stats()["waiting consumers"] == 5
+
+    items_ready.set()
+    handles = await asyncio.wait_for(asyncio.gather(*gets), timeout=1)
+    assert sorted(h.data for h in handles) == list(range(5))
+    await q.close()
+
+
+def test_prefetch_invalid():
+    with pytest.raises(ValueError):
+        SmartQueue(async_iter([]), prefetch=0)
+
+
+@pytest.mark.asyncio
+async def test_wait_for_unassigned_items():
+    q = SmartQueue(async_iter([1]))
+
+    with q.new_consumer() as consumer:
+        await asyncio.wait_for(q.wait_for_unassigned_items(), timeout=1)
+        handle = await q.get(consumer)
+
+        waiter = asyncio.create_task(q.wait_for_unassigned_items())
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+
+        await q.reschedule(handle)
+        await asyncio.wait_for(waiter, timeout=1)
+
+    await q.close()
@@ -1,3 +1,5 @@
+from unittest import mock
+
 import pytest
 from dataclasses import dataclass
 
@@ -28,3 +30,53 @@ def test_add_properties():
         "golem.foo": 667,
         "golem.bar": "blah",
     }
+
+
+def test_derive():
+    demand = DemandBuilder()
+    demand.add_properties({"golem.foo": 667, "golem.bar": "blah"})
+    demand.ensure("(golem.baz=1)")
+
+    derived = demand.derive()
+    derived.properties["golem.foo"] = 668
+    derived.properties["golem.qux"] = [1, 2]
+    del derived.properties["golem.bar"]
+    derived.ensure("(golem.baz=2)")
+
+    assert derived.properties == {"golem.foo": 668, "golem.qux": [1, 2]}
+    assert derived.constraints == "(&(golem.baz=1)\n\t(golem.baz=2))"
+    assert demand.properties == {"golem.foo": 667, "golem.bar": "blah"}
+    assert demand.constraints == "(golem.baz=1)"
+
+    # Changes made to the original after the builder has been derived are not visible in the copy
+    demand.add_properties({"golem.foo": 1, "golem.new": 2})
+    assert demand.properties == {"golem.foo": 1, "golem.bar": "blah", "golem.new": 2}
+    assert derived.properties == {"golem.foo": 668, "golem.qux": [1, 2]}
+
+    # A builder may be derived from a derived one
+    derived_2 = derived.derive()
+    derived_2.properties["golem.bar"] = "back"
+    with pytest.raises(KeyError):
+        del derived_2.properties["golem.bar2"]
+    assert derived_2.properties == {"golem.foo": 668, "golem.qux": [1, 2], "golem.bar": "back"}
+    assert "golem.bar" not in derived.properties
+
+    # Reading the properties doesn't replace them
+    properties = derived_2.properties
+    assert type(properties) is dict
+    assert derived_2.properties is properties
+
+
+@pytest.mark.asyncio
+async def test_respond():
+    demand = DemandBuilder()
+    demand.add_properties({"golem.foo": 667})
+    derived = demand.derive()
+    derived.properties["golem.bar"] = "blah"
+
+    proposal = mock.Mock(respond=mock.AsyncMock(return_value="new-proposal-id"))
+    assert await derived.respond(proposal) == "new-proposal-id"
+    props, constraints = proposal.respond.call_args.args
+    assert type(props) is dict
+    assert props == {"golem.foo": 667, "golem.bar": "blah"}
+    assert constraints == derived.constraints
@@ -1,11 +1,25 @@
+import asyncio
+import json
+import time
 from typing import List, Optional, Tuple, Type
-from unittest.mock import Mock
+from unittest.mock import AsyncMock, Mock
 
 import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
 
+import ya_activity
 from ya_activity.exceptions import ApiException
 
-from yapapi.rest.activity import BatchError, PollingBatch
+from yapapi import events
+from yapapi.rest import activity as activity_module
+from yapapi.rest.activity import (
+    Activity,
+    ActivityEventStream,
+    BatchError,
+    PollingBatch,
+    StreamingBatch,
+)
 
 GetExecBatchResultsSpec = Tuple[Optional[Exception], List[str]]
 
@@ -124,3 +138,172 @@ async def test_polling_batch_on_gsb_error(
         assert expected_error is None
     except Exception as error:
         assert expected_error is not None and isinstance(error, expected_error)
+
+
+class FakeExecStream:
+    """Serves the event streams and the results of batches of 3 commands.
+
+    The first stream of a batch listed in `broken` breaks after the first command, when
+    the second one is finished too. The streams are ended `linger` seconds after the last event.
+    """
+
+    def __init__(self, broken=(), linger=0.0):
+        self.broken = set(broken)
+        self.linger = linger
+        self.streams = []
+        self.connections = set()
+
+    @staticmethod
+    def _event(idx, kind):
+        data = json.dumps({"index": idx, "kind": kind})
+        return f"event: runtime\ndata: {data}\n\n".encode()
+
+    async def handle(self, request):
+        batch_id = request.match_info["bid"]
+        if request.headers.get("Accept") != "text/event-stream":
+            results = [
+                {"index": idx, "eventDate": "2022-01-01T00:00:00Z", "result": "Ok"}
+                for idx in range(2)
+            ]
+            results[1]["stdout"] = "missed"
+            return web.json_response(results)
+
+        self.streams.append(batch_id)
+        self.connections.add(request.transport.get_extra_info("peername"))
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for idx in range(3):
+            await response.write(self._event(idx, {"started": {"command": {"run": {}}}}))
+            await response.write(self._event(idx, {"finished": {"return_code": 0}}))
+            if batch_id in self.broken:
+                self.broken.remove(batch_id)
+                request.transport.close()
+                return response
+        await asyncio.sleep(self.linger)
+        await response.write_eof()
+        return response
+
+
+async def _stream_batches(fake: FakeExecStream, batch_ids: List[str]):
+    app = web.Application()
+    app.router.add_get("/activity/{aid}/exec/{bid}", fake.handle)
+    async with TestServer(app) as server:
+        host = str(server.make_url("")).rstrip("/")
+        async with ya_activity.ApiClient(ya_activity.Configuration(host=host)) as api_client:
+            activity = Activity(
+                ya_activity.RequestorControlApi(api_client),
+                ya_activity.RequestorStateApi(api_client),
+                "activity",
+                stream_events=True,
+            )
+            results = []
+            try:
+                for batch_id in batch_ids:
+                    results.append(
+                        [
+                            (event_class, kwargs["cmd_idx"], kwargs.get("stdout"))
+                            async for event_class, kwargs in StreamingBatch(activity, batch_id, 3)
+                        ]
+                    )
+                    # Let the finished stream be drained, as when the next batch is being created
+                    await asyncio.sleep(0.01)
+                return results
+            finally:
+                await activity.event_stream.close()
+
+
+def _expected_events(stdout=(None, None, None)):
+    return [
+        (event_class, idx, stdout[idx] if event_class is events.CommandExecuted else None)
+        for idx in range(3)
+        for event_class in (events.CommandStarted, events.CommandExecuted)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_streaming_batches_reuse_connection():
+    """Test that the batches of an activity are streamed over one connection."""
+
+    fake = FakeExecStream()
+    results = await _stream_batches(fake, ["batch-1", "batch-2", "batch-3"])
+
+    assert results == [_expected_events()] * 3
+    assert fake.streams == ["batch-1", "batch-2", "batch-3"]
+    assert len(fake.connections) == 1
+
+
+@pytest.mark.asyncio
+async def test_streaming_batch_doesnt_wait_for_stream_end():
+    """Test that the events of a batch are returned without waiting for its stream to end."""
+
+    fake = FakeExecStream(linger=ActivityEventStream.DRAIN_TIMEOUT)
+    started_at = time.monotonic()
+    [results] = await _stream_batches(fake, ["batch-1"])
+
+    assert results == _expected_events()
+    assert time.monotonic() - started_at < ActivityEventStream.DRAIN_TIMEOUT / 2
+
+
+@pytest.mark.asyncio
+async def test_streaming_batch_resumes(monkeypatch):
+    """Test that a broken event stream is resumed, without repeating or losing events."""
+
+    monkeypatch.setattr(ActivityEventStream, "RESUME_INTERVAL", 0)
+    fake = FakeExecStream(broken=["batch-1"])
+    [results] = await _stream_batches(fake, ["batch-1"])
+
+    # The second command finished while the stream was broken, it's reported from its results
+    expected = _expected_events(stdout=(None, "missed", None))
+    expected.remove((events.CommandStarted, 1, None))
+    assert results == expected
+    assert fake.streams == ["batch-1", "batch-1"]
+
+
+def polling_activity(results_per_call: List[int], call_duration: float = 0.0):
+    """Create a mock activity for testing the polling of batch results.
+
+    The i-th call to `get_exec_batch_results()` returns `results_per_call[i]` results of a batch
+    of 3 commands, after `call_duration` seconds.
+    """
+
+    calls = []
+
+    async def mock_results(_activity_id, _batch_id, **kwargs):
+        calls.append(kwargs)
+        if call_duration:
+            await asyncio.sleep(call_duration)
+        count = results_per_call[len(calls) - 1]
+        return [Mock(index=idx, result="Ok", is_batch_finished=idx == 2) for idx in range(count)]
+
+    return Mock(_api=Mock(get_exec_batch_results=mock_results)), calls
+
+
+@pytest.mark.asyncio
+async def test_polling_batch_backoff(monkeypatch):
+    """Test that PollingBatch backs off only while the server returns no new results at once."""
+
+    sleeps = []
+    monkeypatch.setattr(activity_module.asyncio, "sleep", AsyncMock(side_effect=sleeps.append))
+    activity, calls = polling_activity([0, 0, 0, 1, 1, 1, 3])
+
+    indices = [kwargs["cmd_idx"] async for _, kwargs in PollingBatch(activity, "batch_id", 3)]
+
+    assert indices == [0, 1, 2]
+    assert [call["command_index"] for call in calls] == [0, 0, 0, 0, 1, 1, 1]
+    assert sleeps == [0.05, 0.1, 0.2, 0.05, 0.1]
+
+
+@pytest.mark.asyncio
+async def test_polling_batch_long_poll(monkeypatch):
+    """Test that PollingBatch calls a long-polling server again without waiting."""
+
+    monkeypatch.setattr(PollingBatch, "POLL_TIMEOUT", 0.02)
+    activity, calls = polling_activity([0, 1, 1, 3], call_duration=0.02)
+    batch = PollingBatch(activity, "batch_id", 3)
+
+    started_at = time.monotonic()
+    indices = [kwargs["cmd_idx"] async for _, kwargs in batch]
+
+    assert indices == [0, 1, 2]
+    assert len(calls) == 4
+    assert time.monotonic() - started_at < 0.04 * len(calls)
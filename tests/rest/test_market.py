@@ -0,0 +1,60 @@
+from unittest.mock import Mock
+
+import pytest
+
+from tests.factories.rest.market import RestProposalEventFactory
+from yapapi.rest import market
+from yapapi.rest.market import COLLECT_OFFERS_MAX_EVENTS, COLLECT_OFFERS_MIN_EVENTS, Subscription
+
+
+def mock_market_api(batch_sizes):
+    """Create a mock market API whose `collect_offers()` returns batches of the given sizes."""
+
+    requested = []
+
+    async def collect_offers(_subscription_id, timeout, max_events):
+        requested.append(max_events)
+        return [RestProposalEventFactory() for _ in range(min(batch_sizes.pop(0), max_events))]
+
+    return Mock(collect_offers=collect_offers), requested
+
+
+@pytest.mark.asyncio
+async def test_events_max_events_grows_with_full_batches():
+    batch_sizes = [10, 20, 40, 5, 10_000, 10_000, 10_000]
+    api, requested = mock_market_api(batch_sizes)
+    subscription = Subscription(api, "subscription-id")
+
+    offers = 0
+    async for _ in subscription.events():
+        offers += 1
+        if not batch_sizes:
+            subscription.close()
+
+    assert requested == [10, 20, 40, 80, 80, 100, 100]
+    assert requested[0] == COLLECT_OFFERS_MIN_EVENTS
+    assert requested[-1] == COLLECT_OFFERS_MAX_EVENTS
+    assert offers == subscription.stats.offers == 10 + 20 + 40 + 5 + 80 + 100 + 100
+    assert subscription.stats.polls == len(requested)
+    assert subscription.stats.empty_polls == 0
+    assert subscription.stats.poll_efficiency == pytest.approx(offers / sum(requested))
+    assert subscription.stats.offers_per_second > 0
+
+
+@pytest.mark.asyncio
+async def test_events_empty_long_poll_is_not_followed_by_sleep(monkeypatch):
+    """Check that no client-side sleep follows an empty batch if the call has been held."""
+
+    api, requested = mock_market_api([0, 0, 1])
+    subscription = Subscription(api, "subscription-id")
+    sleep = Mock()
+    monotonic = iter(range(0, 100, 5))
+    monkeypatch.setattr(market.asyncio, "sleep", sleep)
+    monkeypatch.setattr(market, "time", Mock(monotonic=lambda: next(monotonic)))
+
+    async for _ in subscription.events():
+        subscription.close()
+
+    assert requested == [10, 10, 10]
+    assert subscription.stats.empty_polls == 2
+    sleep.assert_not_called()
@@ -0,0 +1,144 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+import ya_payment.models as yap
+
+from yapapi.rest import Payment
+from yapapi.rest import payment as payment_module
+from yapapi.rest.payment import EventCursor, PaymentEventCursors
+
+
+def invoice_event(invoice_id: str) -> yap.InvoiceReceivedEvent:
+    return yap.InvoiceReceivedEvent(
+        event_date=datetime.now(timezone.utc),
+        invoice_id=invoice_id,
+    )
+
+
+@pytest.mark.asyncio
+async def test_incoming_invoices_fetched_concurrently():
+    """Check that the invoices from a batch of events are fetched concurrently, in order."""
+
+    payment = Payment(mock.Mock())
+    api = payment._api = mock.Mock()
+    invoice_ids = [f"invoice-{n}" for n in range(6)]
+    api.api_client.call_api = mock.AsyncMock(
+        side_effect=[[invoice_event(id) for id in invoice_ids], asyncio.CancelledError()]
+    )
+
+    fetching = 0
+    max_fetching = 0
+
+    async def get_invoice(invoice_id):
+        nonlocal fetching, max_fetching
+        fetching += 1
+        max_fetching = max(max_fetching, fetching)
+        # The first invoices take the longest to fetch
+        await asyncio.sleep(0.01 * (len(invoice_ids) - int(invoice_id.split("-")[1])))
+        fetching -= 1
+        return SimpleNamespace(_invoice_id=invoice_id)
+
+    api.get_invoice = get_invoice
+
+    received = []
+    with pytest.raises(asyncio.CancelledError):
+        async for invoice in payment.incoming_invoices(parallelism=4):
+            received.append(invoice.invoice_id)
+
+    assert received == invoice_ids
+    assert max_fetching == 4
+
+
+def test_event_cursor():
+    ts = [datetime(2022, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=n) for n in range(5)]
+    cursor = EventCursor()
+    cursor.skipped(ts[0])
+    assert cursor.position == ts[0]
+
+    cursor.received("a", ts[1])
+    cursor.received("b", ts[2])
+    cursor.skipped(ts[3])
+    cursor.received("c", ts[4])
+    assert cursor.pending == 3
+
+    # The position only moves past the events processed along with all the previous ones
+    cursor.processed("b")
+    assert cursor.position == ts[0]
+    cursor.processed("a")
+    assert cursor.position == ts[3]
+    cursor.processed("c")
+    assert cursor.position == ts[4]
+    assert cursor.pending == 0
+
+
+def test_payment_event_cursors_file(tmp_path):
+    path = tmp_path / "cursor.json"
+    position = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+    cursors = PaymentEventCursors(path)
+    assert cursors.invoices.position is None
+    cursors.debit_notes.skipped(position)
+    cursors.unpaid_agreements.update({"agreement-1", "agreement-2"})
+    cursors.save(force=True)
+
+    resumed = PaymentEventCursors(path)
+    assert resumed.invoices.position is None
+    assert resumed.debit_notes.position == position
+    assert resumed.unpaid_agreements == {"agreement-1", "agreement-2"}
+
+    path.write_text("not a cursor")
+    assert PaymentEventCursors(path).debit_notes.position is None
+
+
+@pytest.mark.asyncio
+async def test_payment_event_cursors_save_in_executor(tmp_path):
+    path = tmp_path / "cursor.json"
+    cursors = PaymentEventCursors(path, save_interval=10)
+    cursors.unpaid_agreements.add("agreement-1")
+    await cursors.save_in_executor(force=True)
+    assert PaymentEventCursors(path).unpaid_agreements == {"agreement-1"}
+
+    # Not written again until `save_interval` elapses
+    cursors.unpaid_agreements.add("agreement-2")
+    await cursors.save_in_executor()
+    assert PaymentEventCursors(path).unpaid_agreements == {"agreement-1"}
+
+    # An older state doesn't overwrite a newer one written in the meantime
+    older = cursors._state()
+    cursors.save(force=True)
+    cursors._write(older, 1)
+    assert PaymentEventCursors(path).unpaid_agreements == {"agreement-1", "agreement-2"}
+
+
+@pytest.mark.asyncio
+async def test_incoming_debit_note_ids_long_poll(monkeypatch):
+    """Check that events are requested with `pollTimeout`, starting at the cursor position."""
+
+    payment = Payment(mock.Mock())
+    api = payment._api = mock.Mock()
+    position = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    event = yap.DebitNoteReceivedEvent(
+        event_date=position + timedelta(seconds=1), debit_note_id="debit-note"
+    )
+    api.api_client.call_api = mock.AsyncMock(side_effect=[[], [event], asyncio.CancelledError()])
+    sleep = mock.AsyncMock()
+    monkeypatch.setattr(payment_module.asyncio, "sleep", sleep)
+
+    cursor = EventCursor(position)
+    received = []
+    with pytest.raises(asyncio.CancelledError):
+        async for debit_note_id in payment.incoming_debit_note_ids(cursor=cursor, poll_timeout=5):
+            received.append(debit_note_id)
+            cursor.processed(debit_note_id)
+
+    assert received == ["debit-note"]
+    assert cursor.position == event.event_date
+    calls = api.api_client.call_api.call_args_list
+    assert calls[0].kwargs["query_params"] == [("pollTimeout", 5), ("afterTimestamp", position)]
+    assert calls[2].kwargs["query_params"][1] == ("afterTimestamp", event.event_date)
+    # The empty response came back immediately, so there was a pause before the next request
+    sleep.assert_awaited_once_with(1)
@@ -1,12 +1,15 @@
 import asyncio
+import errno
 import random
 import tempfile
+import time
 from collections import defaultdict
 from pathlib import Path
 from typing import List, cast
 
 import pytest
 
+from tests.benchmarks.fake_yagna import fake_gftp_on_path
 from yapapi.storage import gftp
 
 
@@ -92,6 +95,9 @@ class MockService(gftp.GftpDriver):
             statuses.append("ok")
         return statuses
 
+    async def receive(self, *, output_file: str) -> gftp.PubLink:
+        return gftp.PubLink(file=output_file, url=f"receive/{Path(output_file).name}")
+
 
 @pytest.fixture(scope="function")
 def mock_service(monkeypatch):
@@ -164,7 +170,10 @@ async def test_gftp_provider(test_dir, temp_dir, mock_service, monkeypatch):
                 for path in files
                 if path.parent == temp_dir
             }
-            assert tempfiles == published_tempfiles
+            assert published_tempfiles <= tempfiles
+            # Files are written in an executor, so other workers' files may be not published yet
+            if not provider._uploading:
+                assert tempfiles == published_tempfiles
 
     # Force using `gftp close` by GftpProvider
     monkeypatch.setenv(gftp.USE_GFTP_CLOSE_ENV_VAR, "1")
@@ -236,6 +245,136 @@ async def test_gftp_close_env(temp_dir, mock_service, monkeypatch, env_value, ex
         assert (not mock_service.published["bytes"]) == expect_unpublished
 
 
+@pytest.mark.asyncio
+async def test_gftp_publish_while_closing(temp_dir, mock_service, monkeypatch):
+    """Test that a file published while its URL is being closed is published again."""
+
+    monkeypatch.setenv(gftp.USE_GFTP_CLOSE_ENV_VAR, "1")
+    close = mock_service.close
+    publish = mock_service.publish
+    publish_calls = 0
+
+    async def slow_close(**kwargs):
+        await asyncio.sleep(0.05)
+        return await close(**kwargs)
+
+    async def counting_publish(**kwargs):
+        nonlocal publish_calls
+        publish_calls += 1
+        return await publish(**kwargs)
+
+    monkeypatch.setattr(mock_service, "close", slow_close)
+    monkeypatch.setattr(mock_service, "publish", counting_publish)
+
+    async with gftp.GftpProvider(tmpdir=temp_dir) as provider:
+        assert isinstance(provider, gftp.GftpProvider)
+        src_1 = await provider.upload_bytes(b"bytes")
+        # The second file is published by the service before the first one's URL is closed
+        _, src_2 = await asyncio.gather(
+            provider.release_source(src_1), provider.upload_bytes(b"bytes")
+        )
+
+        assert src_2.download_url == src_1.download_url
+        assert mock_service.published["bytes"]
+        assert publish_calls == 3
+
+        await provider.release_source(src_2)
+        assert not mock_service.published["bytes"]
+
+
+@pytest.mark.asyncio
+async def test_gftp_deduplication(test_dir, temp_dir, mock_service, monkeypatch):
+    """Test that uploads of the same content reuse a single published URL."""
+
+    monkeypatch.setenv(gftp.USE_GFTP_CLOSE_ENV_VAR, "1")
+    publish = mock_service.publish
+    published_files: List[str] = []
+
+    async def recording_publish(*, files):
+        published_files.extend(files)
+        return await publish(files=files)
+
+    monkeypatch.setattr(mock_service, "publish", recording_publish)
+
+    async def stream():
+        yield b"by"
+        yield b"tes"
+
+    async with gftp.GftpProvider(tmpdir=temp_dir) as provider:
+        assert isinstance(provider, gftp.GftpProvider)
+        sources = list(await asyncio.gather(*[provider.upload_bytes(b"bytes") for _ in range(3)]))
+        sources.append(await provider.upload_stream(5, stream()))
+        assert len(published_files) == 1
+        assert {src.download_url for src in sources} == {"bytes"}
+        assert len(list(temp_dir.glob("*"))) == 1
+
+        file_sources = [await provider.upload_file(test_dir / "a_0.txt") for _ in range(2)]
+        assert len(published_files) == 2
+        # A modified file is published again
+        (test_dir / "a_0.txt").write_text("a\n\n")
+        file_sources.append(await provider.upload_file(test_dir / "a_0.txt"))
+        assert len(published_files) == 3
+        assert provider.upload_stats.hits == 4
+        assert provider.upload_stats.misses == 3
+        assert provider.upload_stats.hit_rate == pytest.approx(4 / 7)
+
+        for src in sources[:-1] + file_sources:
+            await provider.release_source(src)
+        assert mock_service.published["bytes"]
+        await provider.release_source(sources[-1])
+        assert not mock_service.published["bytes"]
+        assert not mock_service.published["a"]
+        assert not provider._content_index
+
+        # Content that's no longer published is published again
+        src = await provider.upload_bytes(b"bytes")
+        assert len(published_files) == 4
+        await provider.release_source(src)
+
+
+@pytest.mark.asyncio
+async def test_gftp_destination(test_dir, temp_dir, mock_service, monkeypatch):
+    """Test reading, moving and copying the files received by `gftp`."""
+
+    content = bytes(range(256)) * 8192
+
+    async with gftp.GftpProvider(tmpdir=temp_dir) as provider:
+        dest = cast(gftp.GftpDestination, await provider.new_destination())
+        received = Path(dest._link["file"])
+        assert received.parent == temp_dir
+        received.write_bytes(content)
+
+        assert await dest.download_bytes(limit=len(content) * 2) == content
+        assert await dest.download_bytes(limit=10) == content[:10]
+        stream = (await dest.download_stream()).stream
+        assert b"".join([chunk async for chunk in stream]) == content
+
+        # A temporary file is moved to the destination
+        await dest.download_file(test_dir / "a_1.txt")
+        assert (test_dir / "a_1.txt").read_bytes() == content
+        assert not received.exists()
+        assert await dest.download_bytes(limit=10) == content[:10]
+
+        # A file received directly at the requested path is copied, also if it can't be moved
+        dest = await provider.new_destination(test_dir / "e_0.txt")
+        Path(test_dir / "e_0.txt").write_bytes(content)
+        await dest.download_file(test_dir / "b_1.txt")
+        assert (test_dir / "b_1.txt").read_bytes() == content
+
+        dest = await provider.new_destination()
+        Path(cast(gftp.GftpDestination, dest)._link["file"]).write_bytes(b"c")
+
+        def cross_device(*_args):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+        monkeypatch.setattr(gftp.os, "replace", cross_device)
+        monkeypatch.setattr(gftp.os, "copy_file_range", cross_device, raising=False)
+        await dest.download_file(test_dir / "c_1.txt")
+        assert (test_dir / "c_1.txt").read_bytes() == b"c"
+
+        (test_dir / "e_0.txt").unlink()
+
+
 @pytest.mark.parametrize(
     "env_value, gftp_version, expect_unpublished",
     [
@@ -291,6 +430,29 @@ async def test_gftp_close_env_version(
         assert (not service.published["bytes"]) == expect_unpublished
 
 
+@pytest.mark.asyncio
+async def test_gftp_service_pipelining(temp_dir, monkeypatch):
+    """Test that concurrent requests to `gftp server` are in flight at the same time."""
+
+    monkeypatch.setenv("FAKE_GFTP_DELAY", "0.1")
+    monkeypatch.setenv("FAKE_GFTP_WORKERS", "20")
+    output_files = [str(temp_dir / f"output_{n}") for n in range(20)]
+
+    with fake_gftp_on_path():
+        async with gftp.service() as server:
+            started_at = time.monotonic()
+            links = await asyncio.gather(
+                *[server.receive(output_file=output_file) for output_file in output_files]
+            )
+            elapsed = time.monotonic() - started_at
+
+            assert [link["file"] for link in links] == output_files
+            assert elapsed < 0.1 * len(output_files) / 2
+            with pytest.raises(Exception, match="unexpected keyword"):
+                await server.receive(file="unknown")
+            assert await server.version()
+
+
 ME = __file__
 
 
@@ -1,3 +1,5 @@
+from pathlib import Path
+
 import pytest
 
 from yapapi.storage import Content, Destination
@@ -29,3 +31,20 @@ async def test_download_bytes():
 async def test_download_bytes_with_limit():
     destination = _TestDestination(b"some test data")
     assert await destination.download_bytes(limit=4) == b"some"
+
+
+@pytest.mark.asyncio
+async def test_download_file(tmp_path: Path):
+    class _ChunkedDestination(_TestDestination):
+        async def download_stream(self) -> Content:
+            async def data():
+                for start in range(0, len(self._test_data), 1000):
+                    yield self._test_data[start : start + 1000]
+
+            return Content(len(self._test_data), data())
+
+    expected = bytes(range(256)) * 10000
+    destination = _ChunkedDestination(expected)
+    await destination.download_file(tmp_path / "output")
+    assert (tmp_path / "output").read_bytes() == expected
+    assert await destination.download_bytes(limit=len(expected) - 10) == expected[:-10]
@@ -0,0 +1,112 @@
+import asyncio
+from pathlib import Path
+
+import aiohttp
+import pytest
+
+from tests.benchmarks.fake_webdav import FakeWebDav, FakeWebDavConfig
+from yapapi.storage import Destination
+from yapapi.storage.webdav import DavStorageProvider
+
+CONTENT = bytes(range(256)) * 400
+
+
+async def _upload(provider: DavStorageProvider, data: bytes) -> str:
+    async def stream():
+        for start in range(0, len(data), 1000):
+            yield data[start : start + 1000]
+
+    source = await provider.upload_stream(len(data), stream())
+    assert await source.content_length() == len(data)
+    return source.download_url
+
+
+async def _received(provider: DavStorageProvider, data: bytes) -> Destination:
+    """Return a new destination, with `data` uploaded to it as a provider would do."""
+    destination = await provider.new_destination()
+    async with provider.client.put(destination.upload_url, data=data) as resp:
+        assert resp.status == 201
+    return destination
+
+
+@pytest.mark.parametrize("ranges", [True, False])
+@pytest.mark.asyncio
+async def test_dav_ranged_download(ranges):
+    """Test that a resource is downloaded in parts, if the server supports ranges."""
+
+    async with FakeWebDav(FakeWebDavConfig(ranges=ranges)) as dav:
+        async with aiohttp.ClientSession() as client:
+            provider = await DavStorageProvider.for_directory(
+                client, dav.url, "data", part_size=10000, max_parallel=3
+            )
+            url = await _upload(provider, CONTENT)
+            assert dav.calls["PUT"] == 1
+            assert dav.resources[url[len(dav.url) - 1 :]][0] == CONTENT
+
+            destination = await _received(provider, CONTENT)
+            content = await destination.download_stream()
+            assert content.length == len(CONTENT)
+            assert b"".join([chunk async for chunk in content.stream]) == CONTENT
+            assert dav.calls["GET"] == (11 if ranges else 1)
+
+            destination = await _received(provider, b"")
+            assert await destination.download_bytes() == b""
+
+
+@pytest.mark.asyncio
+async def test_dav_ranged_download_of_changed_resource():
+    """Test that a download fails if the resource changes before all its parts are read."""
+
+    async with FakeWebDav() as dav:
+        async with aiohttp.ClientSession() as client:
+            provider = await DavStorageProvider.for_directory(
+                client, dav.url, "data", part_size=10000, max_parallel=1
+            )
+            destination = await _received(provider, CONTENT)
+            content = await destination.download_stream()
+            assert await content.stream.__anext__() == CONTENT[:10000]
+
+            async with client.put(destination.upload_url, data=CONTENT[::-1]) as resp:
+                assert resp.status == 201
+            with pytest.raises(RuntimeError, match="resource changed during download"):
+                await content.stream.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_dav_download_file(tmp_path: Path):
+    async with FakeWebDav() as dav:
+        async with aiohttp.ClientSession() as client:
+            provider = await DavStorageProvider.for_directory(
+                client, dav.url, "data", part_size=4096
+            )
+            destination = await _received(provider, CONTENT)
+            await destination.download_file(tmp_path / "output")
+            assert (tmp_path / "output").read_bytes() == CONTENT
+            assert await destination.download_bytes(limit=5000) == CONTENT[:5000]
+
+
+@pytest.mark.asyncio
+async def test_dav_prop_find_cache():
+    """Test that listings are cached until a file is uploaded or the cache expires."""
+
+    async with FakeWebDav() as dav:
+        async with aiohttp.ClientSession() as client:
+            provider = await DavStorageProvider.for_directory(
+                client, dav.url, "data", listing_ttl=0.2
+            )
+            url = await _upload(provider, CONTENT)
+
+            listings = await asyncio.gather(*[provider.prop_find() for _ in range(5)])
+            assert dav.calls["PROPFIND"] == 1
+            files = [resource for resource in listings[0] if not resource.collection]
+            assert [(f.path, f.length) for f in files] == [(url[len(dav.url) - 1 :], len(CONTENT))]
+
+            await _upload(provider, b"other")
+            assert len(await provider.prop_find()) == 3
+            assert dav.calls["PROPFIND"] == 2
+
+            await provider.prop_find()
+            assert dav.calls["PROPFIND"] == 2
+            await asyncio.sleep(0.2)
+            await provider.prop_find()
+            assert dav.calls["PROPFIND"] == 3
@@ -73,3 +73,31 @@ async def test_full_DSFUA_workflow(dummy_yagna_engine, events_def, decreased_pro
                 else DEFAULT_OFFER_SCORE
             )
             assert expected_score == await golem._engine._strategy.score_offer(offer)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("events_def, decreased_providers", sample_data)
+async def test_cached_scores_invalidated(dummy_yagna_engine, events_def, decreased_providers):
+    """Test if the scores cached by the engine are invalidated by the default strategy."""
+
+    golem = Golem(budget=1, event_consumer=empty_event_consumer, app_key="NOT_A_REAL_APPKEY")
+    async with golem:
+        offers = {
+            provider_id: OfferProposalFactory(provider_id=provider_id) for provider_id in (1, 2)
+        }
+        for offer in offers.values():
+            assert DEFAULT_OFFER_SCORE == await golem._engine.score_offer(offer)
+
+        for event_cls, event_provider_id in events_def:
+            event = event_cls(agreement__provider_id=event_provider_id)
+            golem._engine._emit_event(event)
+
+        await asyncio.sleep(0.1)  # let the events propagate
+
+        for provider_id, offer in offers.items():
+            expected_score = (
+                DEFAULT_OFFER_SCORE / 2
+                if provider_id in decreased_providers
+                else DEFAULT_OFFER_SCORE
+            )
+            assert expected_score == await golem._engine.score_offer(offer)
@@ -1,4 +1,6 @@
+import asyncio
 import random
+from datetime import timedelta
 from operator import xor
 from unittest import mock
 
@@ -9,7 +11,7 @@ from yapapi import agreements_pool
 from yapapi.events import AgreementTerminated
 
 
-def mock_agreement(**properties):
+def mock_agreement(confirm=None, **properties):
     """Return a coroutine that creates a mock agreement with the given properties."""
 
     async def mock_details():
@@ -21,7 +23,7 @@ def mock_agreement(**properties):
     async def create_agreement():
         mock_agreement = mock.MagicMock(**properties)
         mock_agreement.get_details = mock_details
-        mock_agreement.confirm = mock_confirm
+        mock_agreement.confirm = confirm or mock_confirm
         return mock_agreement
 
     return create_agreement
@@ -140,3 +142,269 @@ async def test_terminate_agreement(multi_activity, simulate_race, event_emitted)
     assert terminate_mock.called == multi_activity
     assert xor(AgreementTerminated in events, not event_emitted)
     assert not pool._agreements
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("multi_activity", [True, False])
+async def test_wait_for_changes(multi_activity):
+    """Test that `wait_for_changes` returns after a new proposal or a released agreement."""
+
+    pool = get_agreements_pool()
+    waiter = asyncio.create_task(pool.wait_for_changes())
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+
+    await pool.add_proposal(1.0, mock.MagicMock())
+    await asyncio.wait_for(waiter, timeout=1)
+
+    agreement: BufferedAgreement = BufferedAgreementFactory(has_multi_activity=multi_activity)
+    pool._agreements[agreement.agreement.id] = agreement
+    waiter = asyncio.create_task(pool.wait_for_changes())
+    with mock.patch("yapapi.rest.market.Agreement.terminate", mock.AsyncMock()):
+        await pool.release_agreement(agreement.agreement.id)
+    await asyncio.sleep(0.01)
+    # Only agreements that may be reused are announced
+    assert waiter.done() == multi_activity
+    waiter.cancel()
+
+
+@pytest.mark.asyncio
+async def test_use_agreement_negotiates_concurrently():
+    """Test that agreements are confirmed concurrently, up to `max_concurrent_confirmations`."""
+
+    confirming = 0
+    max_confirming = 0
+    release = asyncio.Event()
+
+    async def slow_confirm():
+        nonlocal confirming, max_confirming
+        confirming += 1
+        max_confirming = max(max_confirming, confirming)
+        await release.wait()
+        confirming -= 1
+        return True
+
+    pool = agreements_pool.AgreementsPool(
+        lambda _event, **kwargs: None,
+        lambda _offer: None,
+        mock.Mock(),
+        max_concurrent_confirmations=3,
+    )
+    for n in range(5):
+        mock_proposal = mock.MagicMock(issuer=f"provider-{n}")
+        mock_proposal.create_agreement = mock_agreement(id=f"agreement-{n}", confirm=slow_confirm)
+        await pool.add_proposal(1.0, mock_proposal)
+
+    uses = [asyncio.create_task(pool.use_agreement(lambda _agreement: True)) for _ in range(5)]
+    await asyncio.sleep(0.01)
+    assert max_confirming == 3
+
+    # The pool's lock is not held while agreements are being confirmed
+    await asyncio.wait_for(pool.release_agreement("unknown-agreement"), timeout=1)
+
+    release.set()
+    assert await asyncio.gather(*uses) == [True] * 5
+    assert max_confirming == 3
+    assert pool.confirmed == 5
+
+
+@pytest.mark.asyncio
+async def test_use_agreement_terminated_during_confirmation():
+    """Test that an agreement terminated while being confirmed is not added to the pool."""
+
+    pool = get_agreements_pool()
+    confirming = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_confirm():
+        confirming.set()
+        await release.wait()
+        return True
+
+    mock_proposal = mock.MagicMock()
+    mock_proposal.create_agreement = mock_agreement(id="agreement", confirm=slow_confirm)
+    await pool.add_proposal(1.0, mock_proposal)
+
+    use = asyncio.create_task(pool.use_agreement(lambda _agreement: True))
+    await confirming.wait()
+    await pool.on_agreement_terminated("agreement", {})
+    release.set()
+
+    assert await use is None
+    assert not pool._agreements
+
+
+@pytest.mark.asyncio
+async def test_use_agreement_negotiated_during_terminate_all():
+    """Test that an agreement confirmed after `terminate_all` is terminated instead of used."""
+
+    events = []
+    pool = agreements_pool.AgreementsPool(
+        lambda event, **kwargs: events.append(event), lambda _offer: None, mock.Mock()  # noqa
+    )
+    confirming = asyncio.Event()
+    release = asyncio.Event()
+
+    async def slow_confirm():
+        confirming.set()
+        await release.wait()
+        return True
+
+    terminate = mock.AsyncMock(return_value=True)
+    mock_proposal = mock.MagicMock()
+    mock_proposal.create_agreement = mock_agreement(
+        id="agreement", confirm=slow_confirm, terminate=terminate
+    )
+    await pool.add_proposal(1.0, mock_proposal)
+    other_proposal = mock.MagicMock()
+    other_proposal.create_agreement = mock_agreement(id="other-agreement")
+    await pool.add_proposal(0.5, other_proposal)
+
+    worker = mock.Mock()
+    use = asyncio.create_task(pool.use_agreement(worker))
+    await confirming.wait()
+    await pool.terminate_all({"message": "Finished"})
+    release.set()
+
+    assert await use is None
+    worker.assert_not_called()
+    terminate.assert_awaited_once_with({"message": "Finished"})
+    assert events[-1] == AgreementTerminated
+    assert not pool._agreements
+    # No more agreements are negotiated
+    assert await pool.use_agreement(worker) is None
+
+
+@pytest.mark.asyncio
+async def test_expired_proposals_are_recycled():
+    """Test that proposals older than `proposal_ttl` are evicted and recycled instead of used."""
+
+    recycled = []
+    pool = agreements_pool.AgreementsPool(
+        lambda _event, **kwargs: None,
+        recycled.append,
+        mock.Mock(),
+        proposal_ttl=timedelta(seconds=0.05),
+    )
+    old_proposal = mock.MagicMock(issuer="old-provider")
+    old_proposal.create_agreement = mock_agreement(proposal_id="old")
+    await pool.add_proposal(2.0, old_proposal)
+    await asyncio.sleep(0.1)
+
+    new_proposal = mock.MagicMock(issuer="new-provider")
+    new_proposal.create_agreement = mock_agreement(proposal_id="new")
+    await pool.add_proposal(1.0, new_proposal)
+
+    chosen = []
+    await pool.use_agreement(lambda agreement: chosen.append(agreement.proposal_id))
+    assert chosen == ["new"]
+    assert recycled == [old_proposal]
+    assert await pool.use_agreement(lambda _agreement: True) is None
+
+
+@pytest.mark.asyncio
+async def test_replaced_proposal_is_not_used():
+    """Test that only the most recent proposal from a provider is used."""
+
+    pool = get_agreements_pool()
+    for n, score in enumerate([3.0, 1.0]):
+        mock_proposal = mock.MagicMock(issuer="provider")
+        mock_proposal.create_agreement = mock_agreement(proposal_id=n)
+        await pool.add_proposal(score, mock_proposal)
+
+    chosen = []
+    await pool.use_agreement(lambda agreement: chosen.append(agreement.proposal_id))
+    assert chosen == [1]
+    assert await pool.use_agreement(lambda _agreement: True) is None
+
+
+@pytest.mark.asyncio
+async def test_free_agreement_is_reused():
+    """Test that an agreement released for reuse is used before any new proposal."""
+
+    pool = get_agreements_pool()
+    agreement: BufferedAgreement = BufferedAgreementFactory(has_multi_activity=True)
+    pool._agreements[agreement.agreement.id] = agreement
+    await pool.release_agreement(agreement.agreement.id)
+
+    mock_proposal = mock.MagicMock()
+    mock_proposal.create_agreement = mock_agreement()
+    await pool.add_proposal(1.0, mock_proposal)
+
+    used = []
+    await pool.use_agreement(lambda agreement: used.append(agreement))
+    assert used == [agreement.agreement]
+    assert not pool._free_agreements
+
+
+@pytest.mark.asyncio
+async def test_terminate_all_concurrently():
+    """Test if `terminate_all` terminates at most `max_concurrent` agreements at a time."""
+
+    events = []
+    pool = agreements_pool.AgreementsPool(
+        lambda event, **kwargs: events.append(event), lambda _offer: None, mock.Mock()  # noqa
+    )
+    for _ in range(10):
+        agreement: BufferedAgreement = BufferedAgreementFactory(has_multi_activity=True)
+        pool._agreements[agreement.agreement.id] = agreement
+
+    terminating = 0
+    max_terminating = 0
+
+    async def mock_terminate(_, **__):
+        nonlocal terminating, max_terminating
+        terminating += 1
+        max_terminating = max(max_terminating, terminating)
+        await asyncio.sleep(0.01)
+        terminating -= 1
+        return True
+
+    with mock.patch(
+        "yapapi.rest.market.Agreement.terminate", mock.AsyncMock(side_effect=mock_terminate)
+    ) as terminate_mock:
+        await pool.terminate_all({"message": "Finished"}, max_concurrent=3)
+
+    assert terminate_mock.await_count == 10
+    assert max_terminating == 3
+    assert not pool._agreements
+    assert events == [AgreementTerminated] * 10
+
+
+@pytest.mark.asyncio
+async def test_terminate_all_doesnt_hold_lock():
+    """Test that the pool isn't locked while `terminate_all` waits for the providers."""
+
+    events = []
+    pool = agreements_pool.AgreementsPool(
+        lambda event, **kwargs: events.append(event), lambda _offer: None, mock.Mock()  # noqa
+    )
+    agreements = [BufferedAgreementFactory(has_multi_activity=True) for _ in range(3)]
+    for agreement in agreements:
+        pool._agreements[agreement.agreement.id] = agreement
+
+    terminating = asyncio.Event()
+    responded = asyncio.Event()
+
+    async def mock_terminate(_, **__):
+        terminating.set()
+        await responded.wait()
+        return True
+
+    with mock.patch(
+        "yapapi.rest.market.Agreement.terminate", mock.AsyncMock(side_effect=mock_terminate)
+    ):
+        terminate_all = asyncio.create_task(pool.terminate_all({"message": "Finished"}))
+        await terminating.wait()
+
+        # The agreement terminated by the provider in the meantime is removed right away
+        terminated_id = agreements[0].agreement.id
+        await asyncio.wait_for(pool.on_agreement_terminated(terminated_id, {}), timeout=1)
+        assert terminated_id not in pool._agreements
+        assert not terminate_all.done()
+
+        responded.set()
+        await terminate_all
+
+    assert not pool._agreements
+    assert events == [AgreementTerminated] * 3
@@ -0,0 +1,150 @@
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+
+from yapapi.allocation_manager import AllocationManager
+from yapapi.rest.payment import AllocationDetails
+
+PLATFORM = "erc20-goerli-tglm"
+ADDRESS = "0xrequestor"
+
+
+def _manager(budget, **kwargs):
+    created = []
+
+    async def create_allocation(platform, address, amount):
+        allocation = mock.Mock(
+            id=f"allocation-{len(created)}",
+            amount=amount,
+            payment_platform=platform,
+            payment_address=address,
+        )
+        created.append(allocation)
+        return allocation
+
+    return AllocationManager(Decimal(budget), create_allocation, **kwargs), created
+
+
+def _debit_note(total, activity_id="activity", agreement_id="agreement"):
+    return mock.Mock(
+        payment_platform=PLATFORM,
+        payer_addr=ADDRESS,
+        agreement_id=agreement_id,
+        activity_id=activity_id,
+        total_amount_due=str(total),
+    )
+
+
+def _invoice(amount, agreement_id="agreement"):
+    return mock.Mock(
+        payment_platform=PLATFORM, payer_addr=ADDRESS, agreement_id=agreement_id, amount=str(amount)
+    )
+
+
+@pytest.mark.asyncio
+async def test_create_allocations():
+    manager, created = _manager(1000, shards=2)
+    await manager.create_allocations([PLATFORM, "erc20-polygon-glm"], ADDRESS)
+
+    assert [allocation.amount for allocation in created] == [Decimal(125)] * 4
+    assert manager.payment_platforms == {PLATFORM, "erc20-polygon-glm"}
+    assert manager.remaining == Decimal(1000)
+
+    single, created = _manager(1000)
+    await single.create_allocations([PLATFORM], ADDRESS)
+    assert [allocation.amount for allocation in created] == [Decimal(1000)]
+
+
+@pytest.mark.asyncio
+async def test_spend_spreads_payments_and_tracks_cumulative_amounts():
+    manager, created = _manager(1000, shards=2, reserve=Decimal(0))
+    await manager.create_allocations([PLATFORM], ADDRESS)
+
+    async with manager.spend_on_debit_note(_debit_note(10), Decimal(10), "job") as first:
+        pass
+    async with manager.spend_on_debit_note(_debit_note(30), Decimal(30), "job") as second:
+        pass
+    async with manager.spend_on_debit_note(
+        _debit_note(5, "other-activity", "other-agreement"), Decimal(5), "job"
+    ) as other:
+        pass
+    # All payments for an agreement use the same allocation, another agreement uses
+    # the one with more remaining, and only the increase of the cumulative amount
+    # of the activity is charged
+    assert first is second
+    assert other is not first
+    assert manager.remaining == Decimal(965)
+
+    with pytest.raises(RuntimeError):
+        async with manager.spend_on_debit_note(_debit_note(50), Decimal(50), "job"):
+            raise RuntimeError("acceptance failed")
+    assert manager.remaining == Decimal(965)
+
+    # The invoice is charged with the amount not accepted with the debit notes
+    async with manager.spend_on_invoice(_invoice(45), Decimal(45), "job") as settled:
+        pass
+    assert settled is first
+    assert manager.remaining == Decimal(950)
+    assert manager.spending("job").amount == Decimal(50)
+    assert manager.spending("other-job").amount == 0
+
+    # The entries of an agreement are kept until its payment is settled or abandoned
+    assert set(manager._accepted) == {"agreement", "other-agreement"}
+    manager.release_agreement("agreement")
+    manager.release_agreement("unknown-agreement")
+    assert list(manager._accepted) == ["other-agreement"]
+    assert list(manager._shards_by_agreement) == ["other-agreement"]
+
+
+@pytest.mark.asyncio
+async def test_top_up_from_reserve():
+    manager, created = _manager(100, shards=2)
+    await manager.create_allocations([PLATFORM], ADDRESS)
+    assert len(created) == 2
+    assert manager._unallocated == Decimal(50)
+
+    for agreement in range(4):
+        async with manager.spend_on_invoice(_invoice(15, f"agreement-{agreement}"), 15, "job"):
+            pass
+
+    # The allocations are topped up twice, until the reserve is used up
+    assert [allocation.amount for allocation in created] == [Decimal(25)] * 4
+    assert manager.remaining == Decimal(40)
+
+    with pytest.raises(ValueError, match="No allocation"):
+        async with manager.spend_on_debit_note(
+            mock.Mock(payment_platform="other", payer_addr=ADDRESS), 1, "job"
+        ):
+            pass
+
+
+@pytest.mark.asyncio
+async def test_shortfall_refreshes_allocation(caplog):
+    """Check that an allocation that can't cover a payment is refreshed, not failed locally."""
+
+    manager, created = _manager(100)
+    await manager.create_allocations([PLATFORM], ADDRESS)
+    [allocation] = created
+    allocation.details = mock.AsyncMock(
+        return_value=AllocationDetails(spent_amount=Decimal(70), remaining_amount=Decimal(30))
+    )
+
+    async with manager.spend_on_debit_note(_debit_note(80), Decimal(80), "job"):
+        pass
+    allocation.details.assert_not_awaited()
+    assert manager.remaining == Decimal(20)
+
+    # The server has charged less than the local records show, e.g. after a failed payment
+    # was counted as spent, so the refreshed allocation covers the payment
+    async with manager.spend_on_debit_note(_debit_note(105), Decimal(105), "job") as used:
+        assert manager.remaining == Decimal(5)
+    assert used is allocation
+    allocation.details.assert_awaited_once()
+
+    # The payment isn't failed locally even if the server doesn't show enough remaining,
+    # it's up to the server to accept or reject it
+    async with manager.spend_on_invoice(_invoice(150), Decimal(150), "job") as used:
+        pass
+    assert used is allocation
+    assert "may not cover 45" in caplog.text
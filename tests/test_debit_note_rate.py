@@ -0,0 +1,115 @@
+from unittest import mock
+
+import pytest
+
+from yapapi import debit_note_rate
+from yapapi.debit_note_rate import DebitNoteRateTracker, DebitNoteWindow
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = mock.Mock(time=mock.Mock(return_value=0.0))
+    monkeypatch.setattr(debit_note_rate, "time", clock)
+    return clock
+
+
+def test_window_starts_with_activity(clock):
+    tracker = DebitNoteRateTracker(window_size=3)
+    tracker.activity_started("activity", "agreement")
+
+    clock.time.return_value = 100.0
+    assert tracker.debit_note_received("activity", payable=False) == (
+        DebitNoteWindow(1, 100.0),
+        None,
+    )
+    clock.time.return_value = 200.0
+    window, payable_window = tracker.debit_note_received("activity", payable=True)
+    assert window == DebitNoteWindow(2, 200.0)
+    assert payable_window == DebitNoteWindow(1, 200.0)
+    assert window.mean_interval == 200.0
+
+
+def test_window_slides_over_recent_notes(clock):
+    """Check that a burst of debit notes isn't averaged out over a long activity lifetime."""
+
+    tracker = DebitNoteRateTracker(window_size=3)
+    tracker.activity_started("activity", "agreement")
+    for n in range(1, 11):
+        clock.time.return_value = n * 100.0
+        tracker.debit_note_received("activity", payable=False)
+
+    clock.time.return_value = 1001.0
+    for _ in range(3):
+        window, _ = tracker.debit_note_received("activity", payable=False)
+    assert window == DebitNoteWindow(3, 1.0)
+
+    rate = tracker.rate("activity")
+    assert rate.num_debit_notes == 13
+    assert rate.num_payable_debit_notes == 0
+    assert rate.age == 1001.0
+    assert rate.payable_debit_notes == DebitNoteWindow(0, 1001.0)
+
+
+def test_window_measured_by_debit_note_timestamps(clock):
+    """Check that the rate is measured by when the debit notes are issued, not received."""
+
+    tracker = DebitNoteRateTracker(window_size=3)
+    tracker.activity_started("activity", "agreement")
+
+    # Timely debit notes, received together
+    clock.time.return_value = 1000.0
+    for n in [1, 2, 3]:
+        window, _ = tracker.debit_note_received("activity", payable=False, timestamp=n * 60.0)
+    assert window == DebitNoteWindow(3, 180.0)
+    for n in [4, 5, 6]:
+        window, _ = tracker.debit_note_received("activity", payable=False, timestamp=n * 60.0)
+    # The window starts with the debit note preceding its oldest one
+    assert window == DebitNoteWindow(3, 180.0)
+
+    rate = tracker.rate("activity")
+    assert rate.age == 1000.0
+    assert rate.debit_notes == DebitNoteWindow(3, 820.0)
+
+
+def test_debit_note_timestamps_clamped(clock):
+    """Check that the debit note timestamps can't make the notes look more spread out."""
+
+    tracker = DebitNoteRateTracker(window_size=2)
+    tracker.activity_started("activity", "agreement")
+    tracker.activity_started("other-activity", "agreement")
+    clock.time.return_value = 100.0
+
+    # Not issued before the activity has started, e.g. by a provider with a skewed clock
+    window, _ = tracker.debit_note_received("other-activity", payable=False, timestamp=-500.0)
+    assert window == DebitNoteWindow(1, 0.0)
+
+    # Nor after it's received
+    window, _ = tracker.debit_note_received("activity", payable=False, timestamp=5000.0)
+    assert window == DebitNoteWindow(1, 100.0)
+    # Nor before the previous debit note
+    window, _ = tracker.debit_note_received("activity", payable=False, timestamp=50.0)
+    assert window == DebitNoteWindow(2, 100.0)
+
+    clock.time.return_value = 200.0
+    window, _ = tracker.debit_note_received("activity", payable=False, timestamp=150.0)
+    assert window == DebitNoteWindow(2, 50.0)
+
+
+def test_lifecycle(clock):
+    tracker = DebitNoteRateTracker()
+    tracker.activity_started("activity-1", "agreement-1")
+    tracker.activity_started("activity-2", "agreement-1")
+    tracker.activity_started("activity-3", "agreement-2")
+    assert len(tracker) == 3
+
+    tracker.activity_finished("activity-1")
+    tracker.activity_finished("activity-1")
+    assert "activity-1" not in tracker
+    assert {rate.activity_id for rate in tracker} == {"activity-2", "activity-3"}
+
+    tracker.agreement_finished("agreement-1")
+    tracker.activity_finished("activity-3")
+    assert len(tracker) == 0
+    assert not tracker._activity_ids_by_agreement
+    with pytest.raises(KeyError):
+        tracker.debit_note_received("activity-3", payable=False)
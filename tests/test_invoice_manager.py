@@ -0,0 +1,123 @@
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+
+from yapapi.invoice_manager import InvoiceManager
+from yapapi.utils import LatencyStats
+
+
+def _invoice(agreement_id: str, status: str = "RECEIVED"):
+    return mock.Mock(agreement_id=agreement_id, amount="1", status=status, accept=mock.AsyncMock())
+
+
+@asynccontextmanager
+async def _spend_on_invoice(_invoice, _amount):
+    yield mock.Mock()
+
+
+async def _pay(manager: InvoiceManager, agreement_id: str) -> bool:
+    return await manager.attempt_payment(
+        agreement_id, _spend_on_invoice, mock.AsyncMock(return_value=Decimal(1))
+    )
+
+
+@pytest.mark.asyncio
+async def test_payable_unpaid_agreements():
+    manager = InvoiceManager()
+    job = mock.Mock()
+    for n in range(3):
+        manager.add_agreement(job, mock.Mock(id=f"agreement-{n}"))
+    assert not manager.has_payable_unpaid_agreements
+
+    manager.set_payable("agreement-0")
+    manager.set_payable("agreement-1")
+    manager.set_payable("agreement-1")
+    assert manager.payable_unpaid_agreement_ids == {"agreement-0", "agreement-1"}
+
+    manager.add_invoice(_invoice("agreement-1"))
+    manager.add_invoice(_invoice("agreement-2"))
+    assert await _pay(manager, "agreement-1")
+    assert not await _pay(manager, "agreement-2")
+    assert manager.payable_unpaid_agreement_ids == {"agreement-0"}
+
+    # The invoice for a non-payable agreement is accepted once the agreement becomes payable
+    manager.set_payable("agreement-2")
+    assert await _pay(manager, "agreement-2")
+    assert manager.payable_unpaid_agreement_ids == {"agreement-0"}
+
+    # An invoice accepted before, e.g. by a previous run of the requestor, isn't accepted again
+    invoice = _invoice("agreement-0", status="ACCEPTED")
+    manager.add_invoice(invoice)
+    assert await _pay(manager, "agreement-0")
+    invoice.accept.assert_not_called()
+    assert not manager.has_payable_unpaid_agreements
+    assert manager.num_settled == 3
+
+
+@pytest.mark.asyncio
+async def test_settlement_latency():
+    latency = LatencyStats()
+    manager = InvoiceManager(settlement_latency=latency)
+    manager.add_agreement(mock.Mock(), mock.Mock(id="agreement"))
+    manager.add_invoice(_invoice("agreement"))
+    assert not await _pay(manager, "agreement")
+    assert latency.count == 0
+
+    manager.set_payable("agreement")
+    assert await _pay(manager, "agreement")
+    assert latency.count == 1
+
+
+@pytest.mark.asyncio
+async def test_settled_agreements_evicted():
+    manager = InvoiceManager(settled_agreements_kept=2)
+    job = mock.Mock()
+    for n in range(5):
+        agreement_id = f"agreement-{n}"
+        manager.add_agreement(job, mock.Mock(id=agreement_id))
+        manager.set_payable(agreement_id)
+        manager.add_invoice(_invoice(agreement_id))
+        assert await _pay(manager, agreement_id)
+
+    assert not manager._agreement_data
+    assert list(manager._settled) == ["agreement-3", "agreement-4"]
+
+    # A repeated invoice for a recently settled agreement is recognized and ignored
+    job.emit.reset_mock()
+    manager.add_invoice(_invoice("agreement-4"))
+    job.emit.assert_called_once()
+    assert not await _pay(manager, "agreement-4")
+    manager.set_payable("agreement-4")
+    assert not manager.has_payable_unpaid_agreements
+
+
+@pytest.mark.asyncio
+async def test_agreements_released():
+    """Check that the agreements whose payment is settled or abandoned are reported."""
+
+    released = []
+    manager = InvoiceManager(agreement_released=released.append)
+    job = mock.Mock()
+    for n in range(4):
+        manager.add_agreement(job, mock.Mock(id=f"agreement-{n}"))
+    manager.add_agreement(mock.Mock(), mock.Mock(id="other-job-agreement"))
+    for n in range(3):
+        manager.set_payable(f"agreement-{n}")
+        manager.add_invoice(_invoice(f"agreement-{n}"))
+
+    assert await _pay(manager, "agreement-0")
+    # The invoice is ignored, as a lower amount is accepted
+    assert await manager.attempt_payment(
+        "agreement-1", _spend_on_invoice, mock.AsyncMock(return_value=Decimal("0.5"))
+    )
+    assert released == ["agreement-0", "agreement-1"]
+
+    # The agreements of a finished job that aren't payable are never going to be paid
+    manager.job_finished(job)
+    assert released == ["agreement-0", "agreement-1", "agreement-3"]
+    assert manager.payable_unpaid_agreement_ids == {"agreement-2"}
+    with pytest.raises(KeyError):
+        manager.agreement_job("agreement-3")
+    assert manager.agreement_job("other-job-agreement")
@@ -0,0 +1,57 @@
+from datetime import timedelta
+from unittest import mock
+
+from yapapi.score_cache import ScoreCache, props_digest
+
+
+def test_props_digest_is_order_independent():
+    assert props_digest({"a": 1, "b": [1, 2]}) == props_digest({"b": [1, 2], "a": 1})
+    assert props_digest({"a": 1}) != props_digest({"a": 2})
+
+
+def test_get_put():
+    cache = ScoreCache()
+    assert cache.get("provider", {"a": 1}) is None
+    cache.put("provider", {"a": 1}, 42.0)
+    assert cache.get("provider", {"a": 1}) == 42.0
+    assert cache.get("provider", {"a": 2}) is None
+    assert cache.get("other-provider", {"a": 1}) is None
+    assert (cache.hits, cache.misses) == (1, 3)
+
+
+def test_ttl():
+    cache = ScoreCache(ttl=timedelta(seconds=10))
+    with mock.patch("yapapi.score_cache.time.monotonic", return_value=100.0):
+        cache.put("provider", {}, 1.0)
+    with mock.patch("yapapi.score_cache.time.monotonic", return_value=109.0):
+        assert cache.get("provider", {}) == 1.0
+    with mock.patch("yapapi.score_cache.time.monotonic", return_value=111.0):
+        assert cache.get("provider", {}) is None
+    assert len(cache) == 0
+
+
+def test_lru_eviction():
+    cache = ScoreCache(max_size=2)
+    cache.put("provider-1", {}, 1.0)
+    cache.put("provider-2", {}, 2.0)
+    assert cache.get("provider-1", {}) == 1.0
+    cache.put("provider-3", {}, 3.0)
+    assert len(cache) == 2
+    assert cache.get("provider-2", {}) is None
+    assert cache.get("provider-1", {}) == 1.0
+    assert cache.get("provider-3", {}) == 3.0
+
+
+def test_invalidate():
+    cache = ScoreCache()
+    cache.put("provider-1", {"a": 1}, 1.0)
+    cache.put("provider-1", {"a": 2}, 1.0)
+    cache.put("provider-2", {"a": 1}, 2.0)
+
+    cache.invalidate("provider-1")
+    assert cache.get("provider-1", {"a": 1}) is None
+    assert cache.get("provider-1", {"a": 2}) is None
+    assert cache.get("provider-2", {"a": 1}) == 2.0
+
+    cache.invalidate()
+    assert len(cache) == 0
@@ -1,4 +1,4 @@
-from yapapi.utils import explode_dict
+from yapapi.utils import LatencyStats, explode_dict
 
 
 def test_explode_dict():
@@ -45,3 +45,19 @@ def test_explode_dict():
             "works fine",
         ],
     }
+
+
+def test_latency_stats_histogram():
+    stats = LatencyStats()
+    for _ in range(98):
+        stats.record(0.003)
+    stats.record(0.1)
+    stats.record(0.0)
+
+    assert stats.count == 100
+    assert stats.max == 0.1
+    # Percentiles are the upper bounds of the histogram buckets, i.e. powers of 2
+    assert stats.percentile(50) == 2**-8
+    assert stats.percentile(99) == 2**-8
+    assert stats.percentile(100) == 0.1
+    assert [count for _, count in stats.buckets()] == [1, 98, 1]
@@ -1,9 +1,12 @@
 import asyncio
 import datetime
+import heapq
+import itertools
 import logging
 import random
 import sys
-from typing import Callable, Dict, NamedTuple, Optional
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Final, List, NamedTuple, Optional, Tuple
 
 import aiohttp
 from dataclasses import dataclass
@@ -14,6 +17,15 @@ from yapapi.rest.market import Agreement, AgreementDetails, ApiException, Market
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_CONCURRENT_CONFIRMATIONS: Final[int] = 10
+"Maximum number of agreements negotiated concurrently within a single pool."
+
+DEFAULT_MAX_CONCURRENT_TERMINATIONS: Final[int] = 10
+"Maximum number of agreements terminated concurrently by :func:`AgreementsPool.terminate_all`."
+
+DEFAULT_PROPOSAL_TTL: Final[datetime.timedelta] = datetime.timedelta(minutes=5)
+"Time after which a buffered proposal is evicted from the pool and recycled."
+
 
 class _BufferedProposal(NamedTuple):
     """Providers' proposal with additional local metadata."""
@@ -43,12 +55,29 @@ class AgreementsPool:
         emitter: Callable[..., events.Event],
         offer_recycler: Callable[[OfferProposal], None],
         market_api: Market,
+        max_concurrent_confirmations: int = DEFAULT_MAX_CONCURRENT_CONFIRMATIONS,
+        proposal_ttl: Optional[datetime.timedelta] = DEFAULT_PROPOSAL_TTL,
     ):
         self.emitter = emitter
         self.offer_recycler = offer_recycler
         self._offer_buffer: Dict[str, _BufferedProposal] = {}  # provider_id -> Proposal
+        # Max-heap of the buffered proposals, ordered by the score and then by a random number,
+        # so that one of the proposals with the same score is chosen at random.
+        # Proposals replaced or removed from `_offer_buffer` are skipped when popped.
+        self._offer_heap: List[Tuple[float, float, int, _BufferedProposal]] = []
+        # Buffered proposals in the order of arrival, used to evict the expired ones
+        self._offer_queue: Deque[_BufferedProposal] = deque()
+        self._offer_counter = itertools.count()
+        self._proposal_ttl = proposal_ttl
         self._agreements: Dict[str, BufferedAgreement] = {}  # agreement_id -> Agreement
+        # Agreements with no worker task, in the order of release
+        self._free_agreements: "OrderedDict[str, None]" = OrderedDict()
+        self._negotiated: Dict[str, Agreement] = {}  # agreement_id -> Agreement
+        # Reason passed to `terminate_all`, agreements negotiated after it are terminated at once
+        self._termination_reason: Optional[dict] = None
+        self._confirmations = asyncio.Semaphore(max_concurrent_confirmations)
         self._lock = asyncio.Lock()
+        self._changed = asyncio.Event()
         self.confirmed = 0
         self._market_api = market_api
 
@@ -57,6 +86,8 @@ class AgreementsPool:
 
         Should be called regularly.
         """
+        async with self._lock:
+            self._evict_expired_proposals()
         for agreement_id in frozenset(self._agreements):
             try:
                 buffered_agreement = self._agreements[agreement_id]
@@ -71,29 +102,97 @@ class AgreementsPool:
     async def add_proposal(self, score: float, proposal: OfferProposal) -> None:
         """Add providers' proposal to the pool of available proposals."""
         async with self._lock:
-            self._offer_buffer[proposal.issuer] = _BufferedProposal(
-                datetime.datetime.now(), score, proposal
+            offer = _BufferedProposal(datetime.datetime.now(), score, proposal)
+            self._offer_buffer[proposal.issuer] = offer
+            heapq.heappush(
+                self._offer_heap, (-score, random.random(), next(self._offer_counter), offer)
             )
+            self._offer_queue.append(offer)
+            if len(self._offer_heap) > 2 * len(self._offer_buffer) + 100:
+                self._compact_offers()
+            self._changed.set()
+
+    def _is_buffered(self, offer: _BufferedProposal) -> bool:
+        return self._offer_buffer.get(offer.proposal.issuer) is offer
+
+    def _compact_offers(self) -> None:
+        """Drop the entries of proposals no longer in the buffer from the heap and the queue."""
+        self._offer_heap = [entry for entry in self._offer_heap if self._is_buffered(entry[3])]
+        heapq.heapify(self._offer_heap)
+        self._offer_queue = deque(offer for offer in self._offer_queue if self._is_buffered(offer))
+
+    def _evict_expired_proposals(self) -> None:
+        """Remove the proposals older than `proposal_ttl` from the buffer and recycle them.
+
+        Recycling makes the engine negotiate a fresh proposal with the provider.
+        """
+        if self._proposal_ttl is None:
+            return
+        expiry = datetime.datetime.now() - self._proposal_ttl
+        while self._offer_queue and self._offer_queue[0].ts < expiry:
+            offer = self._offer_queue.popleft()
+            if self._is_buffered(offer):
+                del self._offer_buffer[offer.proposal.issuer]
+                logger.debug("Evicting expired proposal. id: %s", offer.proposal.id)
+                self.offer_recycler(offer.proposal)
+
+    async def wait_for_changes(self) -> None:
+        """Wait until a new proposal is added to the pool or an agreement is freed up for reuse."""
+        await self._changed.wait()
+        self._changed.clear()
 
     async def use_agreement(
         self, cbk: Callable[[Agreement], asyncio.Task], agreement_id: Optional[str] = None
     ) -> Optional[asyncio.Task]:
-        """Get an agreement and start the `cbk()` task within it."""
-        async with self._lock:
-            if not agreement_id:
-                agreement = await self._get_agreement()
-            else:
-                agreement = await self._fetch_existing_agreement(agreement_id)
+        """Get an agreement and start the `cbk()` task within it.
 
-            if agreement is None:
-                return None
+        The pool's lock is only held while choosing a candidate agreement or proposal
+        and while registering the new agreement, so that agreements with different providers
+        may be negotiated concurrently.
 
-            task = cbk(agreement)
-            self._set_worker(agreement.id, task)
+        No agreement is used after `terminate_all()` has been called. Agreements whose
+        negotiation finishes after that are terminated instead.
+        """
+        if self._termination_reason is not None:
+            return None
+        if agreement_id:
+            buffered_agreement = await self._fetch_existing_agreement(agreement_id)
+        else:
+            async with self._lock:
+                agreement = self._get_free_agreement()
+                if agreement is not None:
+                    return self._use(agreement, cbk)
+                offer = self._pop_best_offer()
+            if offer is None:
+                return None
+            buffered_agreement = await self._create_agreement(offer)
 
-            logger.debug("Using agreement: %s, worker task: %s", agreement, task)
+        if buffered_agreement is None:
+            return None
 
-            return task
+        async with self._lock:
+            agreement = buffered_agreement.agreement
+            if self._negotiated.pop(agreement.id, None) is None:
+                logger.debug("Agreement terminated before it could be used. id: %s", agreement.id)
+                return None
+            reason = self._termination_reason
+            if reason is None:
+                self._agreements[agreement.id] = buffered_agreement
+                self.emitter(events.AgreementConfirmed, agreement=agreement)
+                self.confirmed += 1
+                return self._use(agreement, cbk)
+
+        logger.debug("Terminating agreement negotiated after terminate_all. id: %s", agreement.id)
+        if not await agreement.terminate(reason):
+            logger.debug("Couldn't terminate agreement. id: %s", agreement.id)
+        self.emitter(events.AgreementTerminated, agreement=agreement, reason=reason)
+        return None
+
+    def _use(self, agreement: Agreement, cbk: Callable[[Agreement], asyncio.Task]) -> asyncio.Task:
+        task = cbk(agreement)
+        self._set_worker(agreement.id, task)
+        logger.debug("Using agreement: %s, worker task: %s", agreement, task)
+        return task
 
     def _set_worker(self, agreement_id: str, task: asyncio.Task) -> None:
         try:
@@ -102,13 +201,33 @@ class AgreementsPool:
             return
         assert buffered_agreement.worker_task is None
         buffered_agreement.worker_task = task
+        self._free_agreements.pop(agreement_id, None)
 
     async def _prepare_agreement(
         self,
         agreement: Agreement,
         proposal: Optional[OfferProposal] = None,
         requires_confirmation: bool = True,
-    ) -> Optional[Agreement]:
+    ) -> Optional[BufferedAgreement]:
+        # Keep track of the agreement until it's added to the pool, to learn if it's been
+        # terminated in the meantime
+        self._negotiated[agreement.id] = agreement
+        buffered_agreement = None
+        try:
+            buffered_agreement = await self._negotiate_agreement(
+                agreement, proposal, requires_confirmation
+            )
+            return buffered_agreement
+        finally:
+            if buffered_agreement is None:
+                self._negotiated.pop(agreement.id, None)
+
+    async def _negotiate_agreement(
+        self,
+        agreement: Agreement,
+        proposal: Optional[OfferProposal],
+        requires_confirmation: bool,
+    ) -> Optional[BufferedAgreement]:
         try:
             agreement_details = await agreement.get_details()
             provider_activity = agreement_details.provider_view.extract(Activity)
@@ -127,7 +246,7 @@ class AgreementsPool:
             if proposal:
                 self.offer_recycler(proposal)
             return None
-        self._agreements[agreement.id] = BufferedAgreement(
+        return BufferedAgreement(
             agreement=agreement,
             agreement_details=agreement_details,
             worker_task=None,
@@ -135,50 +254,48 @@ class AgreementsPool:
                 provider_activity.multi_activity and requestor_activity.multi_activity
             ),
         )
-        self.emitter(events.AgreementConfirmed, agreement=agreement)
-        self.confirmed += 1
-        return agreement
 
-    async def _fetch_existing_agreement(self, agreement_id) -> Optional[Agreement]:
+    async def _fetch_existing_agreement(self, agreement_id) -> Optional[BufferedAgreement]:
         agreement = Agreement(self._market_api._api, agreement_id)
         return await self._prepare_agreement(agreement, requires_confirmation=False)
 
-    async def _get_agreement(self) -> Optional[Agreement]:
-        """Return an Agreement.
+    def _get_free_agreement(self) -> Optional[Agreement]:
+        """Return the agreement that has had no worker task for the longest time, if any."""
+        agreement_id = next(iter(self._free_agreements), None)
+        if agreement_id is None:
+            return None
+        logger.debug("Reusing agreement. id: %s", agreement_id)
+        return self._agreements[agreement_id].agreement
 
-        Firstly it tries to reuse agreement from a pool of available agreements
-        (no active worker_task). If that fails it tries to convert offer into agreement.
-        """
-        emit = self.emitter
+    def _pop_best_offer(self) -> Optional[_BufferedProposal]:
+        """Remove the proposal with the highest score from the pool and return it.
 
-        try:
-            buffered_agreement = random.choice(
-                [ba for ba in self._agreements.values() if ba.worker_task is None]
-            )
-            logger.debug("Reusing agreement. id: %s", buffered_agreement.agreement.id)
-            return buffered_agreement.agreement
-        except IndexError:  # empty pool
-            pass
-
-        try:
-            offers = list(self._offer_buffer.items())
-            # Shuffle the offers before picking one with the max score,
-            # in case there's more than one with this score.
-            random.shuffle(offers)
-            provider_id, offer = max(offers, key=lambda elem: elem[1].score)
-        except ValueError:  # empty pool
-            return None
-        del self._offer_buffer[provider_id]
-        try:
-            agreement = await offer.proposal.create_agreement()
-        except asyncio.CancelledError:
-            raise
-        except Exception as e:
-            exc_info = (type(e), e, sys.exc_info()[2])
-            emit(events.ProposalFailed, proposal=offer.proposal, exc_info=exc_info)
-            raise
+        A random one is chosen if there's more than one proposal with this score.
+        """
+        self._evict_expired_proposals()
+        while self._offer_heap:
+            offer = heapq.heappop(self._offer_heap)[3]
+            if self._is_buffered(offer):
+                del self._offer_buffer[offer.proposal.issuer]
+                return offer
+        return None
+
+    async def _create_agreement(self, offer: _BufferedProposal) -> Optional[BufferedAgreement]:
+        """Create, sign and confirm an agreement based on the given proposal.
+
+        At most `max_concurrent_confirmations` agreements are negotiated at the same time.
+        """
+        async with self._confirmations:
+            try:
+                agreement = await offer.proposal.create_agreement()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                exc_info = (type(e), e, sys.exc_info()[2])
+                self.emitter(events.ProposalFailed, proposal=offer.proposal, exc_info=exc_info)
+                raise
 
-        return await self._prepare_agreement(agreement, offer.proposal)
+            return await self._prepare_agreement(agreement, offer.proposal)
 
     async def release_agreement(self, agreement_id: str, allow_reuse: bool = True) -> None:
         """Mark agreement as unused.
@@ -198,6 +315,9 @@ class AgreementsPool:
             if not allow_reuse or not buffered_agreement.has_multi_activity:
                 reason = {"message": "Work cancelled", "golem.requestor.code": "Cancelled"}
                 await self._terminate_agreement(agreement_id, reason)
+            else:
+                self._free_agreements[agreement_id] = None
+                self._changed.set()
 
     async def _terminate_agreement(self, agreement_id: str, reason: dict) -> None:
         """Terminate the agreement with given `agreement_id`."""
@@ -234,6 +354,7 @@ class AgreementsPool:
 
         try:
             del self._agreements[agreement_id]
+            self._free_agreements.pop(agreement_id, None)
             self.emitter(
                 events.AgreementTerminated, agreement=buffered_agreement.agreement, reason=reason
             )
@@ -244,13 +365,38 @@ class AgreementsPool:
                 provider,
             )
 
-    async def terminate_all(self, reason: dict) -> None:
-        """Terminate all agreements."""
+    async def terminate_all(
+        self, reason: dict, max_concurrent: int = DEFAULT_MAX_CONCURRENT_TERMINATIONS
+    ) -> None:
+        """Terminate all agreements.
 
-        async with self._lock:
-            for agreement_id in frozenset(self._agreements):
+        Up to `max_concurrent` agreements are terminated at the same time, so that the time
+        it takes doesn't grow with the number of agreements as long as providers respond.
+        Agreements still being negotiated are terminated once their negotiation finishes,
+        and no new ones are negotiated.
+        """
+
+        if max_concurrent < 1:
+            raise ValueError(f"`max_concurrent` must be a positive number, got {max_concurrent}")
+        semaphore = asyncio.Semaphore(max_concurrent)
+
+        async def terminate(agreement_id: str) -> None:
+            async with semaphore:
                 await self._terminate_agreement(agreement_id, reason)
 
+        #   The agreements registered after this are terminated by `use_agreement()`,
+        #   so the lock isn't held while the providers respond
+        async with self._lock:
+            self._termination_reason = reason
+            agreement_ids = list(self._agreements)
+        results = await asyncio.gather(
+            *[terminate(agreement_id) for agreement_id in agreement_ids],
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
     async def on_agreement_terminated(self, agr_id: str, reason: dict) -> None:
         """React to agreement termination event.
 
@@ -261,10 +407,15 @@ class AgreementsPool:
             try:
                 buffered_agreement = self._agreements[agr_id]
             except KeyError:
+                # If the agreement is being negotiated, it will be dropped once that's finished
+                agreement = self._negotiated.pop(agr_id, None)
+                if agreement:
+                    agreement._terminated = True
                 return
             buffered_agreement.worker_task and buffered_agreement.worker_task.cancel()
             buffered_agreement.agreement._terminated = True
             del self._agreements[agr_id]
+            self._free_agreements.pop(agr_id, None)
             self.emitter(
                 events.AgreementTerminated, agreement=buffered_agreement.agreement, reason=reason
             )
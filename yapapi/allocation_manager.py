@@ -0,0 +1,292 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from typing import (
+    TYPE_CHECKING,
+    AsyncContextManager,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Final,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from dataclasses import dataclass
+
+if TYPE_CHECKING:
+    from yapapi.rest.payment import Allocation, DebitNote, Invoice
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET_RESERVE: Final[Decimal] = Decimal("0.5")
+"""Fraction of the budget that's not allocated at start, but used to top up the allocations.
+
+Applies only if the budget is split into more than one allocation.
+"""
+
+TOP_UP_THRESHOLD: Final[Decimal] = Decimal("0.2")
+"Fraction of the initial amount of an allocation below which its remaining amount is topped up."
+
+_PayerKey = Tuple[Optional[str], Optional[str]]
+"Payment platform and payer address."
+
+CreateAllocation = Callable[[str, str, Decimal], Awaitable["Allocation"]]
+"Callable creating an allocation for a payment platform and address, with the given amount."
+
+
+@dataclass
+class JobSpending:
+    """Amount spent on the payments of a job."""
+
+    amount: Decimal = Decimal(0)
+    "Total amount of the accepted invoices and debit notes."
+
+    first_payment_at: Optional[float] = None
+    "The value of `time.monotonic()` at the first accepted payment."
+
+    @property
+    def rate(self) -> Optional[Decimal]:
+        """Amount spent per second since the first payment, or `None` if it can't be told yet."""
+        if self.first_payment_at is None:
+            return None
+        elapsed = time.monotonic() - self.first_payment_at
+        return self.amount / Decimal(elapsed) if elapsed > 0 else None
+
+
+class _Shard:
+    __slots__ = ("allocation", "remaining", "reserved")
+
+    def __init__(self, allocation: "Allocation"):
+        self.allocation = allocation
+        self.remaining = Decimal(allocation.amount)
+        #   Amount of the payments being accepted, not yet charged by the server
+        self.reserved = Decimal(0)
+
+
+class AllocationManager:
+    """Splits the budget into allocations and selects an allocation for each payment.
+
+    The budget is split evenly between the payment platforms and between `shards` allocations
+    on each platform, so that the payments for concurrent agreements are spread over several
+    allocations. All payments for an agreement use the allocation chosen for its first one.
+    The remaining amounts of the allocations are tracked locally, so no REST calls are needed
+    to choose an allocation. A part of the budget may be kept in reserve and used to create
+    additional allocations on the platforms whose allocations run low.
+
+    If the local records show that an allocation can't cover a payment, its remaining amount
+    is refreshed from the server, which has the final say on whether the payment is accepted.
+    """
+
+    def __init__(
+        self,
+        budget: Decimal,
+        create_allocation: Optional[CreateAllocation] = None,
+        shards: int = 1,
+        reserve: Optional[Decimal] = None,
+    ):
+        if shards < 1:
+            raise ValueError(f"`shards` must be a positive number, got {shards}")
+        self._budget = Decimal(budget)
+        self._create_allocation = create_allocation
+        self._shards = shards
+        self._reserve = reserve
+        self._quota = Decimal(0)
+        self._unallocated = self._budget
+        self._shards_by_payer: Dict[_PayerKey, List[_Shard]] = {}
+        self._top_up_locks: Dict[_PayerKey, asyncio.Lock] = {}
+        self._shards_by_agreement: Dict[str, _Shard] = {}
+
+        #   Debit notes are accepted with cumulative amounts, per activity, and invoices
+        #   with the total amount for all activities of an agreement, so the amounts accepted
+        #   so far are needed to tell how much of an allocation a payment uses.
+        self._accepted: Dict[str, Dict[Optional[str], Decimal]] = {}
+        self._spending: Dict[str, JobSpending] = {}
+
+    @property
+    def allocations(self) -> List["Allocation"]:
+        """Return all allocations created or added to this manager."""
+        return [shard.allocation for shards in self._shards_by_payer.values() for shard in shards]
+
+    @property
+    def payment_platforms(self) -> Set[str]:
+        """Return the payment platforms for which there are allocations."""
+        return {platform for platform, _ in self._shards_by_payer if platform is not None}
+
+    @property
+    def remaining(self) -> Decimal:
+        """Return the part of the budget that hasn't been spent, according to the local records."""
+        allocated = sum(
+            (shard.remaining for shards in self._shards_by_payer.values() for shard in shards),
+            Decimal(0),
+        )
+        return allocated + self._unallocated
+
+    def add(self, allocation: "Allocation") -> None:
+        """Add an existing allocation, not counted against the budget."""
+        key = (allocation.payment_platform, allocation.payment_address)
+        self._shards_by_payer.setdefault(key, []).append(_Shard(allocation))
+        self._quota = max(self._quota, Decimal(allocation.amount))
+
+    async def create_allocations(self, payment_platforms: Sequence[str], address: str) -> None:
+        """Split the budget into allocations on the given payment platforms."""
+        assert self._create_allocation, "Can't create allocations without `create_allocation`"
+        num_shards = len(payment_platforms) * self._shards
+        reserve = self._reserve
+        if reserve is None:
+            reserve = DEFAULT_BUDGET_RESERVE if num_shards > 1 else Decimal(0)
+        self._quota = self._budget * (1 - reserve) / num_shards
+        for platform in payment_platforms:
+            for _ in range(self._shards):
+                await self._new_shard(platform, address, self._quota)
+
+    async def _new_shard(self, platform: str, address: str, amount: Decimal) -> _Shard:
+        assert self._create_allocation
+        logger.debug("Creating allocation of %s using payment platform `%s`", amount, platform)
+        allocation = await self._create_allocation(platform, address, amount)
+        self._unallocated -= amount
+        shard = _Shard(allocation)
+        self._shards_by_payer.setdefault((platform, address), []).append(shard)
+        return shard
+
+    async def _select(self, key: _PayerKey, agreement_id: str, amount: Decimal) -> _Shard:
+        shard = self._shards_by_agreement.get(agreement_id)
+        if shard is None:
+            shard = await self._select_for_agreement(key, amount)
+            self._shards_by_agreement[agreement_id] = shard
+
+        if shard.remaining < amount:
+            await self._refresh(shard)
+            if shard.remaining < amount:
+                logger.warning(
+                    "Allocation %s may not cover %s for agreement %s: %s remaining",
+                    shard.allocation.id,
+                    amount,
+                    agreement_id,
+                    shard.remaining,
+                )
+        return shard
+
+    async def _select_for_agreement(self, key: _PayerKey, amount: Decimal) -> _Shard:
+        shards = self._shards_by_payer.get(key)
+        if not shards:
+            raise ValueError(f"No allocation for {key[0]} {key[1]}.")
+
+        shard = max(shards, key=lambda s: s.remaining)
+        if shard.remaining - amount >= self._quota * TOP_UP_THRESHOLD:
+            return shard
+
+        top_up = self._top_up_locks.setdefault(key, asyncio.Lock())
+        async with top_up:
+            shard = max(shards, key=lambda s: s.remaining)
+            top_up_amount = min(max(self._quota, amount), self._unallocated)
+            if (
+                shard.remaining - amount < self._quota * TOP_UP_THRESHOLD
+                and top_up_amount >= amount
+                and top_up_amount > 0
+                and self._create_allocation
+            ):
+                assert key[0] is not None and key[1] is not None
+                shard = await self._new_shard(key[0], key[1], top_up_amount)
+        return shard
+
+    async def _refresh(self, shard: _Shard) -> None:
+        try:
+            details = await shard.allocation.details()
+        except Exception:
+            logger.warning("Failed to refresh allocation %s", shard.allocation.id, exc_info=True)
+            return
+        logger.debug(
+            "Refreshed allocation %s: %s remaining, %s locally",
+            shard.allocation.id,
+            details.remaining_amount,
+            shard.remaining,
+        )
+        shard.remaining = details.remaining_amount - shard.reserved
+
+    @asynccontextmanager
+    async def _spend(
+        self,
+        key: _PayerKey,
+        agreement_id: str,
+        activity_id: Optional[str],
+        total: Decimal,
+        job_id: Optional[str],
+    ) -> AsyncIterator["Allocation"]:
+        accepted = self._accepted.setdefault(agreement_id, {})
+        if activity_id is None:
+            previous = sum(accepted.values(), Decimal(0))
+        else:
+            previous = accepted.get(activity_id, Decimal(0))
+        amount = max(total - previous, Decimal(0))
+
+        shard = await self._select(key, agreement_id, amount)
+        shard.remaining -= amount
+        shard.reserved += amount
+        if activity_id is not None:
+            accepted[activity_id] = max(previous, total)
+        try:
+            yield shard.allocation
+        except BaseException:
+            shard.remaining += amount
+            if activity_id is not None and accepted.get(activity_id) == total:
+                accepted[activity_id] = previous
+            raise
+        finally:
+            shard.reserved -= amount
+
+        if job_id is not None:
+            spending = self._spending.setdefault(job_id, JobSpending())
+            if spending.first_payment_at is None:
+                spending.first_payment_at = time.monotonic()
+            spending.amount += amount
+
+    def spend_on_debit_note(
+        self, debit_note: "DebitNote", amount: Decimal, job_id: str
+    ) -> "AsyncContextManager[Allocation]":
+        """Reserve a part of an allocation for accepting `debit_note` with `amount`.
+
+        The returned context manager yields the allocation to use, the same one for all
+        payments for the debit note's agreement. If the block it wraps
+        raises an exception, the reservation is cancelled, otherwise the amount is recorded
+        as spent on the job with `job_id`.
+        """
+        return self._spend(
+            (debit_note.payment_platform, debit_note.payer_addr),
+            debit_note.agreement_id,
+            debit_note.activity_id,
+            Decimal(amount),
+            job_id,
+        )
+
+    def spend_on_invoice(
+        self, invoice: "Invoice", amount: Decimal, job_id: Optional[str] = None
+    ) -> "AsyncContextManager[Allocation]":
+        """Reserve a part of an allocation for accepting `invoice` with `amount`.
+
+        Works like :func:`spend_on_debit_note`, the amounts accepted earlier for the debit notes
+        of the invoice's agreement are deducted. If `job_id` isn't given, e.g. for an agreement
+        made before a restart, the amount isn't recorded as spent on any job.
+        """
+        return self._spend(
+            (invoice.payment_platform, invoice.payer_addr),
+            invoice.agreement_id,
+            None,
+            Decimal(amount),
+            job_id,
+        )
+
+    def release_agreement(self, agreement_id: str) -> None:
+        """Forget the payments for an agreement whose payment is settled or abandoned."""
+        self._accepted.pop(agreement_id, None)
+        self._shards_by_agreement.pop(agreement_id, None)
+
+    def spending(self, job_id: str) -> JobSpending:
+        """Return the amount spent on the payments of the job with `job_id`."""
+        return self._spending.get(job_id) or JobSpending()
@@ -0,0 +1,184 @@
+import time
+from collections import deque
+from typing import Deque, Dict, Final, Iterator, List, Optional, Set, Tuple
+
+from dataclasses import dataclass
+
+DEFAULT_DEBIT_NOTE_WINDOW: Final[int] = 10
+"Number of the most recent debit notes of an activity over which their rate is checked."
+
+
+@dataclass(frozen=True)
+class DebitNoteWindow:
+    """Debit notes received in a recent period of an activity's life."""
+
+    num_notes: int
+    "Number of debit notes issued in the period, including the one that ends it."
+
+    duration: float
+    """Length of the period in seconds.
+
+    The period starts with the debit note issued just before the oldest one in the window or,
+    if there have been no more notes than the window holds, with the start of the activity.
+    Either way, the period spans as many intervals between debit notes as it holds notes.
+    """
+
+    @property
+    def mean_interval(self) -> Optional[float]:
+        """Mean interval between the debit notes in the window, in seconds."""
+        return self.duration / (self.num_notes - 1) if self.num_notes > 1 else None
+
+
+class _NoteWindow:
+    __slots__ = ("count", "size", "issued_at")
+
+    def __init__(self, size: int):
+        self.count = 0
+        self.size = size
+        # Issue times of the notes in the window and of the one preceding it, in order
+        self.issued_at: Deque[float] = deque(maxlen=size + 1)
+
+    def add(self, timestamp: float, started_at: float) -> DebitNoteWindow:
+        self.count += 1
+        self.issued_at.append(max(timestamp, self.issued_at[-1]) if self.issued_at else timestamp)
+        return self.window(self.issued_at[-1], started_at)
+
+    def window(self, end: float, started_at: float) -> DebitNoteWindow:
+        if self.count <= self.size:
+            return DebitNoteWindow(self.count, end - started_at)
+        return DebitNoteWindow(self.size, end - self.issued_at[0])
+
+
+class _ActivityDebitNotes:
+    __slots__ = ("agreement_id", "started_at", "debit_notes", "payable_debit_notes")
+
+    def __init__(self, agreement_id: str, started_at: float, window_size: int):
+        self.agreement_id = agreement_id
+        self.started_at = started_at
+        self.debit_notes = _NoteWindow(window_size)
+        self.payable_debit_notes = _NoteWindow(window_size)
+
+
+@dataclass(frozen=True)
+class DebitNoteRate:
+    """Snapshot of the debit notes received for an activity."""
+
+    activity_id: str
+    agreement_id: str
+
+    age: float
+    "Time since the activity has started, in seconds."
+
+    num_debit_notes: int
+    "Number of all debit notes received for the activity."
+
+    num_payable_debit_notes: int
+    "Number of payable debit notes received for the activity."
+
+    debit_notes: DebitNoteWindow
+    "The most recent debit notes, up to the current moment."
+
+    payable_debit_notes: DebitNoteWindow
+    "The most recent payable debit notes, up to the current moment."
+
+
+class DebitNoteRateTracker:
+    """Tracks the rate at which debit notes are issued for each activity.
+
+    For each activity, only the issue times of the last `window_size` debit notes,
+    and separately of the last `window_size` payable debit notes, are kept, so that the rate
+    in the recent past is known at a constant cost per debit note, and a burst of debit notes
+    isn't averaged out over the whole lifetime of a long-running activity.
+
+    The rate is measured by the timestamps of the debit notes rather than by the time they
+    are received, so that on-time debit notes that are delivered or processed together,
+    e.g. after a delay in the event stream, don't look like a burst. The timestamps come from
+    the provider, so each one is clamped between the start of the activity, the timestamp of
+    the previous debit note and the time it's received. Neither a skewed clock nor backdated
+    debit notes can then make the debit notes look more spread out than they have been
+    received, by more than one interval. A debit note processed out of order is counted
+    as issued with the previous one.
+
+    An activity is tracked from :func:`activity_started` until :func:`activity_finished`
+    (or :func:`agreement_finished` for its agreement).
+    """
+
+    def __init__(self, window_size: int = DEFAULT_DEBIT_NOTE_WINDOW):
+        if window_size < 2:
+            raise ValueError(f"Debit note window must hold at least 2 notes, got {window_size}")
+        self._window_size = window_size
+        self._activities: Dict[str, _ActivityDebitNotes] = {}
+        self._activity_ids_by_agreement: Dict[str, Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._activities)
+
+    def __contains__(self, activity_id: object) -> bool:
+        return activity_id in self._activities
+
+    def __iter__(self) -> Iterator[DebitNoteRate]:
+        return iter(self.rates())
+
+    def activity_started(
+        self, activity_id: str, agreement_id: str, started_at: Optional[float] = None
+    ) -> None:
+        """Start tracking the debit notes of an activity.
+
+        :param started_at: the POSIX timestamp of the start of the activity, defaults to now
+        """
+        self._activities[activity_id] = _ActivityDebitNotes(
+            agreement_id,
+            time.time() if started_at is None else started_at,
+            self._window_size,
+        )
+        self._activity_ids_by_agreement.setdefault(agreement_id, set()).add(activity_id)
+
+    def activity_finished(self, activity_id: str) -> None:
+        """Stop tracking the debit notes of an activity and discard their data."""
+        activity = self._activities.pop(activity_id, None)
+        if activity:
+            activity_ids = self._activity_ids_by_agreement[activity.agreement_id]
+            activity_ids.discard(activity_id)
+            if not activity_ids:
+                del self._activity_ids_by_agreement[activity.agreement_id]
+
+    def agreement_finished(self, agreement_id: str) -> None:
+        """Stop tracking the debit notes of all activities of an agreement."""
+        for activity_id in self._activity_ids_by_agreement.pop(agreement_id, ()):
+            del self._activities[activity_id]
+
+    def debit_note_received(
+        self, activity_id: str, payable: bool, timestamp: Optional[float] = None
+    ) -> Tuple[DebitNoteWindow, Optional[DebitNoteWindow]]:
+        """Record a debit note received for a tracked activity.
+
+        :param timestamp: the POSIX timestamp of the debit note, defaults to now
+        :return: the windows of the recent debit notes and, if the debit note is payable,
+            of the recent payable debit notes, both ending with the latest issued one
+        """
+        activity = self._activities[activity_id]
+        now = time.time()
+        timestamp = now if timestamp is None else min(max(timestamp, activity.started_at), now)
+        window = activity.debit_notes.add(timestamp, activity.started_at)
+        payable_window = (
+            activity.payable_debit_notes.add(timestamp, activity.started_at) if payable else None
+        )
+        return window, payable_window
+
+    def rate(self, activity_id: str) -> DebitNoteRate:
+        """Return a snapshot of the debit notes received for a tracked activity."""
+        activity = self._activities[activity_id]
+        now = time.time()
+        return DebitNoteRate(
+            activity_id=activity_id,
+            agreement_id=activity.agreement_id,
+            age=now - activity.started_at,
+            num_debit_notes=activity.debit_notes.count,
+            num_payable_debit_notes=activity.payable_debit_notes.count,
+            debit_notes=activity.debit_notes.window(now, activity.started_at),
+            payable_debit_notes=activity.payable_debit_notes.window(now, activity.started_at),
+        )
+
+    def rates(self) -> List[DebitNoteRate]:
+        """Return snapshots of the debit notes received for all tracked activities."""
+        return [self.rate(activity_id) for activity_id in self._activities]
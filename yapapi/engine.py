@@ -5,13 +5,14 @@ import json
 import logging
 import os
 import sys
+import time
 from asyncio import CancelledError
-from collections import defaultdict
 from contextlib import AsyncExitStack
-from copy import deepcopy
 from datetime import datetime, timezone
 from decimal import Decimal
+from pathlib import Path
 from typing import (
+    Any,
     AsyncContextManager,
     AsyncGenerator,
     Awaitable,
@@ -21,25 +22,30 @@ from typing import (
     Iterator,
     List,
     Optional,
+    Sequence,
     Set,
+    Tuple,
     Type,
     Union,
     cast,
 )
 
 import aiohttp
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from yapapi import events, props, rest
 from yapapi.agreements_pool import AgreementsPool
+from yapapi.allocation_manager import AllocationManager, JobSpending
 from yapapi.config import ApiConfig
 from yapapi.ctx import WorkContext
+from yapapi.debit_note_rate import DebitNoteRateTracker, DebitNoteWindow
 from yapapi.invoice_manager import InvoiceManager
 from yapapi.payload import Payload
 from yapapi.props.builder import DemandBuilder, DemandDecorator
 from yapapi.rest.activity import Activity
 from yapapi.rest.market import Agreement, OfferProposal, Subscription
-from yapapi.rest.payment import DebitNote
+from yapapi.rest.payment import ACCEPTED_STATUSES, DebitNote, PaymentEventCursors
+from yapapi.score_cache import ScoreCache
 from yapapi.script import Script
 from yapapi.script.command import BatchCommand
 from yapapi.storage import gftp
@@ -50,12 +56,32 @@ from yapapi.strategy import (
     SCORE_NEUTRAL,
     BaseMarketStrategy,
 )
+from yapapi.utils import LatencyStats
 
 DEFAULT_DRIVER: str = os.getenv("YAGNA_PAYMENT_DRIVER", "erc20").lower()
 DEFAULT_NETWORK: str = os.getenv("YAGNA_PAYMENT_NETWORK", "goerli").lower()
 DEFAULT_SUBNET: Optional[str] = os.getenv("YAGNA_SUBNET", "public")
 
-MAX_CONCURRENTLY_PROCESSED_DEBIT_NOTES: Final[int] = 10
+DEFAULT_PAYMENT_PARALLELISM: Final[int] = 10
+"Default number of debit notes processed, and invoices fetched, concurrently by the engine."
+
+DEFAULT_PROPOSAL_CONCURRENCY: Final[int] = 5
+"Default number of proposals each job responds to or confirms concurrently."
+
+MAX_CONCURRENT_PROPOSAL_REJECTIONS: Final[int] = 10
+"Maximum number of proposals each job rejects concurrently, independently of the responses."
+
+INVOICE_WAIT_TIMEOUT: Final[float] = 30.0
+"Maximum time in seconds the engine's shutdown waits for the invoices of unpaid agreements."
+
+SERVICES_WAIT_TIMEOUT: Final[float] = 10.0
+"Maximum time in seconds the engine's shutdown waits for its cancelled services to finish."
+
+FAST_STOP_TERMINATION_RESERVE: Final[float] = 5.0
+"""Part of a shutdown deadline, in seconds, kept for terminating the agreements of unfinished jobs.
+
+At most a half of the deadline is reserved.
+"""
 
 MAINNET_NETWORKS: Set[str] = {"mainnet", "polygon"}
 MAINNET_TOKEN_NAME: str = "glm"
@@ -95,6 +121,59 @@ ActivityId = str
 AgreementId = str
 
 
+@dataclass
+class PaymentStats:
+    """Latencies of the stages of the engine's payment processing."""
+
+    debit_note_queue: LatencyStats = field(default_factory=LatencyStats)
+    """Time from receiving a debit note event until a worker starts processing the debit note"""
+    debit_note_processing: LatencyStats = field(default_factory=LatencyStats)
+    """Time of processing a debit note by a worker, from fetching it until it's accepted"""
+    debit_note_fetch: LatencyStats = field(default_factory=LatencyStats)
+    """Time of fetching a debit note"""
+    debit_note_acceptance: LatencyStats = field(default_factory=LatencyStats)
+    """Time of accepting a debit note"""
+    invoice_acceptance: LatencyStats = field(default_factory=LatencyStats)
+    """Time of an attempt to pay for an agreement after receiving its invoice"""
+    invoice_settlement: LatencyStats = field(default_factory=LatencyStats)
+    """Time from receiving an invoice until it's accepted, which may include waiting until
+    the agreement is payable"""
+
+    def __str__(self) -> str:
+        return ", ".join(
+            f"{name.replace('_', ' ')}: {getattr(self, name)}" for name in self.__dataclass_fields__
+        )
+
+
+@dataclass
+class ShutdownStats:
+    """Elapsed time of the phases of the engine's shutdown."""
+
+    phases: Dict[str, float] = field(default_factory=dict)
+    """Elapsed time of each phase in seconds, in the order in which the phases have finished.
+
+    Phases may overlap, e.g. the agreements of unfinished jobs are terminated while invoices
+    are being collected.
+    """
+    total: float = 0.0
+    """Elapsed time of the whole shutdown in seconds"""
+    deadline_exceeded: bool = False
+    """Whether some jobs haven't finished before the shutdown deadline"""
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Measure the elapsed time of the phase `name` of the shutdown."""
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.monotonic() - started_at
+
+    def __str__(self) -> str:
+        phases = "".join(f"{name}: {elapsed:.3f}s, " for name, elapsed in self.phases.items())
+        return f"{phases}total: {self.total:.3f}s"
+
+
 class _Engine:
     """Base execution engine containing functions common to all modes of operation."""
 
@@ -110,6 +189,12 @@ class _Engine:
         payment_token: Optional[str] = None,
         stream_output: bool = False,
         api_config: ApiConfig,
+        proposal_concurrency: int = DEFAULT_PROPOSAL_CONCURRENCY,
+        payment_parallelism: int = DEFAULT_PAYMENT_PARALLELISM,
+        payment_cursor_path: Optional[Union[str, Path]] = None,
+        payment_platforms: Optional[Sequence[str]] = None,
+        allocation_shards: int = 1,
+        shutdown_timeout: Optional[float] = None,
     ):
         """Initialize the engine.
 
@@ -129,12 +214,37 @@ class _Engine:
             network will be used
         :param stream_output: stream computation output from providers
         :param api_config: configuration of yagna low level api
+        :param proposal_concurrency: maximum number of offer proposals that each job scores,
+            and that it responds to or confirms, concurrently. Proposals rejected because
+            of their score don't count towards the latter limit
+        :param payment_parallelism: maximum number of debit notes processed (fetched, verified
+            and accepted), and of invoices fetched, concurrently
+        :param payment_cursor_path: path of a file in which the engine keeps the positions
+            of the processed invoice and debit note events and the ids of the unpaid agreements.
+            If the file exists, the engine processes the payment events starting from the saved
+            positions instead of from the moment it's started, and pays the invoices of
+            the agreements left unpaid
+        :param payment_platforms: names of the payment platforms between which the budget is
+            split, e.g. `erc20-polygon-glm`. Defaults to the single platform given by the payment
+            driver and network
+        :param allocation_shards: number of allocations between which the budget for each payment
+            platform is split. If the budget is split into more than one allocation, a part of it
+            is kept in reserve, to top up the platforms which use up their allocations
+        :param shutdown_timeout: deadline in seconds for the whole shutdown of the engine.
+            Jobs that don't finish in time have their agreements terminated, and the waits
+            for invoices and for the engine's services are cut short. By default, the jobs
+            are waited for without a limit
         """
         self._api_config = rest.Configuration(api_config)
         self._budget_amount = Decimal(budget)
-        self._budget_allocations: List[rest.payment.Allocation] = []
+        self._allocations = AllocationManager(
+            self._budget_amount, self._new_allocation, shards=allocation_shards
+        )
+        self._payment_platforms = list(payment_platforms) if payment_platforms else None
 
         self._strategy = strategy
+        self._score_cache = ScoreCache()
+        strategy.add_score_invalidation_listener(self._score_cache.invalidate)
         self._event_consumer = event_consumer
 
         self._subnet: Optional[str] = subnet_tag or DEFAULT_SUBNET
@@ -148,18 +258,38 @@ class _Engine:
             else TESTNET_TOKEN_NAME
         )
         self._stream_output = stream_output
+        if proposal_concurrency < 1:
+            raise ValueError(
+                f"`proposal_concurrency` must be a positive number, got {proposal_concurrency}"
+            )
+        self._proposal_concurrency = proposal_concurrency
+        if payment_parallelism < 1:
+            raise ValueError(
+                f"`payment_parallelism` must be a positive number, got {payment_parallelism}"
+            )
+        self._payment_parallelism = payment_parallelism
+        self.payment_stats = PaymentStats()
+        self._shutdown_timeout = shutdown_timeout
+        self.shutdown_stats = ShutdownStats()
+        self._payment_cursors = PaymentEventCursors(payment_cursor_path)
+        # Agreements left unpaid by a previous run of the engine that used the same cursor file.
+        # Their jobs are unknown to this engine, so their invoices are paid without any events.
+        self._resumed_agreements: Set[AgreementId] = set(self._payment_cursors.unpaid_agreements)
 
         # a set of `Job` instances used to track jobs - computations or services - started
         # it can be used to wait until all jobs are finished
         self._jobs: Set[Job] = set()
+        self._jobs_by_id: Dict[JobId, Job] = {}
 
         # initialize the payment structures
-        self._invoice_manager = InvoiceManager()
+        self._invoice_manager = InvoiceManager(
+            settlement_latency=self.payment_stats.invoice_settlement,
+            agreement_released=self._allocations.release_agreement,
+        )
 
-        self._agreements_accepting_debit_notes: Dict[JobId, Set[AgreementId]] = defaultdict(set)
-        self._num_debit_notes: Dict[ActivityId, int] = defaultdict(int)
-        self._num_payable_debit_notes: Dict[ActivityId, int] = defaultdict(int)
-        self._activity_created_at: Dict[ActivityId, datetime] = dict()
+        # The jobs that own the agreements for which debit notes should be accepted
+        self._agreements_accepting_debit_notes: Dict[AgreementId, Job] = {}
+        self._debit_note_rates = DebitNoteRateTracker()
         self._payment_closing: bool = False
         self._await_payments: bool = True
 
@@ -207,6 +337,38 @@ class _Engine:
         """Return the instance of `BaseMarketStrategy` used by this engine."""
         return self._strategy
 
+    @strategy.setter
+    def strategy(self, strategy: BaseMarketStrategy) -> None:
+        self._strategy = strategy
+        self._score_cache.invalidate()
+        strategy.add_score_invalidation_listener(self._score_cache.invalidate)
+
+    @property
+    def proposal_concurrency(self) -> int:
+        """Return the maximum number of proposals that each job handles concurrently."""
+        return self._proposal_concurrency
+
+    @property
+    def allocations(self) -> AllocationManager:
+        """Return the manager of the allocations used to pay for the jobs of this engine."""
+        return self._allocations
+
+    @property
+    def debit_note_rates(self) -> DebitNoteRateTracker:
+        """Return the tracker of the rate of debit notes received for the current activities."""
+        return self._debit_note_rates
+
+    async def score_offer(self, offer: OfferProposal) -> float:
+        """Score `offer` with the market strategy, reusing the cached score if possible."""
+        if not self._strategy.cache_scores:
+            return await self._strategy.score_offer(offer)
+
+        score = self._score_cache.get(offer.issuer, offer.props)
+        if score is None:
+            score = await self._strategy.score_offer(offer)
+            self._score_cache.put(offer.issuer, offer.props, score)
+        return score
+
     @property
     def subnet_tag(self) -> Optional[str]:
         """Return the name of the subnet used by this engine, or `None` if it is not set."""
@@ -226,12 +388,18 @@ class _Engine:
     def _emit_event(self, event: events.Event) -> None:
         self._event_consumer(event)
 
-    async def stop(self, *exc_info, wait_for_payments: bool = True) -> Optional[bool]:
+    async def stop(
+        self, *exc_info, wait_for_payments: bool = True, timeout: Optional[float] = None
+    ) -> Optional[bool]:
         """Stop the engine.
 
         This *must* be called at the end of the work, by the Engine user.
+
+        :param timeout: deadline for the shutdown in seconds, overrides `shutdown_timeout`
         """
         self._await_payments = wait_for_payments
+        if timeout is not None:
+            self._shutdown_timeout = timeout
         if exc_info[0] is not None:
             self.emit(events.ExecutionInterrupted, exc_info=exc_info)
         return await self._stack.__aexit__(None, None, None)
@@ -260,7 +428,9 @@ class _Engine:
         self._activity_api = rest.Activity(activity_client)
 
         payment_client = await stack.enter_async_context(self._api_config.payment())
-        self._payment_api = rest.Payment(payment_client)
+        self._payment_api = rest.Payment(
+            payment_client, debit_note_latency=self.payment_stats.debit_note_fetch
+        )
 
         net_client = await stack.enter_async_context(self._api_config.net())
         self._net_api = rest.Net(net_client)
@@ -281,6 +451,7 @@ class _Engine:
         self._process_invoices_job = loop.create_task(self._process_invoices())
         self._services.add(self._process_invoices_job)
         self._services.add(loop.create_task(self._process_debit_notes()))
+        self._services.add(loop.create_task(self._save_payment_cursors()))
 
         self._storage_manager = await stack.enter_async_context(gftp.provider())
 
@@ -292,23 +463,51 @@ class _Engine:
         await self._stack.enter_async_context(async_context_manager)
 
     async def _shutdown(self, *exc_info):
-        """Shutdown this Golem instance."""
+        """Shutdown this Golem instance.
+
+        If there's a shutdown deadline, the jobs that don't finish in time have their agreements
+        terminated while the invoices are collected, and the remaining waits are cut short.
+        The elapsed time of each phase is recorded in `shutdown_stats`.
+        """
 
         # Importing this at the beginning would cause circular dependencies
         from yapapi.log import pluralize
 
         logger.info("Golem is shutting down...")
-
-        # Some generators created by `execute_tasks` may still have elements;
-        # if we don't close them now, their jobs will never be marked as finished.
-
-        for gen in self._generators:
-            await gen.aclose()
+        stats = self.shutdown_stats
+        started_at = time.monotonic()
+        timeout = self._shutdown_timeout
+        deadline = None if timeout is None else started_at + timeout
+
+        def time_left(limit: Optional[float] = None) -> Optional[float]:
+            if deadline is None:
+                return limit
+            left = max(deadline - time.monotonic(), 0.0)
+            return left if limit is None else min(left, limit)
+
+        async def finish_jobs() -> None:
+            # Some generators created by `execute_tasks` may still have elements;
+            # if we don't close them now, their jobs will never be marked as finished.
+            await asyncio.gather(*[gen.aclose() for gen in list(self._generators)])
+            await asyncio.gather(*[job.finished.wait() for job in self._jobs])
 
         # Wait until all computations are finished
         logger.debug("Waiting for the jobs to finish...")
-        await asyncio.gather(*[job.finished.wait() for job in self._jobs])
-        logger.info("All jobs have finished")
+        with stats.phase("jobs"):
+            jobs_timeout = None
+            if timeout is not None:
+                jobs_timeout = time_left(timeout - min(FAST_STOP_TERMINATION_RESERVE, timeout / 2))
+            try:
+                await asyncio.wait_for(finish_jobs(), timeout=jobs_timeout)
+                logger.info("All jobs have finished")
+            except asyncio.TimeoutError:
+                stats.deadline_exceeded = True
+        unfinished_jobs = [job for job in self._jobs if not job.finished.is_set()]
+        if unfinished_jobs:
+            logger.warning(
+                "%s not finished before the shutdown deadline",
+                pluralize(len(unfinished_jobs), "job"),
+            )
 
         self._payment_closing = True
 
@@ -317,79 +516,133 @@ class _Engine:
             if task is not self._process_invoices_job:
                 task.cancel()
 
-        # Wait for some time for invoices for unpaid agreements,
-        # then cancel the invoices service
-        if self._process_invoices_job and self._await_payments:
-            unpaid_agreements = self._invoice_manager.payable_unpaid_agreement_ids
-            if unpaid_agreements:
-                logger.info(
-                    "%s still unpaid, waiting for invoices...",
-                    pluralize(len(unpaid_agreements), "agreement"),
-                )
+        async def terminate_agreements() -> None:
+            if not unfinished_jobs:
+                return
+            reason = {"message": "Shutdown deadline exceeded", "golem.requestor.code": "Cancelled"}
+            with stats.phase("agreements"):
                 try:
-                    await asyncio.wait_for(self._process_invoices_job, timeout=30)
+                    await asyncio.wait_for(
+                        asyncio.gather(
+                            *[job.agreements_pool.terminate_all(reason) for job in unfinished_jobs]
+                        ),
+                        timeout=time_left(),
+                    )
                 except asyncio.TimeoutError:
-                    logger.debug("process_invoices_job cancelled")
+                    logger.warning("Agreements of unfinished jobs not terminated before deadline")
+
+        # Wait for some time for invoices for unpaid agreements,
+        # then cancel the invoices service
+        async def collect_invoices() -> None:
+            if not (self._process_invoices_job and self._await_payments):
+                return
+            with stats.phase("payments"):
                 unpaid_agreements = self._invoice_manager.payable_unpaid_agreement_ids
                 if unpaid_agreements:
-                    logger.warning("Unpaid agreements: %s", unpaid_agreements)
-
+                    logger.info(
+                        "%s still unpaid, waiting for invoices...",
+                        pluralize(len(unpaid_agreements), "agreement"),
+                    )
+                    try:
+                        await asyncio.wait_for(
+                            self._process_invoices_job, timeout=time_left(INVOICE_WAIT_TIMEOUT)
+                        )
+                    except asyncio.TimeoutError:
+                        logger.debug("process_invoices_job cancelled")
+                    unpaid_agreements = self._invoice_manager.payable_unpaid_agreement_ids
+                    if unpaid_agreements:
+                        logger.warning("Unpaid agreements: %s", unpaid_agreements)
             self._process_invoices_job.cancel()
 
+        # The invoices for the agreements terminated here are collected as they arrive
+        await asyncio.gather(terminate_agreements(), collect_invoices())
+
+        with stats.phase("services"):
+            try:
+                logger.info("Waiting for Golem services to finish...")
+                _, pending = await asyncio.wait(
+                    self._services,
+                    timeout=time_left(SERVICES_WAIT_TIMEOUT),
+                    return_when=asyncio.ALL_COMPLETED,
+                )
+                if pending:
+                    logger.debug(
+                        "%s still running: %s", pluralize(len(pending), "service"), pending
+                    )
+            except Exception:
+                logger.debug("Got error when waiting for services to finish", exc_info=True)
+
         try:
-            logger.info("Waiting for Golem services to finish...")
-            _, pending = await asyncio.wait(
-                self._services, timeout=10, return_when=asyncio.ALL_COMPLETED
-            )
-            if pending:
-                logger.debug("%s still running: %s", pluralize(len(pending), "service"), pending)
-        except Exception:
-            logger.debug("Got error when waiting for services to finish", exc_info=True)
+            await self._payment_cursors.save_in_executor(force=True)
+        except OSError:
+            logger.warning("Failed to save the payment event cursors", exc_info=True)
+
+        stats.total = time.monotonic() - started_at
+        logger.info("Shutdown phases: %s", stats)
+
+    async def _save_payment_cursors(self) -> None:
+        """Save the payment event cursors every `save_interval` seconds, if they have changed.
+
+        The file is written in the default executor, so that the payment processing doesn't
+        wait for it, and a failed write is retried with the next save.
+        """
+        cursors = self._payment_cursors
+        if not cursors.path:
+            return
+        while True:
+            await asyncio.sleep(cursors.save_interval)
+            try:
+                await cursors.save_in_executor()
+            except OSError:
+                logger.warning("Failed to save the payment event cursors", exc_info=True)
 
     async def _id(self) -> str:
         async with self._root_api_session.get(f"{self._api_config.root_url}/me") as resp:
             return json.loads(await resp.text()).get("identity")
 
     async def _create_allocations(self) -> rest.payment.MarketDecoration:
-        if not self._budget_allocations:
-            platform = f"{self._payment_driver}-{self._payment_network}-{self._payment_token}"
-            address = await self._id()
-            allocation = cast(
-                rest.payment.Allocation,
-                await self._stack.enter_async_context(
-                    self._payment_api.new_allocation(
-                        self._budget_amount,
-                        payment_platform=platform,
-                        payment_address=address,
-                    )
-                ),
-            )
-            logger.debug("Creating allocation using payment platform `%s`", platform)
-            self._budget_allocations.append(allocation)
+        if not self._allocations.allocations:
+            platforms = self._payment_platforms or [
+                f"{self._payment_driver}-{self._payment_network}-{self._payment_token}"
+            ]
+            await self._allocations.create_allocations(platforms, await self._id())
 
-        allocation_ids = [allocation.id for allocation in self._budget_allocations]
+        allocation_ids = [allocation.id for allocation in self._allocations.allocations]
         return await self._payment_api.decorate_demand(allocation_ids)
 
-    def _get_allocation(
-        self, item: Union[rest.payment.DebitNote, rest.payment.Invoice]
+    async def _new_allocation(
+        self, platform: str, address: str, amount: Decimal
     ) -> rest.payment.Allocation:
-        try:
-            return next(
-                allocation
-                for allocation in self._budget_allocations
-                if allocation.payment_address == item.payer_addr
-                and allocation.payment_platform == item.payment_platform
-            )
-        except Exception:
-            raise ValueError(f"No allocation for {item.payment_platform} {item.payer_addr}.")
+        return cast(
+            rest.payment.Allocation,
+            await self._stack.enter_async_context(
+                self._payment_api.new_allocation(
+                    amount, payment_platform=platform, payment_address=address
+                )
+            ),
+        )
+
+    def _spend_on_invoice(
+        self, invoice: rest.payment.Invoice, amount: Decimal
+    ) -> AsyncContextManager[rest.payment.Allocation]:
+        job = self._invoice_manager.agreement_job(invoice.agreement_id)
+        return self._allocations.spend_on_invoice(invoice, amount, job.id)
 
     async def _process_invoices(self) -> None:
         """Process incoming invoices."""
 
         invoice_manager = self._invoice_manager
-        async for invoice in self._payment_api.incoming_invoices():
-            invoice_manager.add_invoice(invoice)
-            await self._agreement_payment_attempt(invoice.agreement_id)
+        cursor = self._payment_cursors.invoices
+        async for invoice in self._payment_api.incoming_invoices(
+            self._payment_parallelism, cursor=cursor
+        ):
+            with self.payment_stats.invoice_acceptance.measure():
+                if invoice.agreement_id in self._resumed_agreements:
+                    await self._pay_resumed_agreement(invoice)
+                else:
+                    invoice_manager.add_invoice(invoice)
+                    await self._agreement_payment_attempt(invoice.agreement_id)
+            cursor.processed(invoice.invoice_id)
             if self._payment_closing and not (
                 self._await_payments and invoice_manager.has_payable_unpaid_agreements
             ):
@@ -398,29 +651,69 @@ class _Engine:
     async def accept_payments_for_agreement(self, job_id: str, agreement_id: str) -> None:
         """Add given agreement to the set of agreements for which invoices should be accepted."""
         self._invoice_manager.set_payable(agreement_id)
+        self._payment_cursors.unpaid_agreements.add(agreement_id)
         await self._agreement_payment_attempt(agreement_id)
 
     async def _agreement_payment_attempt(self, agreement_id: str) -> None:
         invoice_manager = self._invoice_manager
         paid = await invoice_manager.attempt_payment(
-            agreement_id, self._get_allocation, self._strategy.invoice_accepted_amount
+            agreement_id, self._spend_on_invoice, self._strategy.invoice_accepted_amount
         )
         if paid:
             #   We've accepted the final invoice, so we can ignore debit notes
-            job_id = invoice_manager.agreement_job(agreement_id).id
-            assert agreement_id in self._agreements_accepting_debit_notes[job_id]
-            self._agreements_accepting_debit_notes[job_id].remove(agreement_id)
+            assert agreement_id in self._agreements_accepting_debit_notes
+            del self._agreements_accepting_debit_notes[agreement_id]
+            self._debit_note_rates.agreement_finished(agreement_id)
+            self._payment_cursors.unpaid_agreements.discard(agreement_id)
+
+    async def _pay_resumed_agreement(self, invoice: rest.payment.Invoice) -> None:
+        """Accept `invoice` of an agreement left unpaid by a previous run of the engine."""
+        agreement_id = invoice.agreement_id
+        try:
+            if invoice.status not in ACCEPTED_STATUSES:
+                accepted_amount = await self._strategy.invoice_accepted_amount(invoice)
+                if accepted_amount < Decimal(invoice.amount):
+                    logger.warning(
+                        "Ignored invoice %s for %s, we accept only %s",
+                        invoice.invoice_id,
+                        invoice.amount,
+                        accepted_amount,
+                    )
+                    self._allocations.release_agreement(agreement_id)
+                    return
+                async with self._allocations.spend_on_invoice(
+                    invoice, accepted_amount
+                ) as allocation:
+                    await invoice.accept(amount=accepted_amount, allocation=allocation)
+                logger.info(
+                    "Accepted invoice %s of agreement %s, left unpaid by a previous run",
+                    invoice.invoice_id,
+                    agreement_id,
+                )
+        except CancelledError:
+            raise
+        except Exception:
+            logger.error(
+                "Failed to accept invoice %s of agreement %s",
+                invoice.invoice_id,
+                agreement_id,
+                exc_info=True,
+            )
+            return
+        self._allocations.release_agreement(agreement_id)
+        self._resumed_agreements.discard(agreement_id)
+        self._payment_cursors.unpaid_agreements.discard(agreement_id)
 
     @staticmethod
     def _check_for_termination_reason(
-        activity_id: str, duration: float, num_notes: int, interval: int, payable: bool
+        activity_id: str, window: DebitNoteWindow, interval: int, payable: bool
     ) -> Optional[Dict[str, str]]:
-        freq_descr = f"{num_notes} notes/{duration}s"
+        freq_descr = f"{window.num_notes} notes/{window.duration}s"
         logger.debug(
             f"{'Payable Debit notes' if payable else 'Debit notes'} for activity"
             f" {activity_id}: {freq_descr}"
         )
-        if duration + DEBIT_NOTE_INTERVAL_GRACE_PERIOD < (num_notes - 1) * interval:
+        if window.duration + DEBIT_NOTE_INTERVAL_GRACE_PERIOD < (window.num_notes - 1) * interval:
             payable_str = "payable " if payable else ""
             reason = {
                 "message": f"Too many {payable_str}debit notes: {freq_descr} "
@@ -439,30 +732,25 @@ class _Engine:
         return None
 
     def _verify_debit_note_interval(
-        self, agreement: Agreement, debit_note: DebitNote, duration: float
+        self, agreement: Agreement, debit_note: DebitNote, window: DebitNoteWindow
     ):
         interval = agreement.get_requestor_property(PROP_DEBIT_NOTE_INTERVAL_SEC)
         logger.debug("Debit notes interval: %ss", interval)
         if interval:
             return self._check_for_termination_reason(
-                debit_note.activity_id,
-                duration,
-                self._num_debit_notes[debit_note.activity_id],
-                interval,
-                False,
+                debit_note.activity_id, window, interval, False
             )
 
-    def _verify_payment_timeout(self, agreement: Agreement, debit_note: DebitNote, duration: float):
+    def _verify_payment_timeout(
+        self, agreement: Agreement, debit_note: DebitNote, window: Optional[DebitNoteWindow]
+    ):
         payable_interval = agreement.get_requestor_property(PROP_PAYMENT_TIMEOUT_SEC)
         logger.debug("Payable debit notes interval: %ss", payable_interval)
         if debit_note.payment_due_date:
             if payable_interval:
+                assert window is not None
                 return self._check_for_termination_reason(
-                    debit_note.activity_id,
-                    duration,
-                    self._num_payable_debit_notes[debit_note.activity_id],
-                    payable_interval,
-                    True,
+                    debit_note.activity_id, window, payable_interval, True
                 )
             else:
                 msg = "Payable debit note received when mid-agreement payments inactive."
@@ -480,24 +768,22 @@ class _Engine:
         if not agreement or agreement.terminated:
             return False
 
-        self._num_debit_notes[debit_note.activity_id] += 1
-        if debit_note.payment_due_date:
-            self._num_payable_debit_notes[debit_note.activity_id] += 1
-
-        ts = datetime.now()
-        start_ts = self._activity_created_at.get(debit_note.activity_id)
-
-        if not start_ts:
+        if debit_note.activity_id not in self._debit_note_rates:
+            # The activity hasn't been started by us or has already been destroyed
             return False
 
-        duration = (ts - start_ts).total_seconds()
+        window, payable_window = self._debit_note_rates.debit_note_received(
+            debit_note.activity_id,
+            payable=bool(debit_note.payment_due_date),
+            timestamp=debit_note.timestamp.timestamp() if debit_note.timestamp else None,
+        )
 
-        # break agreement if the debit notes arrive too often
-        reason = self._verify_debit_note_interval(agreement, debit_note, duration)
+        # break agreement if the debit notes are issued too often
+        reason = self._verify_debit_note_interval(agreement, debit_note, window)
 
         # or if we're required to pay too often
         if not reason:
-            reason = self._verify_payment_timeout(agreement, debit_note, duration)
+            reason = self._verify_payment_timeout(agreement, debit_note, payable_window)
 
         # and if we found any reason for termination, do so...
         if reason:
@@ -507,48 +793,61 @@ class _Engine:
         return True
 
     async def _process_debit_notes(self) -> None:
-        """Process incoming debit notes."""
-        debit_note_processing_tasks: Dict[str, asyncio.Task] = {}
-        loop = asyncio.get_event_loop()
-
-        semaphore = asyncio.Semaphore(MAX_CONCURRENTLY_PROCESSED_DEBIT_NOTES)
+        """Process incoming debit notes.
 
-        async def _process_debit_note_wrapper(debit_note_id: str) -> None:
-            try:
-                await self._process_debit_note(debit_note_id)
-            finally:
-                debit_note_processing_tasks.pop(debit_note_id)
-                semaphore.release()
+        The debit notes are processed by a pool of `payment_parallelism` workers, so that
+        a burst of debit notes doesn't result in an unbounded number of concurrent API calls
+        and slow debit notes don't hold up the following ones.
+        """
+        queue: asyncio.Queue[Tuple[str, float]] = asyncio.Queue()
+        stats = self.payment_stats
+        cursor = self._payment_cursors.debit_notes
 
-        async for debit_note_id in self._payment_api.incoming_debit_note_ids():
-            await semaphore.acquire()
-            debit_note_processing_tasks[debit_note_id] = loop.create_task(
-                _process_debit_note_wrapper(debit_note_id)
-            )
-            if self._payment_closing:
-                any_agreement_accepts = any(self._agreements_accepting_debit_notes.values())
-                if not any_agreement_accepts:
-                    #   There are no agreements we're accepting debit notes for,
-                    #   and we're shutting down, so there will never be any again
-                    #   -> we can safely ignore all further incoming debit notes
-                    break
+        async def worker() -> None:
+            while True:
+                debit_note_id, received_at = await queue.get()
+                stats.debit_note_queue.record(time.monotonic() - received_at)
+                try:
+                    with stats.debit_note_processing.measure():
+                        await self._process_debit_note(debit_note_id)
+                except CancelledError:
+                    raise
+                except Exception:
+                    #   Not marked as processed, so the saved cursor doesn't move past it
+                    #   and it's processed again after a restart
+                    logger.error("Failed to process debit note %s", debit_note_id, exc_info=True)
+                else:
+                    cursor.processed(debit_note_id)
+                finally:
+                    queue.task_done()
 
-        if debit_note_processing_tasks:
-            await asyncio.gather(*debit_note_processing_tasks.values())
+        loop = asyncio.get_event_loop()
+        workers = [loop.create_task(worker()) for _ in range(self._payment_parallelism)]
+        try:
+            async for debit_note_id in self._payment_api.incoming_debit_note_ids(cursor=cursor):
+                queue.put_nowait((debit_note_id, time.monotonic()))
+                if self._payment_closing:
+                    if not self._agreements_accepting_debit_notes:
+                        #   There are no agreements we're accepting debit notes for,
+                        #   and we're shutting down, so there will never be any again
+                        #   -> we can safely ignore all further incoming debit notes
+                        break
+
+            await queue.join()
+        finally:
+            for task in workers:
+                task.cancel()
+            logger.debug("Debit note processing stats: %s", stats)
 
     async def _process_debit_note(self, debit_note_id: str) -> None:
         debit_note = await self._payment_api.debit_note(debit_note_id)
+        if debit_note.status in ACCEPTED_STATUSES:
+            # We've seen this debit note before, e.g. before a restart
+            logger.debug("Debit note %s has already been accepted", debit_note_id)
+            return
         agr_id = debit_note.agreement_id
-        job_id = next(
-            (
-                id
-                for id in self._agreements_accepting_debit_notes
-                if agr_id in self._agreements_accepting_debit_notes[id]
-            ),
-            None,
-        )
-        if job_id is not None:
-            job = self._get_job_by_id(job_id)
+        job = self._agreements_accepting_debit_notes.get(agr_id)
+        if job is not None:
             agreement = self._get_agreement_by_id(agr_id)
             job.emit(
                 events.DebitNoteReceived,
@@ -566,12 +865,16 @@ class _Engine:
                 return
 
             try:
-                allocation = self._get_allocation(debit_note)
                 accepted_amount = await self._strategy.debit_note_accepted_amount(debit_note)
-                if accepted_amount >= Decimal(debit_note.total_amount_due):
-                    await debit_note.accept(
-                        amount=debit_note.total_amount_due, allocation=allocation
-                    )
+                amount = Decimal(debit_note.total_amount_due)
+                if accepted_amount >= amount:
+                    async with self._allocations.spend_on_debit_note(
+                        debit_note, amount, job.id
+                    ) as allocation:
+                        with self.payment_stats.debit_note_acceptance.measure():
+                            await debit_note.accept(
+                                amount=debit_note.total_amount_due, allocation=allocation
+                            )
                     job.emit(
                         events.DebitNoteAccepted,
                         agreement=agreement,
@@ -594,19 +897,29 @@ class _Engine:
                     agreement=agreement,
                     exc_info=sys.exc_info(),
                 )
+        else:
+            #   Debit notes of the agreements of a previous run don't need to be accepted,
+            #   their invoices settle them
+            logger.debug(
+                "Ignored debit note %s of agreement %s, not used by this engine",
+                debit_note_id,
+                agr_id,
+            )
 
     def accept_debit_notes_for_agreement(self, job_id: str, agreement_id: str) -> None:
         """Add given agreement to the set of agreements for which debit notes should be accepted."""
-        self._agreements_accepting_debit_notes[job_id].add(agreement_id)
+        self._agreements_accepting_debit_notes[agreement_id] = self._get_job_by_id(job_id)
 
     def add_job(self, job: "Job"):
         """Register a job with this engine."""
         self._jobs.add(job)
+        self._jobs_by_id[job.id] = job
         job.emit(events.JobStarted)
 
     def finalize_job(self, job: "Job"):
         """Mark a job as finished."""
         job.finished.set()
+        self._invoice_manager.job_finished(job)
         job.emit(events.JobFinished, exc_info=job._exc_info)
 
     def register_generator(self, generator: AsyncGenerator) -> None:
@@ -677,7 +990,7 @@ class _Engine:
 
             job.emit(events.WorkerStarted, agreement=agreement)
 
-            activity_start_time = datetime.now()
+            activity_start_time = time.time()
 
             try:
                 if existing_activity_id:
@@ -697,7 +1010,9 @@ class _Engine:
             work_context = WorkContext(activity, agreement, self.storage_manager, emitter=job.emit)
             work_context.emit(events.ActivityCreated)
 
-            self._activity_created_at[activity.id] = activity_start_time
+            self._debit_note_rates.activity_started(
+                activity.id, agreement.id, started_at=activity_start_time
+            )
 
             allow_agreement_reuse = True
             keep_activity = False
@@ -719,7 +1034,7 @@ class _Engine:
                 await activity.destroy()
                 # Providers may issue debit notes after activity ends.
                 # This will prevent terminating agreements when this happens.
-                self._activity_created_at.pop(activity.id, None)
+                self._debit_note_rates.activity_finished(activity.id)
 
                 # and release the agreement
                 await job.agreements_pool.release_agreement(agreement.id, allow_agreement_reuse)
@@ -810,15 +1125,17 @@ class _Engine:
             Agreement
 
         We don't care which Job initiated recycling - it should be recycled by all unfinished Jobs.
+        The offer is queued with the incoming ones, so it's handled by the same bounded pools
+        of workers.
         """
         unfinished_jobs = (job for job in self._jobs if not job.finished.is_set())
         for job in unfinished_jobs:
-            asyncio.get_event_loop().create_task(job._handle_proposal(offer, ignore_draft=True))
+            job._recycle_proposal(offer)
 
     def _get_job_by_id(self, job_id) -> "Job":
         try:
-            return next(job for job in self._jobs if job.id == job_id)
-        except StopIteration:
+            return self._jobs_by_id[job_id]
+        except KeyError:
             raise KeyError(f"This _Engine doesn't know job with id {job_id}")
 
     def _get_agreement_by_id(self, agreement_id) -> Agreement:
@@ -828,6 +1145,66 @@ class _Engine:
             raise KeyError(f"This _Engine never used agreement with id {agreement_id}")
 
 
+@dataclass
+class ProposalStats:
+    """Statistics of the offer proposals handled by a single :class:`Job`."""
+
+    handled: int = 0
+    """Number of proposals handled (rejected, responded to or confirmed)"""
+    rejected_early: int = 0
+    """Number of proposals rejected right after scoring, without taking a response slot"""
+    max_queue_depth: int = 0
+    """Maximum number of proposals waiting to be scored or handled at the same time"""
+    total_wait_time: float = 0.0
+    """Total time the proposals spent waiting in the queues, in seconds"""
+    max_wait_time: float = 0.0
+    """Maximum time a proposal spent waiting in the queues, in seconds"""
+    total_handling_time: float = 0.0
+    """Total time spent handling the proposals after they've been taken from the queues"""
+    max_handling_time: float = 0.0
+    """Maximum time spent handling a single proposal"""
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def mean_wait_time(self) -> float:
+        return self.total_wait_time / self.handled if self.handled else 0.0
+
+    @property
+    def mean_handling_time(self) -> float:
+        return self.total_handling_time / self.handled if self.handled else 0.0
+
+    @property
+    def proposals_per_second(self) -> float:
+        """Rate at which the proposals have been handled since the job was created."""
+        elapsed = time.monotonic() - self.started_at
+        return self.handled / elapsed if elapsed > 0 else 0.0
+
+    def record(self, received_at: float, started_at: float, finished_at: float) -> None:
+        """Record the wait and handling times of a single proposal."""
+        wait_time = started_at - received_at
+        handling_time = finished_at - started_at
+        self.handled += 1
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        self.total_handling_time += handling_time
+        self.max_handling_time = max(self.max_handling_time, handling_time)
+
+
+@dataclass
+class WorkerStats:
+    """Statistics of the workers started for a single :class:`Job`."""
+
+    started: int = 0
+    """Number of workers started"""
+    time_to_full_capacity: Optional[float] = None
+    """Time from the start of the job's computation until the maximum number of workers
+    has been running for the first time, in seconds, or `None` if it's never been reached"""
+
+
+_QueuedProposal = Tuple[OfferProposal, float]
+"A proposal waiting to be scored, with the time it was received."
+
+
 class Job:
     """Functionality related to a single job.
 
@@ -870,7 +1247,16 @@ class Job:
 
         self.engine = engine
         self.offers_collected: int = 0
-        self.unscored_offers: asyncio.Queue[OfferProposal] = asyncio.Queue()
+        self.unscored_offers: asyncio.Queue[_QueuedProposal] = asyncio.Queue()
+        # Ids of the recycled proposals in `unscored_offers`, responded to even if they're drafts
+        self._recycled_proposal_ids: Set[str] = set()
+        # Scored proposals, waiting for a response or a rejection respectively
+        self._proposals_to_handle: asyncio.Queue[
+            Tuple[OfferProposal, Tuple[float, bool], float]
+        ] = asyncio.Queue()
+        self._proposals_to_reject: asyncio.Queue[Tuple[OfferProposal, str, float]] = asyncio.Queue()
+        self.proposal_stats = ProposalStats()
+        self.worker_stats = WorkerStats()
         self.proposals_confirmed: int = 0
         self.expiration_time: datetime = expiration_time
         self.payload: Payload = payload
@@ -895,35 +1281,31 @@ class Job:
         assert self._exc_info is None, "We can't have more than one exc_info ending a job"
         self._exc_info = exc_info
 
-    async def _handle_proposal(
-        self,
-        proposal: OfferProposal,
-        ignore_draft: bool = False,
-    ) -> events.Event:
-        """Handle a single `OfferProposal`.
-
-        A `proposal` is scored and then can be rejected, responded with
-        a counter-proposal or stored in an agreements pool to be used
-        for negotiating an agreement.
-
-        If `ignore_draft` is True, we either reject, or respond with a counter-proposal,
-        but never pass the proposal to the agreements pool.
-        """
+    @property
+    def proposal_queue_depth(self) -> int:
+        """Return the number of proposals waiting to be scored or handled."""
+        return (
+            self.unscored_offers.qsize()
+            + self._proposals_to_handle.qsize()
+            + self._proposals_to_reject.qsize()
+        )
 
-        async def reject_proposal(reason: str) -> events.ProposalRejected:
-            """Reject `proposal` due to given `reason`."""
-            await proposal.reject(reason)
-            return self.emit(events.ProposalRejected, proposal=proposal, reason=reason)
+    @property
+    def spending(self) -> JobSpending:
+        """Return the amount spent so far on the payments for this job, and its rate."""
+        return self.engine.allocations.spending(self.id)
 
+    async def _score_proposal(self, proposal: OfferProposal) -> Optional[float]:
+        """Score `proposal` with the market strategy, return `None` if the strategy fails."""
         try:
-            score = await self.engine._strategy.score_offer(proposal)
+            score = await self.engine.score_offer(proposal)
         except Exception:
             logger.warning(
                 "Strategy error: score_offer(proposal) failed when calling with proposal: %s",
                 proposal.id,
                 exc_info=True,
             )
-            return await reject_proposal("Unknown error in score offer")
+            return None
 
         logger.debug(
             "Scored offer %s, provider: %s, strategy: %s, score: %f",
@@ -932,13 +1314,45 @@ class Job:
             type(self.engine._strategy).__name__,
             score,
         )
+        return score
+
+    async def _reject_proposal(
+        self, proposal: OfferProposal, reason: str
+    ) -> events.ProposalRejected:
+        """Reject `proposal` due to given `reason`."""
+        await proposal.reject(reason)
+        return self.emit(events.ProposalRejected, proposal=proposal, reason=reason)
+
+    async def _handle_proposal(
+        self,
+        proposal: OfferProposal,
+        ignore_draft: bool = False,
+        score: Optional[float] = None,
+    ) -> events.Event:
+        """Handle a single `OfferProposal`.
+
+        A `proposal` is scored (unless its `score` is given) and then can be rejected,
+        responded with a counter-proposal or stored in an agreements pool to be used
+        for negotiating an agreement.
+
+        If `ignore_draft` is True, we either reject, or respond with a counter-proposal,
+        but never pass the proposal to the agreements pool.
+        """
+
+        def reject_proposal(reason: str) -> Awaitable[events.ProposalRejected]:
+            return self._reject_proposal(proposal, reason)
+
+        if score is None:
+            score = await self._score_proposal(proposal)
+            if score is None:
+                return await reject_proposal("Unknown error in score offer")
 
         if score < SCORE_NEUTRAL:
             return await reject_proposal("Score too low")
 
         if ignore_draft or not proposal.is_draft:
             assert self._demand_builder is not None
-            demand_builder = deepcopy(self._demand_builder)
+            demand_builder = self._demand_builder.derive()
 
             try:
                 demand_builder = await self.engine._strategy.respond_to_provider_offer(
@@ -957,7 +1371,7 @@ class Job:
                 # reject proposal if there are no common payment platforms
                 return await reject_proposal("No common payment platform")
 
-            await proposal.respond(demand_builder.properties, demand_builder.constraints)
+            await demand_builder.respond(proposal)
             return self.emit(events.ProposalResponded, proposal=proposal)
 
         else:
@@ -979,35 +1393,103 @@ class Job:
         async for proposal in proposals:
             self.emit(events.ProposalReceived, proposal=proposal)
             self.offers_collected += 1
-            self.unscored_offers.put_nowait(proposal)
+            self.unscored_offers.put_nowait((proposal, time.monotonic()))
+            self.proposal_stats.max_queue_depth = max(
+                self.proposal_stats.max_queue_depth, self.proposal_queue_depth
+            )
+
+    def _recycle_proposal(self, proposal: OfferProposal) -> None:
+        """Queue an already processed proposal to be scored and responded to again."""
+        self._recycled_proposal_ids.add(proposal.id)
+        self.unscored_offers.put_nowait((proposal, time.monotonic()))
 
     async def _handle_all_proposals(self) -> None:
-        max_number_of_tasks = 5
-        semaphore = asyncio.Semaphore(max_number_of_tasks)
+        """Score the incoming proposals and handle them with pools of workers.
+
+        Up to `proposal_concurrency` proposals are scored, and up to `proposal_concurrency`
+        scored ones are handled, at the same time. The ones with too low a score are rejected
+        by a separate pool of workers and don't delay the responses to the others.
+        """
+        loop = asyncio.get_event_loop()
+        workers = []
+        for _ in range(self.engine.proposal_concurrency):
+            workers.append(loop.create_task(self._proposal_scorer()))
+            workers.append(
+                loop.create_task(
+                    self._proposal_worker(self._proposals_to_handle, self._handle_scored)
+                )
+            )
+        for _ in range(MAX_CONCURRENT_PROPOSAL_REJECTIONS):
+            workers.append(
+                loop.create_task(
+                    self._proposal_worker(self._proposals_to_reject, self._reject_proposal)
+                )
+            )
+
+        try:
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            stats = self.proposal_stats
+            logger.debug(
+                "%s handled %d proposals (%.1f/s, %d rejected early), max queue depth: %d, "
+                "wait time mean/max: %.3fs/%.3fs, handling time mean/max: %.3fs/%.3fs",
+                self,
+                stats.handled,
+                stats.proposals_per_second,
+                stats.rejected_early,
+                stats.max_queue_depth,
+                stats.mean_wait_time,
+                stats.max_wait_time,
+                stats.mean_handling_time,
+                stats.max_handling_time,
+            )
 
+    async def _proposal_scorer(self) -> None:
+        """Score the proposals from `unscored_offers` and queue them to be handled or rejected."""
         while True:
-            proposal = await self.unscored_offers.get()
+            proposal, received_at = await self.unscored_offers.get()
+            recycled = proposal.id in self._recycled_proposal_ids
+            self._recycled_proposal_ids.discard(proposal.id)
+            score = await self._score_proposal(proposal)
+            if score is None:
+                reason = "Unknown error in score offer"
+                self._proposals_to_reject.put_nowait((proposal, reason, received_at))
+            elif score < SCORE_NEUTRAL:
+                self._proposals_to_reject.put_nowait((proposal, "Score too low", received_at))
+            else:
+                self._proposals_to_handle.put_nowait((proposal, (score, recycled), received_at))
 
-            async def handler(proposal_):
-                """Wrap `_handle_proposal()` method with error handling."""
-                try:
-                    event = await self._handle_proposal(proposal_)
-                    assert isinstance(event, events.ProposalEvent)
-                    if isinstance(event, events.ProposalConfirmed):
-                        self.proposals_confirmed += 1
-                except CancelledError:
-                    raise
-                except Exception:
-                    with contextlib.suppress(Exception):
-                        self.emit(
-                            events.ProposalFailed, proposal=proposal_, exc_info=sys.exc_info()
-                        )
-                finally:
-                    semaphore.release()
+    def _handle_scored(
+        self, proposal: OfferProposal, scored: Tuple[float, bool]
+    ) -> Awaitable[events.Event]:
+        score, recycled = scored
+        return self._handle_proposal(proposal, ignore_draft=recycled, score=score)
 
-            # Create a new handler task
-            await semaphore.acquire()
-            asyncio.get_event_loop().create_task(handler(proposal))
+    async def _proposal_worker(
+        self,
+        queue: "asyncio.Queue[Tuple[OfferProposal, Any, float]]",
+        handler: Callable[[OfferProposal, Any], Awaitable[events.Event]],
+    ) -> None:
+        """Call `handler` for the proposals from `queue`, with error handling."""
+        while True:
+            proposal, arg, received_at = await queue.get()
+            started_at = time.monotonic()
+            try:
+                event = await handler(proposal, arg)
+                assert isinstance(event, events.ProposalEvent)
+                if isinstance(event, events.ProposalConfirmed):
+                    self.proposals_confirmed += 1
+                if queue is self._proposals_to_reject:
+                    self.proposal_stats.rejected_early += 1
+            except CancelledError:
+                raise
+            except Exception:
+                with contextlib.suppress(Exception):
+                    self.emit(events.ProposalFailed, proposal=proposal, exc_info=sys.exc_info())
+            finally:
+                self.proposal_stats.record(received_at, started_at, time.monotonic())
 
     async def find_offers(self) -> None:
         """Create demand subscription and process offers.
@@ -1044,9 +1526,4 @@ class Job:
         }
         if not prov_platforms:
             prov_platforms = {"NGNT"}
-        req_platforms = {
-            allocation.payment_platform
-            for allocation in self.engine._budget_allocations
-            if allocation.payment_platform is not None
-        }
-        return req_platforms.intersection(prov_platforms)
+        return self.engine._allocations.payment_platforms.intersection(prov_platforms)
@@ -35,6 +35,15 @@ CFG_INVOICE_TIMEOUT: Final[timedelta] = timedelta(minutes=5)
 DEFAULT_EXECUTOR_TIMEOUT: Final[timedelta] = timedelta(minutes=15)
 "Joint timeout for all tasks submitted to an executor."
 
+DEFAULT_AGREEMENT_PARALLELISM: Final[int] = 5
+"Number of agreements negotiated concurrently when starting new workers."
+
+WORKER_STARTER_INTERVAL: Final[timedelta] = timedelta(seconds=2)
+"Interval of the periodic agreements pool check, in absence of any events that start workers."
+
+DEFAULT_TASK_PREFETCH: Final[int] = 1
+"Number of tasks read ahead from the input iterator before they're requested by the workers."
+
 
 logger = yapapi.utils.get_logger(__name__)
 
@@ -60,6 +69,8 @@ class Executor:
         implicit_init: bool,
         max_workers: int = 5,
         timeout: timedelta = DEFAULT_EXECUTOR_TIMEOUT,
+        task_prefetch: int = DEFAULT_TASK_PREFETCH,
+        agreement_parallelism: int = DEFAULT_AGREEMENT_PARALLELISM,
     ):
         logger.debug("Creating Executor instance; parameters: %s", locals())
 
@@ -68,6 +79,8 @@ class Executor:
         self._implicit_init = implicit_init
         self._timeout = timeout
         self._max_workers = max_workers
+        self._task_prefetch = task_prefetch
+        self._agreement_parallelism = agreement_parallelism
 
     @property
     def driver(self) -> str:
@@ -175,7 +188,7 @@ class Executor:
                     task._add_callback(on_task_done)
                     yield task
 
-        work_queue = SmartQueue(input_tasks())
+        work_queue = SmartQueue(input_tasks(), prefetch=self._task_prefetch)
 
         async def run_worker(work_context: WorkContext) -> bool:
             """Run an instance of `worker` for the particular work context."""
@@ -239,23 +252,80 @@ class Executor:
 
             return False
 
+        worker_finished = asyncio.Event()
+
+        async def start_worker() -> bool:
+            """Start a worker on a new or reused agreement, return `False` if none was available."""
+            new_task = None
+            try:
+                new_task = await self._engine.start_worker(job, run_worker)
+                if new_task is None:
+                    return False
+                workers.add(new_task)
+                job.worker_stats.started += 1
+                new_task.add_done_callback(lambda _: worker_finished.set())
+            except CancelledError:
+                raise
+            except Exception:
+                if new_task:
+                    new_task.cancel()
+                logger.debug("There was a problem during use_agreement", exc_info=True)
+            return True
+
         async def worker_starter() -> None:
-            while True:
-                await asyncio.sleep(2)
-                await job.agreements_pool.cycle()
-                if len(workers) < self._max_workers and work_queue.has_unassigned_items():
-                    new_task = None
+            """Start new workers whenever the agreements pool, the work queue or the workers change.
+
+            Up to `self._agreement_parallelism` workers are started concurrently.
+            """
+            started_at = loop.time()
+            at_full_capacity = False
+            no_agreements = False
+            starting: Set[asyncio.Task] = set()
+
+            try:
+                while True:
+                    worker_finished.clear()
+                    await job.agreements_pool.cycle()
+
+                    while (
+                        not no_agreements
+                        and len(starting) < self._agreement_parallelism
+                        and len(workers) + len(starting) < self._max_workers
+                        and work_queue.has_unassigned_items()
+                    ):
+                        starting.add(loop.create_task(start_worker()))
+
+                    if len(workers) >= self._max_workers and not at_full_capacity:
+                        elapsed = loop.time() - started_at
+                        if job.worker_stats.time_to_full_capacity is None:
+                            job.worker_stats.time_to_full_capacity = elapsed
+                        logger.debug("Started %d workers in %.3fs", len(workers), elapsed)
+                    at_full_capacity = len(workers) >= self._max_workers
+
+                    pool_changed = loop.create_task(job.agreements_pool.wait_for_changes())
+                    waiters = {pool_changed, loop.create_task(worker_finished.wait())}
+                    if not work_queue.has_unassigned_items():
+                        waiters.add(loop.create_task(work_queue.wait_for_unassigned_items()))
                     try:
-                        new_task = await self._engine.start_worker(job, run_worker)
-                        if new_task is None:
-                            continue
-                        workers.add(new_task)
-                    except CancelledError:
-                        raise
-                    except Exception:
-                        if new_task:
-                            new_task.cancel()
-                        logger.debug("There was a problem during use_agreement", exc_info=True)
+                        done, _ = await asyncio.wait(
+                            waiters.union(starting),
+                            timeout=WORKER_STARTER_INTERVAL.total_seconds(),
+                            return_when=asyncio.FIRST_COMPLETED,
+                        )
+                    finally:
+                        for waiter in waiters:
+                            waiter.cancel()
+
+                    # After a failed attempt, don't try to start more workers until new proposals
+                    # or free agreements appear in the pool, or until the next periodic check
+                    if any(not task.result() for task in done & starting):
+                        no_agreements = True
+                    if pool_changed in done or not done:
+                        no_agreements = False
+                    starting -= done
+            finally:
+                for task in starting:
+                    task.cancel()
 
         loop = asyncio.get_event_loop()
         find_offers_task = loop.create_task(job.find_offers())
@@ -1,14 +1,17 @@
 """YAPAPI internal module. This is not a part of the public API. It can change at any time."""
 
 import asyncio
+import itertools
 import logging
 from asyncio.locks import Condition, Lock
+from collections import OrderedDict
 from types import TracebackType
 from typing import (
     AsyncIterable,
     AsyncIterator,
     ContextManager,
     Dict,
+    FrozenSet,
     Generic,
     Optional,
     Set,
@@ -52,39 +55,66 @@ class Handle(Generic[Item]):
 
 
 class SmartQueue(Generic[Item]):
-    def __init__(self, items: AsyncIterator[Item]):
+    def __init__(self, items: AsyncIterator[Item], *, prefetch: int = 1):
         """Initialize instance.
 
         :param items: the items to be iterated over
+        :param prefetch: the maximum number of items read ahead from `items` before they're
+            requested by the consumers. When the buffer is full, `items` is not advanced until
+            a consumer takes an item from it.
         """
 
-        self._buffer: "asyncio.Queue[Item]" = asyncio.Queue(maxsize=1)
+        if prefetch < 1:
+            raise ValueError(f"`prefetch` must be a positive number, got {prefetch}")
+
+        self._buffer: "asyncio.Queue[Item]" = asyncio.Queue(maxsize=prefetch)
         self._incoming_finished = False
         self._buffer_task: Optional[asyncio.Task] = asyncio.get_event_loop().create_task(
             self._fill_buffer(items)
         )
 
-        """The items scheduled for reassignment to another consumer"""
-        self._rescheduled_items: Set[Handle[Item]] = set()
+        """The items scheduled for reassignment to another consumer, in the order of rescheduling,
+        mapped to the consumers they have been assigned before"""
+        self._rescheduled_items: "OrderedDict[Handle[Item], FrozenSet[Consumer[Item]]]" = (
+            OrderedDict()
+        )
+
+        """The rescheduled items, grouped by the consumers they have been assigned before
+        and mapped to the order of rescheduling"""
+        self._rescheduled_by_prev_consumers: Dict[
+            FrozenSet["Consumer[Item]"], "OrderedDict[Handle[Item], int]"
+        ] = {}
+        self._rescheduled_count = itertools.count()
 
         """The items currently assigned to consumers"""
         self._in_progress: Set[Handle[Item]] = set()
 
+        """The items currently assigned to consumers, indexed by the consumer"""
+        self._in_progress_by_consumer: Dict["Consumer[Item]", Set[Handle[Item]]] = {}
+
+        """The consumers waiting for an item, in the order of arrival"""
+        self._waiting: "OrderedDict[Consumer[Item], Condition]" = OrderedDict()
+
         # Synchronization primitives
         self._lock = Lock()
-        self._new_items = Condition(lock=self._lock)
         self._eof = Condition(lock=self._lock)
+        self._unassigned_items = asyncio.Event()
 
     async def _fill_buffer(self, incoming: AsyncIterator[Item]):
         try:
             async for item in incoming:
                 await self._buffer.put(item)
-                async with self._lock:
-                    self._new_items.notify_all()
+                self._unassigned_items.set()
+                # Consumers only wait when the buffer is empty, so it's enough to wake one up
+                # when the first item appears. If more items follow before it runs, it passes
+                # the notification on to the next waiting consumer (see `get()`).
+                if self._buffer.qsize() == 1 and self._waiting:
+                    async with self._lock:
+                        self.__notify_consumer()
             self._incoming_finished = True
             async with self._lock:
                 self._eof.notify_all()
-                self._new_items.notify_all()
+                self.__notify_all_consumers()
         except asyncio.CancelledError:
             pass
 
@@ -107,14 +137,63 @@ class SmartQueue(Generic[Item]):
         return Consumer(self)
 
     def __find_rescheduled_item(self, consumer: "Consumer[Item]") -> Optional[Handle[Item]]:
-        return next(
-            (
-                handle
-                for handle in self._rescheduled_items
-                if consumer not in handle._prev_consumers
-            ),
-            None,
-        )
+        # Only the oldest item of each group is checked, so the cost of the lookup depends on
+        # the number of distinct sets of previous consumers, not on the number of items.
+        found: Optional[Handle[Item]] = None
+        found_order = 0
+        for prev_consumers, handles in self._rescheduled_by_prev_consumers.items():
+            if consumer not in prev_consumers:
+                handle, order = next(iter(handles.items()))
+                if found is None or order < found_order:
+                    found, found_order = handle, order
+        return found
+
+    def __add_rescheduled_item(self, handle: Handle[Item]) -> None:
+        prev_consumers = frozenset(handle._prev_consumers)
+        self._rescheduled_items[handle] = prev_consumers
+        handles = self._rescheduled_by_prev_consumers.setdefault(prev_consumers, OrderedDict())
+        handles[handle] = next(self._rescheduled_count)
+
+    def __remove_rescheduled_item(self, handle: Handle[Item]) -> None:
+        prev_consumers = self._rescheduled_items.pop(handle)
+        handles = self._rescheduled_by_prev_consumers[prev_consumers]
+        del handles[handle]
+        if not handles:
+            del self._rescheduled_by_prev_consumers[prev_consumers]
+
+    def __notify_consumer(self, handle: Optional[Handle[Item]] = None) -> None:
+        """Wake up the longest waiting consumer that may be assigned `handle`.
+
+        If `handle` is `None` (that is, a new item is available) any waiting consumer may be woken.
+        """
+        for consumer, new_items in self._waiting.items():
+            if handle is None or consumer not in handle._prev_consumers:
+                del self._waiting[consumer]
+                new_items.notify()
+                return
+
+    def __pass_on_notification(self) -> None:
+        """Wake up another consumer for an item that the current one is not going to take."""
+        if self._buffer.qsize():
+            self.__notify_consumer()
+        elif self._rescheduled_items:
+            self.__notify_consumer(next(iter(self._rescheduled_items)))
+
+    def __notify_all_consumers(self) -> None:
+        for new_items in self._waiting.values():
+            new_items.notify()
+        self._waiting.clear()
+
+    def __start(self, handle: Handle[Item], consumer: "Consumer[Item]") -> None:
+        self._in_progress.add(handle)
+        self._in_progress_by_consumer.setdefault(consumer, set()).add(handle)
+
+    def __stop(self, handle: Handle[Item]) -> None:
+        self._in_progress.remove(handle)
+        consumer_items = self._in_progress_by_consumer[handle.consumer]
+        consumer_items.remove(handle)
+        if not consumer_items:
+            del self._in_progress_by_consumer[handle.consumer]
 
     async def get(self, consumer: "Consumer[Item]") -> Handle[Item]:
         """Get a handle to the next item to be processed (either a new one or rescheduled)."""
@@ -122,28 +201,40 @@ class SmartQueue(Generic[Item]):
             while not self.finished():
                 handle = self.__find_rescheduled_item(consumer)
                 if handle:
-                    self._rescheduled_items.remove(handle)
-                    self._in_progress.add(handle)
+                    self.__remove_rescheduled_item(handle)
                     handle.assign_consumer(consumer)
-                    return handle
+                    self.__start(handle, consumer)
+                elif self._buffer.qsize():
+                    handle = Handle(self._buffer.get_nowait(), consumer=consumer)
+                    self.__start(handle, consumer)
 
-                if self._buffer.qsize():
-                    next_elem = await self._buffer.get()
-                    handle = Handle(next_elem, consumer=consumer)
-                    self._in_progress.add(handle)
+                if handle:
+                    # This consumer may have been woken for an item other than the one it takes
+                    if self.has_unassigned_items():
+                        self.__pass_on_notification()
                     return handle
 
-                await self._new_items.wait()
-            self._new_items.notify_all()
+                new_items = self._waiting[consumer] = Condition(lock=self._lock)
+                try:
+                    await new_items.wait()
+                except BaseException:
+                    if consumer not in self._waiting:
+                        # We've been notified, but won't take the item
+                        self.__pass_on_notification()
+                    raise
+                finally:
+                    self._waiting.pop(consumer, None)
+            self.__notify_all_consumers()
         raise StopAsyncIteration
 
     async def mark_done(self, handle: Handle[Item]) -> None:
         """Mark an item, referred to by `handle`, as done."""
         assert handle in self._in_progress, "handle is not in progress"
         async with self._lock:
-            self._in_progress.remove(handle)
-            self._eof.notify_all()
-            self._new_items.notify_all()
+            self.__stop(handle)
+            if self.finished():
+                self._eof.notify_all()
+                self.__notify_all_consumers()
         if _logger.isEnabledFor(logging.DEBUG):
             stats = self.stats()
             _logger.debug("status: " + ", ".join(f"{key}: {val}" for key, val in stats.items()))
@@ -152,18 +243,19 @@ class SmartQueue(Generic[Item]):
         """Free the item for reassignment to another consumer."""
         assert handle in self._in_progress, "handle is not in progress"
         async with self._lock:
-            self._in_progress.remove(handle)
-            self._rescheduled_items.add(handle)
-            self._new_items.notify_all()
+            self.__stop(handle)
+            self.__add_rescheduled_item(handle)
+            self._unassigned_items.set()
+            self.__notify_consumer(handle)
 
     async def reschedule_all(self, consumer: "Consumer[Item]"):
         """Make all items currently assigned to the consumer available for reassignment."""
         async with self._lock:
-            handles = [handle for handle in self._in_progress if handle.consumer == consumer]
-            for handle in handles:
+            for handle in self._in_progress_by_consumer.pop(consumer, set()):
                 self._in_progress.remove(handle)
-                self._rescheduled_items.add(handle)
-            self._new_items.notify_all()
+                self.__add_rescheduled_item(handle)
+                self._unassigned_items.set()
+                self.__notify_consumer(handle)
 
     def stats(self) -> Dict:
         return {
@@ -171,9 +263,16 @@ class SmartQueue(Generic[Item]):
             "in progress": len(self._in_progress),
             "rescheduled": len(self._rescheduled_items),
             "in buffer": self._buffer.qsize(),
+            "waiting consumers": len(self._waiting),
             "incoming finished": self._incoming_finished,
         }
 
+    async def wait_for_unassigned_items(self) -> None:
+        """Wait until this queue has a new or rescheduled item immediately available."""
+        while not self.has_unassigned_items():
+            self._unassigned_items.clear()
+            await self._unassigned_items.wait()
+
     async def wait_until_done(self) -> None:
         """Wait until all items in the queue are processed."""
         async with self._lock:
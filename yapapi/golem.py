@@ -3,6 +3,7 @@ import json
 import sys
 from datetime import datetime, timedelta
 from decimal import Decimal
+from pathlib import Path
 from typing import (
     TYPE_CHECKING,
     Any,
@@ -24,7 +25,7 @@ import yapapi
 from yapapi import events
 from yapapi.config import ApiConfig
 from yapapi.ctx import WorkContext
-from yapapi.engine import _Engine
+from yapapi.engine import DEFAULT_PAYMENT_PARALLELISM, DEFAULT_PROPOSAL_CONCURRENCY, _Engine
 from yapapi.event_dispatcher import AsyncEventDispatcher
 from yapapi.executor import Executor
 from yapapi.executor.task import Task
@@ -53,6 +54,12 @@ class _EngineKwargs(TypedDict):
     payment_network: Optional[str]
     stream_output: bool
     api_config: ApiConfig
+    proposal_concurrency: int
+    payment_parallelism: int
+    payment_cursor_path: Optional[Union[str, Path]]
+    payment_platforms: Optional[List[str]]
+    allocation_shards: int
+    shutdown_timeout: Optional[float]
 
 
 class Golem:
@@ -101,6 +108,12 @@ class Golem:
         event_consumer: Optional[Callable[[events.Event], None]] = None,
         stream_output: bool = False,
         api_config: Optional[ApiConfig] = None,
+        proposal_concurrency: int = DEFAULT_PROPOSAL_CONCURRENCY,
+        payment_parallelism: int = DEFAULT_PAYMENT_PARALLELISM,
+        payment_cursor_path: Optional[Union[str, Path]] = None,
+        payment_platforms: Optional[List[str]] = None,
+        allocation_shards: int = 1,
+        shutdown_timeout: Optional[float] = None,
         # deprecate
         app_key: Optional[str] = None,
     ):
@@ -124,6 +137,26 @@ class Golem:
         :param api_config: configuration of yagna low level api including but not limited to
             `YAGNA_APPKEY`, `YAGNA_API_URL` variables
             See `:class:`yapapi.config.ApiConfig`` docs for more details
+        :param proposal_concurrency: maximum number of offer proposals that each job responds to
+            or confirms concurrently. Raising it helps on busy subnets, where proposals may
+            otherwise expire before they're responded to
+        :param payment_parallelism: maximum number of debit notes processed, and invoices
+            fetched, concurrently. Long-running services with mid-agreement payments may need
+            a higher value to keep up with the debit notes
+        :param payment_cursor_path: path of a file in which to keep the positions of the processed
+            invoice and debit note events, and the ids of the agreements left unpaid. When set,
+            a restarted requestor resumes processing the payment events where it left off,
+            and pays the invoices of the unpaid agreements, received in the meantime or later
+        :param payment_platforms: names of the payment platforms to split the budget between,
+            e.g. `["erc20-polygon-glm", "erc20-mainnet-glm"]`. Defaults to the single platform
+            given by `payment_driver` and `payment_network`
+        :param allocation_shards: number of allocations to split the budget for each payment
+            platform into, so that payments don't all use the same allocation. If the budget is
+            split into more than one allocation, a half of it is kept in reserve and used for
+            the platforms which run out of their allocations
+        :param shutdown_timeout: deadline in seconds for stopping Golem (a "fast stop"). Jobs that
+            don't finish in time have their agreements terminated, and Golem waits for invoices
+            only as long as the deadline allows. By default, Golem waits until all jobs finish
         :param app_key: optional Yagna application key. If not provided, the default is to get the
             value from `YAGNA_APPKEY` environment variable
         """
@@ -151,6 +184,12 @@ class Golem:
             "payment_network": payment_network,
             "stream_output": stream_output,
             "api_config": api_config,
+            "proposal_concurrency": proposal_concurrency,
+            "payment_parallelism": payment_parallelism,
+            "payment_cursor_path": payment_cursor_path,
+            "payment_platforms": payment_platforms,
+            "allocation_shards": allocation_shards,
+            "shutdown_timeout": shutdown_timeout,
         }
 
         self._engine: _Engine = self._get_new_engine()
@@ -231,7 +270,7 @@ class Golem:
             )
 
         self._engine_kwargs["strategy"] = strategy
-        self._engine._strategy = strategy
+        self._engine.strategy = strategy
 
     @property
     def subnet_tag(self) -> Optional[str]:
@@ -279,12 +318,17 @@ class Golem:
             await self._stop_with_exc_info(*sys.exc_info())
             raise
 
-    async def stop(self, wait_for_payments: bool = True) -> None:
+    async def stop(self, wait_for_payments: bool = True, timeout: Optional[float] = None) -> None:
         """Stop the Golem engine after it was started in non-contextmanager mode.
 
         Details: :func:`Golem.start()`
+
+        :param wait_for_payments: whether to wait for the invoices of the unpaid agreements
+        :param timeout: deadline for the shutdown in seconds, overrides `shutdown_timeout`
         """
-        await self._stop_with_exc_info(None, None, None, wait_for_payments=wait_for_payments)
+        await self._stop_with_exc_info(
+            None, None, None, wait_for_payments=wait_for_payments, timeout=timeout
+        )
 
     async def __aenter__(self) -> "Golem":
         await self.start()
@@ -294,10 +338,12 @@ class Golem:
         return await self._stop_with_exc_info(*exc_info)
 
     async def _stop_with_exc_info(
-        self, *exc_info, wait_for_payments: bool = True
+        self, *exc_info, wait_for_payments: bool = True, timeout: Optional[float] = None
     ) -> Optional[bool]:
         async with self._engine_state_lock:
-            res = await self._engine.stop(*exc_info, wait_for_payments=wait_for_payments)
+            res = await self._engine.stop(
+                *exc_info, wait_for_payments=wait_for_payments, timeout=timeout
+            )
             await self._event_dispatcher.stop()
 
         #   Engine that was stopped is not usable anymore, there is no "full" cleanup.
@@ -329,6 +375,8 @@ class Golem:
         timeout: Optional[timedelta] = None,
         job_id: Optional[str] = None,
         implicit_init: bool = True,
+        task_prefetch: Optional[int] = None,
+        agreement_parallelism: Optional[int] = None,
     ) -> AsyncIterator[Task[D, R]]:
         """Submit a sequence of tasks to be executed on providers.
 
@@ -351,6 +399,12 @@ class Golem:
         :param implicit_init: True -> :func:`~yapapi.script.Script.deploy()` and
             :func:`~yapapi.script.Script.start()` will be called internally by the
             :class:`Executor`. False -> those calls must be in the `worker` function
+        :param task_prefetch: maximum number of tasks read ahead from `data` before the workers
+            request them, passed to the :class:`Executor` instance. Increasing it lets many
+            workers that become ready at the same time get their tasks without waiting for
+            each other, at the cost of evaluating lazily generated `data` further ahead.
+        :param agreement_parallelism: maximum number of agreements negotiated concurrently
+            when starting new workers, passed to the :class:`Executor` instance
 
         :return: an async iterator that yields completed `Task` objects
 
@@ -378,6 +432,10 @@ class Golem:
             kwargs["max_workers"] = max_workers
         if timeout:
             kwargs["timeout"] = timeout
+        if task_prefetch:
+            kwargs["task_prefetch"] = task_prefetch
+        if agreement_parallelism:
+            kwargs["agreement_parallelism"] = agreement_parallelism
 
         executor = Executor(_engine=self._engine, **kwargs)
         async for t in executor.submit(worker, data, job_id=job_id):
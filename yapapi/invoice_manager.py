@@ -1,12 +1,25 @@
 import logging
 import sys
+import time
 from asyncio import CancelledError
+from collections import OrderedDict
 from decimal import Decimal
-from typing import TYPE_CHECKING, Awaitable, Callable, Dict, Optional, Set
+from typing import (
+    TYPE_CHECKING,
+    AsyncContextManager,
+    Awaitable,
+    Callable,
+    Dict,
+    Final,
+    Optional,
+    Set,
+)
 
 from dataclasses import dataclass
 
 from yapapi import events
+from yapapi.rest.payment import ACCEPTED_STATUSES
+from yapapi.utils import LatencyStats
 
 if TYPE_CHECKING:
     from yapapi.engine import Job
@@ -15,6 +28,9 @@ if TYPE_CHECKING:
 
 logger = logging.getLogger(__name__)
 
+SETTLED_AGREEMENTS_KEPT: Final[int] = 1000
+"Number of the most recently paid agreements whose data is kept, to recognize repeated invoices."
+
 
 @dataclass
 class AgreementData:
@@ -23,35 +39,96 @@ class AgreementData:
     invoice: Optional["Invoice"] = None
     payable: bool = False
     paid: bool = False
+    invoice_received_at: Optional[float] = None
 
 
 class InvoiceManager:
-    def __init__(self):
+    """Keeps track of the invoices of the agreements and of their payment.
+
+    Agreements that are payable but not paid yet are tracked in a set that's updated on every
+    state transition, so checking for them doesn't depend on the number of agreements.
+    Once an agreement is paid, its data is moved to a bounded collection of settled agreements,
+    so that the memory used by a long-running engine doesn't grow with every agreement made.
+    """
+
+    def __init__(
+        self,
+        settled_agreements_kept: int = SETTLED_AGREEMENTS_KEPT,
+        settlement_latency: Optional[LatencyStats] = None,
+        agreement_released: Optional[Callable[[str], None]] = None,
+    ):
+        """Initialize the invoice manager.
+
+        :param settled_agreements_kept: number of the most recently paid agreements to keep
+        :param settlement_latency: if given, the times from receiving invoices until they're
+            accepted are recorded in it
+        :param agreement_released: if given, it's called with the id of each agreement
+            whose payment is settled or abandoned, that is, whose invoice is accepted or
+            ignored, or that isn't payable when its job finishes
+        """
         self._agreement_data: Dict[str, AgreementData] = {}
+        self._payable_unpaid: Set[str] = set()
+        self._settled: "OrderedDict[str, AgreementData]" = OrderedDict()
+        self._settled_agreements_kept = settled_agreements_kept
+        self.num_settled = 0
+        "Total number of agreements paid."
+        self._settlement_latency = settlement_latency
+        self._agreement_released = agreement_released
 
     @property
     def payable_unpaid_agreement_ids(self) -> Set[str]:
-        return set(
-            ad.agreement.id for ad in self._agreement_data.values() if ad.payable and not ad.paid
-        )
+        return set(self._payable_unpaid)
 
     @property
     def has_payable_unpaid_agreements(self) -> bool:
-        return any(ad.payable and not ad.paid for ad in self._agreement_data.values())
+        return bool(self._payable_unpaid)
 
     def add_agreement(self, job: "Job", agreement: "Agreement") -> None:
         """Inform the InvoiceManager about a new agreement (so that we can use the agreement_id in \
         the future)."""
 
         self._agreement_data[agreement.id] = AgreementData(agreement, job)
+        self._payable_unpaid.discard(agreement.id)
+        self._settled.pop(agreement.id, None)
+
+    def job_finished(self, job: "Job") -> None:
+        """Forget the agreements of a finished job that haven't been made payable.
+
+        Their invoices are never going to be accepted, so their payment is abandoned.
+        """
+        for agreement_id, ad in list(self._agreement_data.items()):
+            if ad.job is job and not ad.payable:
+                del self._agreement_data[agreement_id]
+                if self._agreement_released:
+                    self._agreement_released(agreement_id)
 
     def agreement_job(self, agreement_id: str) -> "Job":
         #   NOTE: this has nothing to do with InvoiceManaging and is supposed to disappear
         #         once (if) we have a DebitNote manager
-        return self._agreement_data[agreement_id].job
+        return self._get_agreement_data(agreement_id).job
+
+    def _get_agreement_data(self, agreement_id: str) -> AgreementData:
+        ad = self._agreement_data.get(agreement_id) or self._settled.get(agreement_id)
+        if ad is None:
+            raise KeyError(agreement_id)
+        return ad
+
+    def _set_paid(self, ad: AgreementData) -> None:
+        agreement_id = ad.agreement.id
+        ad.paid = True
+        self.num_settled += 1
+        self._payable_unpaid.discard(agreement_id)
+        del self._agreement_data[agreement_id]
+        self._settled[agreement_id] = ad
+        while len(self._settled) > self._settled_agreements_kept:
+            self._settled.popitem(last=False)
+        if self._agreement_released:
+            self._agreement_released(agreement_id)
 
     def add_invoice(self, invoice: "Invoice") -> None:
-        ad = self._agreement_data.get(invoice.agreement_id)
+        ad = self._agreement_data.get(invoice.agreement_id) or self._settled.get(
+            invoice.agreement_id
+        )
         if ad:
             ad.job.emit(events.InvoiceReceived, agreement=ad.agreement, invoice=invoice)
             if ad.invoice or ad.paid:
@@ -59,21 +136,29 @@ class InvoiceManager:
                 return
             else:
                 ad.invoice = invoice
+                ad.invoice_received_at = time.monotonic()
         else:
             #   We don't know this agreement
             #   -> this invoice has nothing to do with the current execution
             #   -> we just ignore it (maybe it deserves payment, but we've no way to check)
             #   ALSO: we're not even emitting InvoiceReceived event, as it requires and Agreement
             #   object, and a proper Agreement doesn't exist --> possible TODO.
-            pass
+            logger.debug(
+                "Ignored invoice %s of agreement %s, not used by this engine",
+                invoice.invoice_id,
+                invoice.agreement_id,
+            )
 
     def set_payable(self, agreement_id: str) -> None:
-        self._agreement_data[agreement_id].payable = True
+        ad = self._get_agreement_data(agreement_id)
+        if not ad.payable and not ad.paid:
+            self._payable_unpaid.add(agreement_id)
+        ad.payable = True
 
     async def attempt_payment(
         self,
         agreement_id: str,
-        get_allocation: Callable[["Invoice"], "Allocation"],
+        spend_on_invoice: Callable[["Invoice", Decimal], AsyncContextManager["Allocation"]],
         get_accepted_amount: Callable[["Invoice"], Awaitable[Decimal]],
     ) -> bool:
         ad = self._agreement_data.get(agreement_id)
@@ -81,11 +166,18 @@ class InvoiceManager:
             return False
 
         invoice = ad.invoice
+        if invoice.status in ACCEPTED_STATUSES:
+            #   We've accepted the invoice before, e.g. before a restart
+            self._set_paid(ad)
+            return True
+
         try:
-            allocation = get_allocation(invoice)
             accepted_amount = await get_accepted_amount(invoice)
             if accepted_amount >= Decimal(invoice.amount):
-                await invoice.accept(amount=accepted_amount, allocation=allocation)
+                async with spend_on_invoice(invoice, accepted_amount) as allocation:
+                    await invoice.accept(amount=accepted_amount, allocation=allocation)
+                if self._settlement_latency is not None and ad.invoice_received_at is not None:
+                    self._settlement_latency.record(time.monotonic() - ad.invoice_received_at)
                 ad.job.emit(
                     events.InvoiceAccepted,
                     agreement=ad.agreement,
@@ -110,5 +202,5 @@ class InvoiceManager:
             )
             return False
         else:
-            ad.paid = True
+            self._set_paid(ad)
             return True
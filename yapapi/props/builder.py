@@ -5,7 +5,7 @@ from typing import List
 
 from dataclasses import asdict
 
-from ..rest.market import Market, Subscription
+from ..rest.market import Market, OfferProposal, Subscription
 from . import Model
 from .base import constraint_model_serialize, join_str_constraints
 
@@ -44,6 +44,18 @@ class DemandBuilder:
     def __repr__(self):
         return repr({"properties": self._properties, "constraints": self._constraints})
 
+    def derive(self) -> "DemandBuilder":
+        """Return a copy of this demand definition that can be modified independently.
+
+        Unlike `deepcopy()`, this copies only the dictionary of properties, not their values.
+        The values are shared with this builder, so they should be replaced rather than
+        modified in place.
+        """
+        derived = DemandBuilder()
+        derived._properties = dict(self._properties)
+        derived._constraints = list(self._constraints)
+        return derived
+
     @property
     def properties(self) -> dict:
         """List of properties for this demand."""
@@ -83,6 +95,10 @@ class DemandBuilder:
         """Create a Demand on the market and subscribe to Offers that will match that Demand."""
         return await market.subscribe(self._properties, self.constraints)
 
+    async def respond(self, proposal: OfferProposal) -> str:
+        """Respond to `proposal` with a counter-proposal based on this demand definition."""
+        return await proposal.respond(self._properties, self.constraints)
+
     async def decorate(self, *decorators: "DemandDecorator"):
         for decorator in decorators:
             await decorator.decorate_demand(self)
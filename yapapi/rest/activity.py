@@ -1,5 +1,6 @@
 import abc
 import asyncio
+import contextlib
 import json
 import logging
 from datetime import datetime, timedelta, timezone
@@ -11,12 +12,13 @@ from typing import (
     Dict,
     List,
     Optional,
+    Set,
     Tuple,
     Type,
 )
 
+import aiohttp
 from aiohttp import ClientPayloadError
-from aiohttp_sse_client.client import MessageEvent
 from dataclasses import dataclass
 
 from ya_activity import ApiClient, ApiException, RequestorControlApi, RequestorStateApi
@@ -74,6 +76,7 @@ class Activity(AsyncContextManager["Activity"]):
         self._state: RequestorStateApi = _state
         self._id: str = activity_id
         self._stream_events = stream_events
+        self._event_stream: Optional[ActivityEventStream] = None
 
     @property
     def id(self) -> str:
@@ -92,6 +95,13 @@ class Activity(AsyncContextManager["Activity"]):
         usage: yaa.ActivityUsage = await self._state.get_activity_usage(self._id)
         return usage
 
+    @property
+    def event_stream(self) -> "ActivityEventStream":
+        """Return the connection used to stream the events of this activity's batches."""
+        if self._event_stream is None:
+            self._event_stream = ActivityEventStream(self)
+        return self._event_stream
+
     async def send(self, script: List[dict], deadline: Optional[datetime] = None) -> "Batch":
         """Send the execution script to the provider's execution unit."""
         script_txt = json.dumps(script)
@@ -108,6 +118,9 @@ class Activity(AsyncContextManager["Activity"]):
             _log.debug("Activity %s destroyed successfully", self._id)
         except yexc.ApiException:
             _log.debug("Got API Exception when destroying activity %s", self._id, exc_info=True)
+        finally:
+            if self._event_stream:
+                await self._event_stream.close()
 
     async def __aenter__(self) -> "Activity":
         return self
@@ -218,8 +231,19 @@ def _is_gsb_endpoint_not_found_error(err: ApiException) -> bool:
         return False
 
 
+def _may_be_caused_by_termination(err: ApiException) -> bool:
+    """Check if `err` may be caused by the activity being terminated by the provider."""
+
+    return not err.status or err.status == 404 or err.status >= 500
+
+
 class PollingBatch(Batch):
-    """A `Batch` implementation that polls the server repeatedly for command status."""
+    """A `Batch` implementation that polls the server repeatedly for command status.
+
+    The server is asked to wait for the next command to finish (long polling), and asked again
+    right away when it returns new results or has waited for them. A server that returns
+    no new results at once is polled with exponentially growing intervals instead.
+    """
 
     GET_EXEC_BATCH_RESULTS_MAX_TRIES = 3
     """Max number of attempts to call GetExecBatchResults if a GSB error occurs."""
@@ -227,6 +251,18 @@ class PollingBatch(Batch):
     GET_EXEC_BATCH_RESULTS_INTERVAL = 3.0
     """Time in seconds before retrying GetExecBatchResults after a GSB error occurs."""
 
+    POLL_TIMEOUT = 5.0
+    """Max time in seconds for which the server is asked to wait for the next command to finish."""
+
+    MIN_POLL_INTERVAL = 0.05
+    """Time in seconds before the first repeated call, if a call returns no new results at once."""
+
+    MAX_POLL_INTERVAL = 3.0
+    """Max time in seconds between calls to GetExecBatchResults that return no new results."""
+
+    POLL_BACKOFF = 2.0
+    """Factor by which the time between calls grows with each call returning no new results."""
+
     async def _activity_terminated(self) -> Tuple[bool, Optional[str], Optional[str]]:
         """Check if the activity we're using is in "Terminated" state."""
         try:
@@ -236,24 +272,32 @@ class PollingBatch(Batch):
             _log.debug("Cannot query activity state", exc_info=True)
             return False, None, None
 
-    async def _get_results(self, timeout: float) -> List[yaa.ExeScriptCommandResult]:
-        """Call GetExecBatchResults with re-trying on "Endpoint address not found" GSB error."""
+    async def _get_results(
+        self, timeout: float, command_index: Optional[int] = None
+    ) -> List[yaa.ExeScriptCommandResult]:
+        """Call GetExecBatchResults with re-trying on "Endpoint address not found" GSB error.
+
+        :param command_index: if given, the server is asked to wait until the command with this
+            index is finished, but for at most `timeout` seconds
+        """
 
         for n in range(self.GET_EXEC_BATCH_RESULTS_MAX_TRIES, 0, -1):
             try:
                 results = await self._activity._api.get_exec_batch_results(
                     self._activity._id,
                     self._batch_id,
-                    timeout=min(timeout, 5),
-                    _request_timeout=min(timeout, 5) + 0.5,
+                    command_index=command_index,
+                    timeout=timeout,
+                    _request_timeout=timeout + 0.5,
                 )
                 return results
             except ApiException as err:
-                terminated, reason, error_msg = await self._activity_terminated()
-                if terminated:
-                    raise BatchError("Activity terminated by provider", reason, error_msg)
-                    # TODO: add and use a new Exception class (subclass of BatchError)
-                    # to indicate closing the activity by the provider
+                if _may_be_caused_by_termination(err):
+                    terminated, reason, error_msg = await self._activity_terminated()
+                    if terminated:
+                        raise BatchError("Activity terminated by provider", reason, error_msg)
+                        # TODO: add and use a new Exception class (subclass of BatchError)
+                        # to indicate closing the activity by the provider
                 if not _is_gsb_endpoint_not_found_error(err):
                     raise err
                 msg = "GetExecBatchResults failed due to GSB error"
@@ -271,16 +315,20 @@ class PollingBatch(Batch):
         return []
 
     async def __aiter__(self) -> AsyncIterator[CommandEventData]:
+        loop = asyncio.get_event_loop()
         last_idx = 0
+        interval = 0.0
 
         while last_idx < self._size:
             timeout = self.seconds_left()
             if timeout <= 0:
                 raise BatchTimeoutError()
 
+            poll_timeout = min(timeout, self.POLL_TIMEOUT)
+            polled_at = loop.time()
             results: List[yaa.ExeScriptCommandResult] = []
             async with SuppressedExceptions(is_intermittent_error):
-                results = await self._get_results(timeout=min(timeout, 5))
+                results = await self._get_results(timeout=poll_timeout, command_index=last_idx)
 
             any_new: bool = False
             results = results[last_idx:]
@@ -300,58 +348,225 @@ class PollingBatch(Batch):
                 last_idx = result.index + 1
                 if result.is_batch_finished:
                     break
-            if not any_new:
-                delay = min(3, max(0, self.seconds_left()))
-                await asyncio.sleep(delay)
 
+            if any_new or loop.time() - polled_at >= poll_timeout / 2:
+                #   Either there's progress, or the server has waited for it (long polling),
+                #   so there's no need to wait before the next call
+                interval = 0.0
+            else:
+                interval = min(
+                    max(interval * self.POLL_BACKOFF, self.MIN_POLL_INTERVAL),
+                    self.MAX_POLL_INTERVAL,
+                )
+                await asyncio.sleep(min(interval, max(0, self.seconds_left())))
 
-class StreamingBatch(Batch):
-    """A `Batch` implementation that uses event streaming to return command status."""
 
-    async def __aiter__(self) -> AsyncIterator[CommandEventData]:
-        from aiohttp_sse_client import client as sse_client
+class ActivityEventStream:
+    """A persistent connection for streaming the events of an activity's batches.
 
-        api_client = self._activity._api.api_client
-        host = api_client.configuration.host
-        headers = api_client.default_headers
+    Yagna streams the events of each batch from a separate endpoint, so all batches of an
+    activity share a single `aiohttp.ClientSession` instead: its keep-alive connections are
+    reused from one batch to the next and the request headers, including the authorization,
+    are built once. If the stream of a batch breaks before the batch is finished, it's resumed:
+    the commands finished in the meantime are fetched with GetExecBatchResults and the events
+    already returned before the break are skipped.
+    """
 
-        api_client.update_params_for_auth(headers, None, ["app_key"])
+    MAX_RESUMES = 5
+    """Max number of times the stream of a single batch is resumed after it breaks."""
 
-        activity_id = self._activity._id
-        batch_id = self._batch_id
-        last_idx = self._size - 1
+    RESUME_INTERVAL = 0.5
+    """Time in seconds before resuming a broken stream."""
 
-        evt_src_endpoint = f"{host}/activity/{activity_id}/exec/{batch_id}"
+    DRAIN_TIMEOUT = 1.0
+    """Time in seconds to wait for the end of the stream of a finished batch.
 
-        async with sse_client.EventSource(
-            evt_src_endpoint,
-            headers=headers,
-            timeout=self.seconds_left(),
-        ) as event_source:
-            try:
-                async for msg_event in event_source:
-                    try:
-                        event_class, kwargs = _message_event_to_event_data(msg_event)
-                    except Exception as exc:  # noqa
-                        _log.error(f"Event stream exception (batch {batch_id}): {exc}")
-                    else:
-                        yield event_class, kwargs
+    Only a stream read to its end leaves the connection open for the next batch. The stream
+    is drained in the background, after the events of the batch have been returned.
+    """
 
-                        if event_class is events.CommandExecuted and (
-                            kwargs["cmd_idx"] >= last_idx or not kwargs["success"]
+    def __init__(self, activity: Activity):
+        self._activity = activity
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._drains: Set[asyncio.Task] = set()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            api_client = self._activity._api.api_client
+            headers = dict(api_client.default_headers)
+            api_client.update_params_for_auth(headers, None, ["app_key"])
+            headers["Accept"] = "text/event-stream"
+            headers["Cache-Control"] = "no-cache"
+            self._session = aiohttp.ClientSession(headers=headers)
+        return self._session
+
+    async def close(self) -> None:
+        """Close the connections of this stream."""
+        for drain in self._drains:
+            drain.cancel()
+        await asyncio.gather(*self._drains, return_exceptions=True)
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def _missed_results(self, batch: "StreamingBatch", next_idx: int) -> List[Any]:
+        """Return the results of the commands of `batch` from `next_idx` finished so far."""
+        try:
+            results = await self._activity._api.get_exec_batch_results(
+                self._activity._id, batch.id, timeout=0, _request_timeout=5
+            )
+        except (ApiException, asyncio.TimeoutError, aiohttp.ClientError):
+            _log.debug("Cannot get the results of batch %s", batch.id, exc_info=True)
+            return []
+        return [result for result in results if result.index >= next_idx]
+
+    @contextlib.asynccontextmanager
+    async def _connect(
+        self, batch: "StreamingBatch", last_event_id: Optional[str]
+    ) -> AsyncIterator[aiohttp.ClientResponse]:
+        api_client = self._activity._api.api_client
+        url = f"{api_client.configuration.host}/activity/{self._activity._id}/exec/{batch.id}"
+        headers = {"Last-Event-Id": last_event_id} if last_event_id else None
+        timeout = aiohttp.ClientTimeout(total=batch.seconds_left())
+        response = await self._get_session().get(url, headers=headers, timeout=timeout)
+        try:
+            if response.status != 200:
+                raise ConnectionError(f"fetch {url} failed: {response.status}")
+            yield response
+        except BaseException:
+            response.close()
+            raise
+        drain = asyncio.create_task(self._drain(response))
+        self._drains.add(drain)
+        drain.add_done_callback(self._drains.discard)
+
+    async def _drain(self, response: aiohttp.ClientResponse) -> None:
+        try:
+            await asyncio.wait_for(response.content.read(), self.DRAIN_TIMEOUT)
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            pass
+        finally:
+            #   Closes the connection unless the stream has been read to its end
+            response.release()
+
+    async def batch_events(self, batch: "StreamingBatch") -> AsyncIterator[CommandEventData]:
+        """Stream the events of `batch`, resuming the stream after it breaks."""
+
+        last_idx = batch._size - 1
+        #   Index of the first command whose `CommandExecuted` event hasn't been returned yet,
+        #   and of the last command whose `CommandStarted` event has been returned
+        next_idx = 0
+        started_idx = -1
+        last_event_id: Optional[str] = None
+        resumes = 0
+
+        while True:
+            if batch.seconds_left() <= 0:
+                raise BatchTimeoutError()
+            try:
+                async with self._connect(batch, last_event_id) as response:
+                    async for msg_event in _read_message_events(response):
+                        if msg_event.last_event_id:
+                            last_event_id = msg_event.last_event_id
+                        try:
+                            event_class, kwargs = _message_event_to_event_data(msg_event)
+                        except Exception as exc:  # noqa
+                            _log.error(f"Event stream exception (batch {batch.id}): {exc}")
+                            continue
+
+                        idx = kwargs["cmd_idx"]
+                        if idx < next_idx or (
+                            event_class is events.CommandStarted and idx <= started_idx
                         ):
-                            break
+                            #   Returned before the stream was resumed
+                            continue
+                        yield event_class, kwargs
 
-            except ClientPayloadError as exc:
-                _log.error(f"Event payload error (batch {batch_id}): {exc}")
-            except ConnectionError:
-                raise
+                        if event_class is events.CommandStarted:
+                            started_idx = idx
+                        elif event_class is events.CommandExecuted:
+                            next_idx = idx + 1
+                            if idx >= last_idx or not kwargs["success"]:
+                                return
+                _log.debug("Event stream of batch %s ended before the batch", batch.id)
+                error: Exception = ClientPayloadError("Event stream ended")
+            except (ClientPayloadError, aiohttp.ClientConnectionError) as exc:
+                error = exc
             except asyncio.TimeoutError:
                 raise BatchTimeoutError()
 
+            if resumes >= self.MAX_RESUMES:
+                if isinstance(error, ClientPayloadError):
+                    _log.error(f"Event payload error (batch {batch.id}): {error}")
+                    return
+                raise error
+            resumes += 1
+            _log.debug("Resuming event stream of batch %s after: %r", batch.id, error)
+            await asyncio.sleep(self.RESUME_INTERVAL)
+
+            for result in await self._missed_results(batch, next_idx):
+                success = result.result.lower() == "ok"
+                yield events.CommandExecuted, dict(
+                    cmd_idx=result.index,
+                    message=result.message,
+                    stdout=result.stdout,
+                    stderr=result.stderr,
+                    success=success,
+                )
+                next_idx = result.index + 1
+                if result.index >= last_idx or not success:
+                    return
+
+
+class StreamingBatch(Batch):
+    """A `Batch` implementation that uses event streaming to return command status."""
+
+    async def __aiter__(self) -> AsyncIterator[CommandEventData]:
+        async for event in self._activity.event_stream.batch_events(self):
+            yield event
+
+
+@dataclass(frozen=True)
+class _MessageEvent:
+    """A server-sent event."""
+
+    type: Optional[str]
+    data: str
+    last_event_id: str
 
-def _message_event_to_event_data(msg_event: MessageEvent) -> CommandEventData:
-    """Convert a `MessageEvent` to a matching events.Event subclass and it's kwargs."""
+
+async def _read_message_events(
+    response: aiohttp.ClientResponse,
+) -> AsyncIterator[_MessageEvent]:
+    """Parse the server-sent events from the content of `response`."""
+
+    event_type = ""
+    data: List[str] = []
+    event_id = ""
+    async for line_bytes in response.content:
+        line = line_bytes.decode("utf-8").rstrip("\r\n")
+        if not line:
+            if data:
+                yield _MessageEvent(
+                    type=event_type or None, data="\n".join(data), last_event_id=event_id
+                )
+            event_type = ""
+            data = []
+            continue
+        if line.startswith(":"):
+            continue
+        name, _, value = line.partition(":")
+        value = value[1:] if value.startswith(" ") else value
+        if name == "event":
+            event_type = value
+        elif name == "data":
+            data.append(value)
+        elif name == "id":
+            event_id = value
+
+
+def _message_event_to_event_data(msg_event: _MessageEvent) -> CommandEventData:
+    """Convert a `_MessageEvent` to a matching events.Event subclass and it's kwargs."""
 
     if msg_event.type != "runtime":
         raise RuntimeError(f"Unsupported event: {msg_event.type}")
@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta, timezone
 from types import TracebackType
 from typing import (
@@ -7,6 +8,7 @@ from typing import (
     AsyncContextManager,
     AsyncIterator,
     Awaitable,
+    Final,
     Generator,
     Generic,
     Optional,
@@ -15,7 +17,7 @@ from typing import (
 )
 
 import aiohttp
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from ya_market import ApiClient, ApiException, RequestorApi, models
 
@@ -26,6 +28,15 @@ _ModelType = TypeVar("_ModelType", bound=Model)
 
 logger = logging.getLogger(__name__)
 
+COLLECT_OFFERS_TIMEOUT: Final[float] = 5.0
+"Time for which the market API holds a `collect_offers` call if there are no new events."
+
+COLLECT_OFFERS_MIN_EVENTS: Final[int] = 10
+"Initial maximum number of events fetched with a single `collect_offers` call."
+
+COLLECT_OFFERS_MAX_EVENTS: Final[int] = 100
+"Limit up to which the maximum number of events per `collect_offers` call grows (the API maximum)."
+
 
 class AgreementDetails(object):
     raw_details: models.Agreement
@@ -199,6 +210,34 @@ class OfferProposal(object):
         )"""
 
 
+@dataclass
+class SubscriptionStats:
+    """Offer collection statistics of a single :class:`Subscription`."""
+
+    started_at: float = field(default_factory=time.monotonic)
+    polls: int = 0
+    """Number of `collect_offers` calls made"""
+    empty_polls: int = 0
+    """Number of `collect_offers` calls that returned no events"""
+    events_requested: int = 0
+    """Sum of the maximum numbers of events requested with `collect_offers` calls"""
+    events: int = 0
+    """Number of events received"""
+    offers: int = 0
+    """Number of offer proposals received"""
+
+    @property
+    def offers_per_second(self) -> float:
+        """Rate at which offer proposals have been received since the subscription was created."""
+        elapsed = time.monotonic() - self.started_at
+        return self.offers / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def poll_efficiency(self) -> float:
+        """Ratio of the events received to the maximum number of events requested."""
+        return self.events / self.events_requested if self.events_requested else 0.0
+
+
 class Subscription(object):
     """Mid-level interface to REST API's Subscription model."""
 
@@ -213,6 +252,7 @@ class Subscription(object):
         self._open: bool = True
         self._deleted = False
         self._details = _details
+        self.stats = SubscriptionStats()
 
     @property
     def id(self):
@@ -236,16 +276,34 @@ class Subscription(object):
     async def delete(self):
         """Unsubscribe this Demand from the market."""
         self._open = False
+        logger.debug(
+            "Collected %d offers (%.2f/s) in %d polls, poll efficiency: %.2f, subscription_id: %s",
+            self.stats.offers,
+            self.stats.offers_per_second,
+            self.stats.polls,
+            self.stats.poll_efficiency,
+            self._id,
+        )
         if not self._deleted:
             await self._api.unsubscribe_demand(self._id)
 
     async def events(self) -> AsyncIterator[OfferProposal]:
-        """Yield counter-proposals based on the incoming, matching Offers."""
+        """Yield counter-proposals based on the incoming, matching Offers.
+
+        The market API call waits up to `COLLECT_OFFERS_TIMEOUT` seconds for new events, so
+        there's no need to wait between the calls. Whenever a call returns as many events
+        as requested, the number of events requested with the next one is doubled,
+        up to `COLLECT_OFFERS_MAX_EVENTS`.
+        """
+        max_events = COLLECT_OFFERS_MIN_EVENTS
         while self._open:
             proposals = []
+            started_at = time.monotonic()
             try:
-                async with SuppressedExceptions(is_intermittent_error):
-                    proposals = await self._api.collect_offers(self._id, timeout=5, max_events=10)
+                async with SuppressedExceptions(is_intermittent_error) as suppressed:
+                    proposals = await self._api.collect_offers(
+                        self._id, timeout=COLLECT_OFFERS_TIMEOUT, max_events=max_events
+                    )
             except ApiException as ex:
                 if ex.status == 404:
                     logger.debug(
@@ -260,11 +318,24 @@ class Subscription(object):
                 else:
                     raise
 
+            self.stats.polls += 1
+            self.stats.events_requested += max_events
+            self.stats.events += len(proposals)
+            if not proposals:
+                self.stats.empty_polls += 1
+
             for proposal in proposals:
                 if isinstance(proposal, models.ProposalEvent):
+                    self.stats.offers += 1
                     yield OfferProposal(self, proposal)
 
-            if not proposals:
+            if len(proposals) >= max_events:
+                max_events = min(2 * max_events, COLLECT_OFFERS_MAX_EVENTS)
+            elif not proposals and (
+                suppressed.exception or time.monotonic() - started_at < COLLECT_OFFERS_TIMEOUT / 2
+            ):
+                # The call returned early without any events, e.g. because of an error,
+                # don't retry immediately
                 await asyncio.sleep(1)
 
 
@@ -1,19 +1,48 @@
 import asyncio
+import itertools
+import json
 import logging
+import os
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
-from typing import AsyncIterator, Iterable, List, Optional, Union, cast
+from pathlib import Path
+from typing import (
+    AsyncIterator,
+    Final,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
 
 from dataclasses import dataclass
 
 import ya_payment.models as yap
 from ya_payment import Account, ApiClient, RequestorApi
 
+from ..utils import LatencyStats
 from .common import SuppressedExceptions, is_intermittent_error, repeat_on_error
 from .resource import ResourceCtx
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_INVOICE_FETCH_PARALLELISM: Final[int] = 10
+"Default maximum number of invoices fetched concurrently by `Payment.incoming_invoices()`."
+
+DEFAULT_EVENTS_POLL_TIMEOUT: Final[float] = 5.0
+"Time for which yagna holds a request for payment events if there are none, in seconds."
+
+EVENTS_REQUEST_TIMEOUT_MARGIN: Final[float] = 5.0
+"Time added to the poll timeout to get the timeout of a request for payment events, in seconds."
+
 
 class Invoice(yap.Invoice):
     def __init__(self, _api: RequestorApi, _base: yap.Invoice):
@@ -38,6 +67,9 @@ class DebitNote(yap.DebitNote):
 
 
 InvoiceStatus = yap.InvoiceStatus
+
+ACCEPTED_STATUSES: Final[Tuple[str, ...]] = (InvoiceStatus.ACCEPTED, InvoiceStatus.SETTLED)
+"Statuses of invoices and debit notes that have already been accepted."
 MarketDecoration = yap.MarketDecoration
 
 
@@ -112,11 +144,152 @@ class _AllocationTask(ResourceCtx[Allocation]):
             await self._api.release_allocation(self._id)
 
 
+_PaymentState = Tuple[Optional[datetime], Optional[datetime], FrozenSet[str]]
+"Positions of the invoice and debit note cursors and the ids of the unpaid agreements."
+
+
+class EventCursor:
+    """Position in a stream of payment events up to which all the events have been processed.
+
+    The events are registered with :func:`received` in the order of the stream and marked
+    with :func:`processed` once they're handled, in any order. The position is the timestamp
+    of the latest event that has been processed along with all the events before it, so the
+    stream may be resumed after it without skipping any unprocessed events.
+    """
+
+    def __init__(self, position: Optional[datetime] = None):
+        self.position = position
+        self._pending: "OrderedDict[Hashable, Tuple[datetime, bool]]" = OrderedDict()
+
+    @property
+    def pending(self) -> int:
+        """Return the number of received events that haven't been processed yet."""
+        return sum(1 for _, done in self._pending.values() if not done)
+
+    def received(self, event_id: str, timestamp: datetime) -> None:
+        """Register a received event, which is going to be processed."""
+        self._pending[event_id] = (timestamp, False)
+
+    def skipped(self, timestamp: datetime) -> None:
+        """Register a received event which doesn't need processing."""
+        if self._pending:
+            self._pending[object()] = (timestamp, True)
+        else:
+            self.position = timestamp
+
+    def processed(self, event_id: str) -> None:
+        """Mark a received event as processed and advance the position if possible."""
+        entry = self._pending.get(event_id)
+        if entry is None:
+            return
+        self._pending[event_id] = (entry[0], True)
+        while self._pending:
+            key, (timestamp, done) = next(iter(self._pending.items()))
+            if not done:
+                break
+            del self._pending[key]
+            self.position = timestamp
+
+
+class PaymentEventCursors:
+    """Cursors of the invoice and debit note event streams, optionally persisted in a file.
+
+    The file is a small JSON document with the positions of both cursors and the ids of the
+    agreements that are to be paid, but haven't been paid yet. If it exists, the cursors start
+    at the saved positions, so a restarted requestor resumes processing the payment events
+    where it left off, and pays the invoices of the agreements left unpaid.
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, save_interval: float = 1.0):
+        self.path = Path(path) if path is not None else None
+        self.save_interval = save_interval
+        self.invoices = EventCursor()
+        self.debit_notes = EventCursor()
+        self.unpaid_agreements: Set[str] = set()
+        "Ids of the agreements whose invoices are to be accepted, but haven't been yet."
+        self._saved: Optional[_PaymentState] = None
+        self._saved_at = 0.0
+        #   Writes may run in executor threads, the newest state written wins
+        self._write_lock = threading.Lock()
+        self._versions = itertools.count(1)
+        self._written_version = 0
+        if self.path and self.path.exists():
+            self._load()
+
+    def _state(self) -> _PaymentState:
+        return self.invoices.position, self.debit_notes.position, frozenset(self.unpaid_agreements)
+
+    def _load(self) -> None:
+        assert self.path
+        try:
+            data = json.loads(self.path.read_text())
+            for name, cursor in (("invoices", self.invoices), ("debitNotes", self.debit_notes)):
+                if data.get(name):
+                    cursor.position = datetime.fromisoformat(data[name])
+            self.unpaid_agreements.update(data.get("unpaidAgreements", []))
+        except (OSError, ValueError):
+            logger.warning("Invalid payment event cursor file %s, ignoring it", self.path)
+        self._saved = self._state()
+
+    def _changed_state(self, force: bool) -> Optional[_PaymentState]:
+        if not self.path:
+            return None
+        if not force and time.monotonic() - self._saved_at < self.save_interval:
+            return None
+        state = self._state()
+        return None if state == self._saved else state
+
+    def _write(self, state: _PaymentState, version: int) -> None:
+        assert self.path
+        invoices, debit_notes, unpaid_agreements = state
+        data = {
+            "invoices": invoices.isoformat() if invoices else None,
+            "debitNotes": debit_notes.isoformat() if debit_notes else None,
+            "unpaidAgreements": sorted(unpaid_agreements),
+        }
+        with self._write_lock:
+            if version < self._written_version:
+                return
+            tmp_path = self.path.with_name(self.path.name + ".tmp")
+            tmp_path.write_text(json.dumps(data))
+            os.replace(tmp_path, self.path)
+            self._written_version = version
+
+    def _saved_state(self, state: _PaymentState) -> None:
+        self._saved = state
+        self._saved_at = time.monotonic()
+
+    def save(self, force: bool = False) -> None:
+        """Write the positions of the cursors and the unpaid agreements to the file, if changed.
+
+        Unless `force` is set, the file is written at most once per `save_interval` seconds.
+        """
+        state = self._changed_state(force)
+        if state is not None:
+            self._write(state, next(self._versions))
+            self._saved_state(state)
+
+    async def save_in_executor(self, force: bool = False) -> None:
+        """Work like :func:`save`, but write the file in the default executor."""
+        state = self._changed_state(force)
+        if state is not None:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self._write, state, next(self._versions))
+            self._saved_state(state)
+
+
 class Payment(object):
-    __slots__ = ("_api",)
+    __slots__ = ("_api", "_debit_note_latency")
+
+    def __init__(self, api_client: ApiClient, debit_note_latency: Optional[LatencyStats] = None):
+        """Initialize the payment API.
 
-    def __init__(self, api_client: ApiClient):
+        :param api_client: client of the yagna payment API
+        :param debit_note_latency: if given, the durations of :func:`debit_note` calls,
+            including retries, are recorded in it
+        """
         self._api: RequestorApi = RequestorApi(api_client)
+        self._debit_note_latency = debit_note_latency
 
     def new_allocation(
         self,
@@ -199,8 +372,14 @@ class Payment(object):
     async def decorate_demand(self, ids: List[str]) -> yap.MarketDecoration:
         return await self._api.get_demand_decorations(ids)
 
-    @repeat_on_error(max_tries=5)
     async def debit_note(self, debit_note_id: str) -> DebitNote:
+        if self._debit_note_latency is None:
+            return await self._get_debit_note(debit_note_id)
+        with self._debit_note_latency.measure():
+            return await self._get_debit_note(debit_note_id)
+
+    @repeat_on_error(max_tries=5)
+    async def _get_debit_note(self, debit_note_id: str) -> DebitNote:
         debit_note = await self._api.get_debit_note(debit_note_id)
         return DebitNote(_api=self._api, _base=debit_note)
 
@@ -213,50 +392,111 @@ class Payment(object):
         invoice_obj = await self._api.get_invoice(invoice_id)
         return Invoice(_api=self._api, _base=invoice_obj)
 
-    def incoming_invoices(self) -> AsyncIterator[Invoice]:
-        ts = datetime.now(timezone.utc)
-
-        async def fetch(init_ts: datetime):
-            ts = init_ts
-            while True:
-                # In the current version of `ya-aioclient` the method `get_invoice_events`
-                # incorrectly accepts `timeout` parameter, while the server uses `pollTimeout`
-                # events = await api.get_invoice_events(poll_timeout=5, after_timestamp=ts)
-                events = []
-                async with SuppressedExceptions(is_intermittent_error):
-                    events = await self._api.get_invoice_events(after_timestamp=ts)
+    async def _get_events(
+        self, path: str, response_type: str, after_timestamp: datetime, poll_timeout: float
+    ) -> list:
+        """Get the events that occurred after `after_timestamp`.
+
+        If there are no such events, yagna holds the request for up to `poll_timeout` seconds
+        until one appears. The `get_*_events` methods of `ya-aioclient` pass the poll timeout
+        as `timeout`, while the server expects `pollTimeout`, so the request is made here.
+        """
+        return await self._api.api_client.call_api(
+            path,
+            "GET",
+            query_params=[("pollTimeout", poll_timeout), ("afterTimestamp", after_timestamp)],
+            header_params={"Accept": "application/json"},
+            response_type=response_type,
+            auth_settings=["app_key"],
+            _return_http_data_only=True,
+            _request_timeout=poll_timeout + EVENTS_REQUEST_TIMEOUT_MARGIN,
+        )
+
+    async def _event_batches(
+        self, path: str, response_type: str, cursor: "EventCursor", poll_timeout: float
+    ) -> AsyncIterator[list]:
+        """Yield batches of events that occur after the position of `cursor`, using long polling.
+
+        The events are not registered with `cursor`, only its position is used to start.
+        """
+        ts = cursor.position or datetime.now(timezone.utc)
+        while True:
+            events = []
+            started_at = time.monotonic()
+            async with SuppressedExceptions(is_intermittent_error) as se:
+                events = await self._get_events(path, response_type, ts, poll_timeout)
+            if events:
+                ts = events[-1].event_date
+                yield events
+            # Sleep only if the call didn't wait for the events, i.e. it failed or yagna
+            # doesn't support long polling, to avoid busy looping
+            elif se.exception or time.monotonic() - started_at < poll_timeout / 2:
+                await asyncio.sleep(1)
+
+    def incoming_invoices(
+        self,
+        parallelism: int = DEFAULT_INVOICE_FETCH_PARALLELISM,
+        cursor: Optional["EventCursor"] = None,
+        poll_timeout: float = DEFAULT_EVENTS_POLL_TIMEOUT,
+    ) -> AsyncIterator[Invoice]:
+        """Yield the invoices received after the position of `cursor` (by default: from now on).
+
+        The invoices announced in a single batch of events are fetched concurrently,
+        at most `parallelism` at a time, and yielded in the order of the events.
+        Each yielded invoice is registered with `cursor` as received, the consumer should mark
+        it as processed with `cursor.processed(invoice.invoice_id)`.
+        """
+        cursor = cursor or EventCursor()
+        semaphore = asyncio.Semaphore(parallelism)
+
+        async def fetch_invoice(invoice_id: str) -> Invoice:
+            async with semaphore:
+                return await self.invoice(invoice_id)
+
+        async def fetch():
+            async for events in self._event_batches(
+                "/invoiceEvents", "list[InvoiceEvent]", cursor, poll_timeout
+            ):
+                invoice_ids = []
                 for ev in events:
                     logger.debug("Received invoice event: %r, type: %s", ev, ev.__class__)
-                    ts = ev.event_date
-                    if isinstance(ev, yap.InvoiceReceivedEvent):
-                        if not ev.invoice_id:
+                    if isinstance(ev, yap.InvoiceReceivedEvent) and ev.invoice_id:
+                        cursor.received(ev.invoice_id, ev.event_date)
+                        invoice_ids.append(ev.invoice_id)
+                    else:
+                        if isinstance(ev, yap.InvoiceReceivedEvent):
                             logger.error("Empty invoice id in event: %r", ev)
-                            continue
-                        invoice = await self.invoice(ev.invoice_id)
-                        yield invoice
-                if not events:
-                    await asyncio.sleep(1)
-
-        return fetch(ts)
-
-    def incoming_debit_note_ids(self) -> AsyncIterator[str]:
-        ts = datetime.now(timezone.utc)
-
-        async def fetch(init_ts: datetime):
-            ts = init_ts
-            while True:
-                events = []
-                async with SuppressedExceptions(is_intermittent_error):
-                    events = await self._api.get_debit_note_events(after_timestamp=ts)
+                        cursor.skipped(ev.event_date)
+                for invoice in await asyncio.gather(*map(fetch_invoice, invoice_ids)):
+                    yield invoice
+
+        return fetch()
+
+    def incoming_debit_note_ids(
+        self,
+        cursor: Optional["EventCursor"] = None,
+        poll_timeout: float = DEFAULT_EVENTS_POLL_TIMEOUT,
+    ) -> AsyncIterator[str]:
+        """Yield the ids of debit notes received after the position of `cursor` \
+        (by default: from now on).
+
+        Each yielded id is registered with `cursor` as received, the consumer should mark it as
+        processed with `cursor.processed(debit_note_id)`.
+        """
+        cursor = cursor or EventCursor()
+
+        async def fetch():
+            async for events in self._event_batches(
+                "/debitNoteEvents", "list[DebitNoteEvent]", cursor, poll_timeout
+            ):
                 for ev in events:
                     logger.debug("Received debit note event: %r, type: %s", ev, ev.__class__)
-                    ts = ev.event_date
-                    if isinstance(ev, yap.DebitNoteReceivedEvent):
-                        if not ev.debit_note_id:
-                            logger.error("Empty debit note id in event: %r", ev)
-                            continue
+                    if isinstance(ev, yap.DebitNoteReceivedEvent) and ev.debit_note_id:
+                        cursor.received(ev.debit_note_id, ev.event_date)
                         yield ev.debit_note_id
-                if not events:
-                    await asyncio.sleep(1)
+                    else:
+                        if isinstance(ev, yap.DebitNoteReceivedEvent):
+                            logger.error("Empty debit note id in event: %r", ev)
+                        cursor.skipped(ev.event_date)
 
-        return fetch(ts)
+        return fetch()
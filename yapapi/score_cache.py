@@ -0,0 +1,82 @@
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from typing import Any, Dict, Final, Mapping, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCORE_CACHE_TTL: Final[timedelta] = timedelta(minutes=10)
+"Time after which a cached score is discarded."
+
+DEFAULT_SCORE_CACHE_SIZE: Final[int] = 10000
+"Maximum number of scores cached; the least recently used ones are evicted first."
+
+_Key = Tuple[str, str]
+
+
+def props_digest(props: Mapping[str, Any]) -> str:
+    """Return a digest of `props` that doesn't depend on the order of the properties."""
+    serialized = json.dumps(props, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(serialized.encode(), digest_size=16).hexdigest()
+
+
+class ScoreCache:
+    """Cache of offer scores, keyed by the issuer and the offer properties.
+
+    Entries expire after `ttl` and the least recently used ones are evicted once the cache
+    holds `max_size` entries.
+    """
+
+    def __init__(
+        self, ttl: timedelta = DEFAULT_SCORE_CACHE_TTL, max_size: int = DEFAULT_SCORE_CACHE_SIZE
+    ):
+        self._ttl = ttl.total_seconds()
+        self._max_size = max_size
+        self._entries: "OrderedDict[_Key, Tuple[float, float]]" = OrderedDict()
+        self._keys_by_issuer: Dict[str, Set[_Key]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, issuer: str, props: Mapping[str, Any]) -> Optional[float]:
+        """Return the cached score of an offer from `issuer` with `props`, or `None`."""
+        key = (issuer, props_digest(props))
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, issuer: str, props: Mapping[str, Any], score: float) -> None:
+        """Store the score of an offer from `issuer` with `props`."""
+        key = (issuer, props_digest(props))
+        self._entries[key] = (time.monotonic() + self._ttl, score)
+        self._entries.move_to_end(key)
+        self._keys_by_issuer.setdefault(issuer, set()).add(key)
+        while len(self._entries) > self._max_size:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate(self, issuer: Optional[str] = None) -> None:
+        """Discard cached scores of offers from `issuer`, or all cached scores if it's `None`."""
+        if issuer is None:
+            self._entries.clear()
+            self._keys_by_issuer.clear()
+            return
+        for key in self._keys_by_issuer.pop(issuer, ()):
+            del self._entries[key]
+
+    def _remove(self, key: _Key) -> None:
+        del self._entries[key]
+        issuer_keys = self._keys_by_issuer[key[0]]
+        issuer_keys.discard(key)
+        if not issuer_keys:
+            del self._keys_by_issuer[key[0]]
@@ -6,15 +6,58 @@ import io
 import os
 import pathlib
 from os import PathLike
-from typing import AsyncIterator, NamedTuple, Optional, Union
+from typing import AsyncIterator, BinaryIO, List, NamedTuple, Optional, Protocol, Union
 
 import aiohttp
 
 _BUF_SIZE = 40960
+# Files are read and written in bigger chunks, in the event loop's default executor
+_FILE_BUF_SIZE = 1024 * 1024
 DOWNLOAD_BYTES_LIMIT_DEFAULT = 1 * 1024 * 1024
 AsyncReader = Union[asyncio.streams.StreamReader, aiohttp.streams.StreamReader]
 
 
+class _Digest(Protocol):
+    """A hash object, e.g. one returned by `hashlib.sha256` or `hashlib.blake2b`."""
+
+    def update(self, data: bytes, /) -> None:
+        ...
+
+
+def _write_chunks(f: BinaryIO, chunks: List[bytes], digest: Optional[_Digest]) -> None:
+    for chunk in chunks:
+        if digest:
+            digest.update(chunk)
+        f.write(chunk)
+    f.flush()
+
+
+async def _write_file(
+    path: PathLike, stream: AsyncIterator[bytes], digest: Optional[_Digest] = None
+) -> None:
+    """Write the chunks from `stream` to the file `path`, adding them to `digest` if given.
+
+    The file is opened, written and closed in the event loop's default executor. Small chunks
+    are coalesced, so that each call in the executor writes at least `_FILE_BUF_SIZE` bytes.
+    """
+    loop = asyncio.get_event_loop()
+    chunks: List[bytes] = []
+    buffered = 0
+    f = await loop.run_in_executor(None, open, path, "wb")
+    try:
+        async for chunk in stream:
+            chunks.append(chunk)
+            buffered += len(chunk)
+            if buffered >= _FILE_BUF_SIZE:
+                await loop.run_in_executor(None, _write_chunks, f, chunks, digest)
+                chunks, buffered = [], 0
+        if chunks:
+            await loop.run_in_executor(None, _write_chunks, f, chunks, digest)
+    finally:
+        # Closing a file may take long too, while its data is being written back
+        await loop.run_in_executor(None, f.close)
+
+
 class Content(NamedTuple):
     length: int
     stream: AsyncIterator[bytes]
@@ -50,25 +93,25 @@ class Destination(abc.ABC):
     async def download_stream(self) -> Content:
         raise NotImplementedError
 
-    async def download_bytes(self, limit: int = DOWNLOAD_BYTES_LIMIT_DEFAULT):
-        output = b""
+    async def download_bytes(self, limit: int = DOWNLOAD_BYTES_LIMIT_DEFAULT) -> bytes:
+        chunks = []
+        length = 0
         content = await self.download_stream()
 
         async for chunk in content.stream:
-            limit_remaining = limit - len(output)
+            limit_remaining = limit - length
             if limit_remaining > len(chunk):
-                output += chunk
+                chunks.append(chunk)
+                length += len(chunk)
             else:
-                output += chunk[:limit_remaining]
+                chunks.append(chunk[:limit_remaining])
                 break
 
-        return output
+        return b"".join(chunks)
 
     async def download_file(self, destination_file: PathLike):
         content = await self.download_stream()
-        with open(destination_file, "wb") as f:
-            async for chunk in content.stream:
-                f.write(chunk)
+        await _write_file(destination_file, content.stream)
 
 
 class InputStorageProvider(abc.ABC):
@@ -85,14 +128,18 @@ class InputStorageProvider(abc.ABC):
     async def upload_file(self, path: os.PathLike) -> Source:
         fp = pathlib.Path(path)
         file_size = fp.stat().st_size
+        loop = asyncio.get_event_loop()
 
         async def read_file():
-            with io.open(path, "rb") as f:
+            f = await loop.run_in_executor(None, io.open, path, "rb")
+            try:
                 while True:
-                    b: bytes = f.read(_BUF_SIZE)
+                    b: bytes = await loop.run_in_executor(None, f.read, _FILE_BUF_SIZE)
                     if not b:
                         break
                     yield b
+            finally:
+                await loop.run_in_executor(None, f.close)
 
         return await self.upload_stream(file_size, read_file())
 
@@ -2,9 +2,12 @@
 
 import asyncio
 import contextlib
+import errno
+import hashlib
 import json
 import logging
 import os
+import shutil
 import sys
 import tempfile
 from os import PathLike
@@ -13,8 +16,10 @@ from types import TracebackType
 from typing import (
     AsyncContextManager,
     AsyncIterator,
+    Awaitable,
+    Callable,
     Dict,
-    Iterator,
+    Hashable,
     List,
     Literal,
     Optional,
@@ -29,9 +34,17 @@ from typing import (
 import jsonrpc_base
 import semantic_version
 from async_exit_stack import AsyncExitStack
-from dataclasses import dataclass
-
-from yapapi.storage import Content, Destination, Source, StorageProvider
+from dataclasses import dataclass, field
+
+from yapapi.storage import (
+    _FILE_BUF_SIZE,
+    DOWNLOAD_BYTES_LIMIT_DEFAULT,
+    Content,
+    Destination,
+    Source,
+    StorageProvider,
+    _write_file,
+)
 from yapapi.utils import strtobool
 
 _logger = logging.getLogger(__name__)
@@ -89,17 +102,27 @@ def service(debug=False) -> AsyncContextManager[GftpDriver]:
 
 
 class __Process(jsonrpc_base.Server):
+    """JSON-RPC client of a `gftp server` process.
+
+    Requests are written to the process' stdin as soon as they're made and a background task
+    reads the responses from its stdout, matching them with the requests by their ids,
+    so any number of requests may be in flight at once.
+    """
+
     def __init__(self, _debug: bool = False):
         super().__init__()
         self._debug = _debug
         self._proc: Optional[asyncio.subprocess.Process] = None
-        self._lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._responses: Dict[str, asyncio.Future] = {}
+        self._reader: Optional[asyncio.Task] = None
 
     async def __aenter__(self) -> GftpDriver:
         env = dict(os.environ, RUST_LOG="debug") if self._debug else None
         self._proc = await asyncio.create_subprocess_shell(
             "gftp server", stdout=asyncio.subprocess.PIPE, stdin=asyncio.subprocess.PIPE, env=env
         )
+        self._reader = asyncio.get_event_loop().create_task(self._read_responses(self._proc))
         return cast(GftpDriver, self)
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -109,24 +132,29 @@ class __Process(jsonrpc_base.Server):
     async def _close(self):
         if self._proc is None:
             return
-        p: asyncio.subprocess.Process = self._proc
-        self._proc = None
 
         with contextlib.suppress(Exception):
             await cast(GftpDriver, self).shutdown()
 
-        async with self._lock:
-            if p.stdin:
-                await p.stdin.drain()
-                p.stdin.close()
-                try:
-                    await asyncio.wait_for(p.wait(), 10.0)
-                    return
-                except asyncio.TimeoutError:
-                    pass
-        p.kill()
-        ret_code = await p.wait()
-        _logger.debug("GFTP server closed, code=%d", ret_code)
+        p: asyncio.subprocess.Process = self._proc
+        self._proc = None
+        try:
+            async with self._write_lock:
+                if p.stdin:
+                    await p.stdin.drain()
+                    p.stdin.close()
+                    try:
+                        await asyncio.wait_for(p.wait(), 10.0)
+                        return
+                    except asyncio.TimeoutError:
+                        pass
+            p.kill()
+            ret_code = await p.wait()
+            _logger.debug("GFTP server closed, code=%d", ret_code)
+        finally:
+            if self._reader:
+                self._reader.cancel()
+                self._reader = None
 
     def __log_debug(self, msg_dir: Literal["in", "out"], msg: Union[bytes, str]):
         if self._debug:
@@ -137,22 +165,56 @@ class __Process(jsonrpc_base.Server):
             stderr.write(msg)
             stderr.flush()
 
+    async def _read_responses(self, proc: asyncio.subprocess.Process) -> None:
+        assert proc.stdout is not None
+        error: Exception = ConnectionError("gftp server has closed its output")
+        try:
+            while True:
+                msg = await proc.stdout.readline()
+                if not msg:
+                    if self._responses:
+                        sys.stderr.write(
+                            "Please check if gftp is installed and is in your $PATH.\n"
+                        )
+                        sys.stderr.flush()
+                    break
+                self.__log_debug("in", msg)
+                response = json.loads(msg)
+                future = self._responses.pop(response.get("id"), None)
+                if future is None:
+                    _logger.debug("Unexpected message from gftp: %s", response)
+                elif not future.done():
+                    future.set_result(response)
+        except Exception as e:
+            _logger.debug("Cannot read gftp responses", exc_info=True)
+            error = e
+        finally:
+            responses, self._responses = self._responses, {}
+            for future in responses.values():
+                if not future.done():
+                    future.set_exception(error)
+
     async def send_message(self, message):
-        async with self._lock:
-            assert self._proc is not None
-            assert self._proc.stdin is not None
-            assert self._proc.stdout is not None
-            bytes = message.serialize() + "\n"
-            self.__log_debug("out", bytes)
-            self._proc.stdin.write(bytes.encode("utf-8"))
-            await self._proc.stdin.drain()
-            msg = await self._proc.stdout.readline()
-            self.__log_debug("in", msg)
-            if not msg:
-                sys.stderr.write("Please check if gftp is installed and is in your $PATH.\n")
-                sys.stderr.flush()
-            msg = json.loads(msg)
-            return message.parse_response(msg)
+        assert self._proc is not None
+        assert self._proc.stdin is not None
+        future: Optional[asyncio.Future] = None
+        if message.response_id is not None:
+            if self._reader is None or self._reader.done():
+                raise ConnectionError("gftp server has closed its output")
+            future = asyncio.get_event_loop().create_future()
+            self._responses[message.response_id] = future
+        bytes = message.serialize() + "\n"
+        self.__log_debug("out", bytes)
+        try:
+            async with self._write_lock:
+                self._proc.stdin.write(bytes.encode("utf-8"))
+                await self._proc.stdin.drain()
+            if future is None:
+                return None
+            return message.parse_response(await future)
+        finally:
+            if message.response_id is not None:
+                self._responses.pop(message.response_id, None)
 
 
 class GftpSource(Source):
@@ -173,9 +235,11 @@ class GftpSource(Source):
 
 
 class GftpDestination(Destination):
-    def __init__(self, _proc: GftpDriver, _link: PubLink) -> None:
+    def __init__(self, _proc: GftpDriver, _link: PubLink, _temporary: bool = False) -> None:
         self._proc = _proc
         self._link = _link
+        # Whether the file is a temporary file of `GftpProvider`, which can be moved
+        self._temporary = _temporary
 
     @property
     def upload_url(self) -> str:
@@ -184,35 +248,74 @@ class GftpDestination(Destination):
     async def download_stream(self) -> Content:
         file_path = Path(self._link["file"])
         length = file_path.stat().st_size
+        loop = asyncio.get_event_loop()
 
         async def chunks() -> AsyncIterator[bytes]:
-            with open(file_path, "rb") as f:
-                chunk = f.read(30_000)
+            f = await loop.run_in_executor(None, open, file_path, "rb")
+            try:
+                chunk = await loop.run_in_executor(None, f.read, _FILE_BUF_SIZE)
                 while chunk:
                     yield chunk
-                    chunk = f.read(30_000)
+                    chunk = await loop.run_in_executor(None, f.read, _FILE_BUF_SIZE)
+            finally:
+                await loop.run_in_executor(None, f.close)
 
         return Content(length=length, stream=chunks())
 
+    async def download_bytes(self, limit: int = DOWNLOAD_BYTES_LIMIT_DEFAULT) -> bytes:
+        # The received data is already in a file, so it can be read with a single call
+        return await asyncio.get_event_loop().run_in_executor(
+            None, _read_file, Path(self._link["file"]), limit
+        )
+
     async def download_file(self, destination_file: PathLike):
         if str(destination_file) == self._link["file"]:
             return
-        return await super().download_file(destination_file)
+        loop = asyncio.get_event_loop()
+        if self._temporary:
+            try:
+                await loop.run_in_executor(None, os.replace, self._link["file"], destination_file)
+                _logger.debug("Moved file %s to %s", self._link["file"], destination_file)
+                self._link["file"] = str(destination_file)
+                return
+            except OSError as err:
+                # E.g. the destination is on a different filesystem
+                _logger.debug("Cannot move file %s: %s", self._link["file"], err)
+        await loop.run_in_executor(None, _copy_file, Path(self._link["file"]), destination_file)
 
 
-@contextlib.contextmanager
-def _temp_file(temp_dir: Path) -> Iterator[Path]:
-    """Create a new temporary file in `temp_dir`.
+def _read_file(path: Path, limit: int) -> bytes:
+    with open(path, "rb") as f:
+        return f.read(min(limit, os.fstat(f.fileno()).st_size))
 
-    Implements the ContextManager interface. Deletes the file on ContextManager's exit.
+
+_COPY_FILE_RANGE_SIZE = 1024 * 1024 * 1024
+
+
+def _copy_file(source: Path, destination: PathLike) -> None:
+    """Copy the file `source` to `destination` without passing its data through user space.
+
+    Uses `os.copy_file_range()` if available for the two files, which also lets filesystems
+    that support it share the data between the two files, or `shutil.copyfile()` otherwise.
     """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(source, "rb") as src, open(destination, "wb") as dst:
+                while os.copy_file_range(src.fileno(), dst.fileno(), _COPY_FILE_RANGE_SIZE):
+                    pass
+            return
+        except OSError as err:
+            # Not supported by the kernel, or for these filesystems
+            if err.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    shutil.copyfile(source, destination)
+
+
+def _new_temp_file(temp_dir: Path) -> Path:
+    """Create a new, empty temporary file in `temp_dir` and return its path."""
     fd, name = tempfile.mkstemp(prefix="yapapi_", dir=temp_dir)
     os.close(fd)
-    path = Path(name)
-    try:
-        yield path
-    finally:
-        _delete_if_exists(path)
+    return Path(name)
 
 
 def _delete_if_exists(path: Path) -> None:
@@ -247,6 +350,35 @@ def read_use_gftp_close_env_var() -> Optional[bool]:
 
 MIN_GFTP_VERSION_THAT_CAN_GFTP_CLOSE = semantic_version.Version("0.7.3")
 
+CONTENT_DIGEST_SIZE = 32
+"""Size in bytes of the BLAKE2b digests identifying the contents uploaded by `GftpProvider`."""
+
+
+@dataclass
+class UploadStats:
+    """Statistics of the uploads to a `GftpProvider` served with already published content."""
+
+    hits: int = 0
+    """Number of uploads that reused a published URL with the same content."""
+
+    misses: int = 0
+    """Number of uploads that published new content."""
+
+    bytes_saved: int = 0
+    """Total length of the content of the uploads that reused a published URL."""
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of the uploads that reused a published URL."""
+        uploads = self.hits + self.misses
+        return self.hits / uploads if uploads else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.hits} hits, {self.misses} misses, hit rate {self.hit_rate:.1%},"
+            f" {self.bytes_saved} bytes saved"
+        )
+
 
 class GftpProvider(StorageProvider, AsyncContextManager[StorageProvider]):
     """A StorageProvider that communicates with `gftp server` through JSON-RPC.
@@ -289,6 +421,12 @@ class GftpProvider(StorageProvider, AsyncContextManager[StorageProvider]):
         URL can be safely deleted.
         """
 
+        content_keys: Set[Hashable] = field(default_factory=set)
+        """Keys under which this URL is stored in the provider's index of published content.
+
+        The keys are removed from the index when the URL is unpublished.
+        """
+
     def __init__(self, *, tmpdir: Optional[str] = None):
         self.__exit_stack = AsyncExitStack()
 
@@ -298,8 +436,23 @@ class GftpProvider(StorageProvider, AsyncContextManager[StorageProvider]):
         # Mapping of URLs to info on files published with this URL
         self._published_sources: Dict[str, GftpProvider.URLInfo] = dict()
 
-        # Lock used to synchronize access to self._published_sources
-        self._lock: asyncio.Lock = asyncio.Lock()
+        # URLs being closed by `gftp close`, with futures resolved when the command is done
+        self._closing: Dict[str, asyncio.Future] = dict()
+
+        # A file being published may get the URL of a file that's being closed at the same time,
+        # and `gftp` may process the two commands in any order. To tell if that has happened,
+        # the times of the `gftp close` commands are recorded, as values of a counter of events,
+        # while any `gftp publish` commands are in progress.
+        self._publications = 0
+        self._epoch = 0
+        self._closed_at: Dict[str, int] = dict()
+
+        # Index of published content: identical bytes (identified by their BLAKE2b digest)
+        # or the same, unmodified file are served by the source published first, as long as
+        # its URL is published. Uploads of content that's being published wait for it.
+        self._content_index: Dict[Hashable, GftpSource] = dict()
+        self._uploading: Dict[Hashable, asyncio.Future] = dict()
+        self.upload_stats = UploadStats()
 
         # Flag indicating if this `GftpProvider` will close unpublished URLs.
         # See this class' docstring for more details.
@@ -341,6 +494,8 @@ class GftpProvider(StorageProvider, AsyncContextManager[StorageProvider]):
         traceback: Optional[TracebackType],
     ) -> Optional[bool]:
         await self.__exit_stack.aclose()
+        if self.upload_stats.hits or self.upload_stats.misses:
+            _logger.info("GFTP uploads: %s", self.upload_stats)
         # Remove temporary files created by this provider
         if not self._temp_dir:
             raise RuntimeError("GftpProvider.__aenter__() not called")
@@ -351,10 +506,13 @@ class GftpProvider(StorageProvider, AsyncContextManager[StorageProvider]):
 
         return None
 
-    def __new_file(self) -> Path:
+    async def __new_file(self) -> Path:
         if not self._temp_dir:
             raise RuntimeError("GftpProvider.__aenter__() not called")
-        return self.__exit_stack.enter_context(_temp_file(self._temp_dir))
+        loop = asyncio.get_event_loop()
+        path = await loop.run_in_executor(None, _new_temp_file, self._temp_dir)
+        self.__exit_stack.callback(_delete_if_exists, path)
+        return path
 
     async def __get_process(self) -> GftpDriver:
         _debug = bool(os.getenv("DEBUG_GFTP"))
@@ -363,45 +521,121 @@ class GftpProvider(StorageProvider, AsyncContextManager[StorageProvider]):
             self._process = process
         return process
 
+    async def __upload_content(
+        self, key: Hashable, length: int, publish: Callable[[], Awaitable[GftpSource]]
+    ) -> GftpSource:
+        """Return a source with the content identified by `key`, calling `publish` if needed."""
+
+        while True:
+            source = self._content_index.get(key)
+            if source:
+                info = self._published_sources[source.download_url]
+                info.publish_count += 1
+                self.upload_stats.hits += 1
+                self.upload_stats.bytes_saved += length
+                _logger.debug(
+                    "Reusing URL = %s, count = %d", source.download_url, info.publish_count
+                )
+                return GftpSource(length, source._link)
+            uploading = self._uploading.get(key)
+            if not uploading:
+                break
+            # Whether it succeeds or not, check again when the upload is done
+            await asyncio.wait([uploading])
+
+        self.upload_stats.misses += 1
+        uploading = self._uploading[key] = asyncio.get_event_loop().create_future()
+        try:
+            source = await publish()
+            self._published_sources[source.download_url].content_keys.add(key)
+            self._content_index[key] = source
+            return source
+        finally:
+            del self._uploading[key]
+            uploading.set_result(None)
+
     async def upload_stream(self, length: int, stream: AsyncIterator[bytes]) -> Source:
-        file_name = self.__new_file()
-        with open(file_name, "wb") as f:
-            async for chunk in stream:
-                f.write(chunk)
-        return await self.upload_file(file_name, _temporary=True)
+        file_name = await self.__new_file()
+        digest = hashlib.blake2b(digest_size=CONTENT_DIGEST_SIZE)
+        await _write_file(file_name, stream, digest)
+        source = await self.__upload_content(
+            digest.digest(), length, lambda: self.__publish(file_name, temporary=True)
+        )
+        if source.path != file_name:
+            _delete_if_exists(file_name)
+        return source
+
+    async def upload_bytes(self, data: bytes) -> Source:
+        loop = asyncio.get_event_loop()
+
+        async def write_and_publish() -> GftpSource:
+            file_name = await self.__new_file()
+            await loop.run_in_executor(None, file_name.write_bytes, data)
+            return await self.__publish(file_name, temporary=True)
+
+        if len(data) < _FILE_BUF_SIZE:
+            digest = hashlib.blake2b(data, digest_size=CONTENT_DIGEST_SIZE).digest()
+        else:
+            # `hashlib` releases the GIL while hashing large data
+            digest = await loop.run_in_executor(
+                None, lambda: hashlib.blake2b(data, digest_size=CONTENT_DIGEST_SIZE).digest()
+            )
+        return await self.__upload_content(digest, len(data), write_and_publish)
 
     async def upload_file(self, path: os.PathLike, _temporary: bool = False) -> Source:
         path = Path(path)
+        if _temporary:
+            return await self.__publish(path, temporary=True)
+        # A file is considered unmodified as long as its inode, size and mtime are the same
+        stat = path.stat()
+        key = (str(path.resolve()), stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        return await self.__upload_content(
+            key, stat.st_size, lambda: self.__publish(path, temporary=False)
+        )
+
+    async def __publish(self, path: Path, temporary: bool) -> GftpSource:
         _logger.debug("Publishing file %s...", path)
         process = await self.__get_process()
 
-        async with self._lock:
-            links = await process.publish(files=[str(path)])
-            assert len(links) == 1, "Invalid gftp publish response"
-
-            length = path.stat().st_size
-
-            url = links[0]["url"]
-
-            if url not in self._published_sources:
-                info = GftpProvider.URLInfo(
-                    publish_count=1,
-                    temporary_files=({path} if _temporary else set()),
-                )
-                self._published_sources[url] = info
-            else:
-                info = self._published_sources[url]
+        while True:
+            self._epoch += 1
+            published_at = self._epoch
+            self._publications += 1
+            try:
+                links = await process.publish(files=[str(path)])
+                assert len(links) == 1, "Invalid gftp publish response"
+                url = links[0]["url"]
+                closing = self._closing.get(url)
+                if closing:
+                    await asyncio.shield(closing)
+                closed = self._closed_at.get(url, 0) > published_at
+            finally:
+                self._publications -= 1
+                if not self._publications:
+                    self._closed_at.clear()
+            if not closed:
+                break
+            _logger.debug("URL %s closed while publishing file %s, publishing again", url, path)
+
+        length = path.stat().st_size
+
+        if url not in self._published_sources:
+            info = GftpProvider.URLInfo(
+                publish_count=1,
+                temporary_files=({path} if temporary else set()),
+            )
+            self._published_sources[url] = info
+        else:
+            info = self._published_sources[url]
 
-                if path in info.temporary_files:
-                    raise ValueError(f"File {path} already published as temporary")
+            if path in info.temporary_files:
+                raise ValueError(f"File {path} already published as temporary")
 
-                if _temporary:
-                    info.temporary_files.add(path)
-                info.publish_count += 1
+            if temporary:
+                info.temporary_files.add(path)
+            info.publish_count += 1
 
-            _logger.debug(
-                "File %s published with URL = %s, count = %d", path, url, info.publish_count
-            )
+        _logger.debug("File %s published with URL = %s, count = %d", path, url, info.publish_count)
 
         source = GftpSource(length, links[0])
         return source
@@ -413,37 +647,43 @@ class GftpProvider(StorageProvider, AsyncContextManager[StorageProvider]):
         url = source.download_url
         _logger.debug("Releasing file %s with URL = %s ...", source.path, url)
 
-        async with self._lock:
-            if url not in self._published_sources:
-                raise ValueError(
-                    f"Trying to release an unpublished URL {url}, path = {source.path}"
-                )
-            info = self._published_sources[url]
-            info.publish_count -= 1
+        if url not in self._published_sources:
+            raise ValueError(f"Trying to release an unpublished URL {url}, path = {source.path}")
+        info = self._published_sources[url]
+        info.publish_count -= 1
 
-            _logger.debug(
-                "File %s released, URL = %s, count = %d", source.path, url, info.publish_count
-            )
+        _logger.debug(
+            "File %s released, URL = %s, count = %d", source.path, url, info.publish_count
+        )
 
-            if info.publish_count == 0:
-                _logger.debug("Unpublishing URL %s...", url)
-                if self._close_urls:
+        if info.publish_count == 0:
+            _logger.debug("Unpublishing URL %s...", url)
+            del self._published_sources[url]
+            for key in info.content_keys:
+                del self._content_index[key]
+            if self._close_urls:
+                closing = self._closing[url] = asyncio.get_event_loop().create_future()
+                try:
                     process = await self.__get_process()
                     await process.close(urls=[url])
+                finally:
+                    if self._publications:
+                        self._epoch += 1
+                        self._closed_at[url] = self._epoch
+                    del self._closing[url]
+                    closing.set_result(None)
 
-                for path in info.temporary_files:
-                    _delete_if_exists(path)
-
-                del self._published_sources[url]
+            for path in info.temporary_files:
+                _delete_if_exists(path)
 
     async def new_destination(self, destination_file: Optional[PathLike] = None) -> Destination:
         if destination_file:
             if Path(destination_file).exists():
                 destination_file = None
-        output_file = str(destination_file) if destination_file else str(self.__new_file())
+        output_file = str(destination_file) if destination_file else str(await self.__new_file())
         process = await self.__get_process()
         link = await process.receive(output_file=output_file)
-        return GftpDestination(process, link)
+        return GftpDestination(process, link, _temporary=not destination_file)
 
 
 def provider() -> AsyncContextManager[StorageProvider]:
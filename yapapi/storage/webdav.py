@@ -1,17 +1,29 @@
+import asyncio
+import itertools
 import logging
 import uuid
+from collections import deque
 from datetime import datetime
 from os import PathLike
-from typing import AsyncIterator, List, NamedTuple, Optional
+from typing import AsyncIterator, Deque, List, NamedTuple, Optional
 from urllib.parse import urljoin, urlparse
 
 import aiohttp
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
-from . import Content, Destination, Source, StorageProvider
+from . import _FILE_BUF_SIZE, Content, Destination, Source, StorageProvider
 
 _logger: logging.Logger = logging.getLogger(__name__)
 
+DEFAULT_PART_SIZE = 8 * 1024 * 1024
+"""Size in bytes of the ranges of a resource downloaded with separate requests."""
+
+DEFAULT_MAX_PARALLEL = 4
+"""Maximum number of ranges of a resource downloaded at the same time."""
+
+DEFAULT_LISTING_TTL = 5.0
+"""Time in seconds for which `DavStorageProvider.prop_find()` returns a cached listing."""
+
 
 class DavResource(NamedTuple):
     path: str
@@ -49,54 +61,185 @@ def _parse_prop_resp(xml: str) -> List[DavResource]:
     return list(map(resource, tree.findall("{DAV:}response")))
 
 
+def _content_range_length(content_range: Optional[str]) -> int:
+    """Return the complete length from a `Content-Range: bytes 0-99/1000` header."""
+    length = (content_range or "").rpartition("/")[2]
+    if not length.isdigit():
+        raise RuntimeError(f"invalid response content-range: {content_range}")
+    return int(length)
+
+
+def _retrieve_exception(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
 class _DavSource(Source):
-    def __init__(self, url: str, length: Optional[int] = None):
+    def __init__(
+        self, url: str, length: Optional[int] = None, client: Optional[aiohttp.ClientSession] = None
+    ):
         self._url = url
         self._length = length
+        self._client = client
 
     @property
     def download_url(self) -> str:
         return self._url
 
     async def content_length(self) -> int:
-        if self._length:
+        if self._length is not None:
             return self._length
+        if self._client:
+            return await self._head(self._client)
         async with aiohttp.ClientSession() as session:
-            async with session.get(url=self._url) as resp:
-                if resp.status != 200:
-                    raise RuntimeError("invalid url")
-                if resp.content_length is None:
-                    raise RuntimeError("invalid response missing length")
-                return resp.content_length
+            return await self._head(session)
+
+    async def _head(self, client: aiohttp.ClientSession) -> int:
+        async with client.head(url=self._url) as resp:
+            if resp.status != 200:
+                raise RuntimeError("invalid url")
+            if resp.content_length is None:
+                raise RuntimeError("invalid response missing length")
+            return resp.content_length
 
 
 class _DavDestination(Destination):
-    def __init__(self, client: aiohttp.ClientSession, url: str):
+    def __init__(
+        self,
+        client: aiohttp.ClientSession,
+        url: str,
+        part_size: int = DEFAULT_PART_SIZE,
+        max_parallel: int = DEFAULT_MAX_PARALLEL,
+    ):
         self._client = client
         self._url = url
+        self._part_size = part_size
+        self._max_parallel = max_parallel
 
     @property
     def upload_url(self) -> str:
         return self._url
 
     async def download_stream(self) -> Content:
-        resp = await self._client.get(self._url)
-        length = resp.content_length
-        if length is None:
-            raise RuntimeError("missing content-length")
+        """Download the resource, in parts of `part_size` bytes requested in parallel.
+
+        The first request asks for the first part only. If the server ignores the range,
+        the whole resource is streamed from its response. The other parts are requested with
+        `If-Range` set to the entity tag of the first response, so that a download fails
+        instead of mixing parts of different versions of a resource changed in the meantime.
+        """
+
+        resp = await self._client.get(
+            self._url, headers={"Range": f"bytes=0-{self._part_size - 1}"}
+        )
+        if resp.status == 200:
+            length = resp.content_length
+            if length is None:
+                resp.release()
+                raise RuntimeError("missing content-length")
+            return Content(length, self._read_response(resp))
+        if resp.status == 416:
+            # The resource is empty
+            resp.release()
+            return Content(0, self._read_parts(None, 0))
+        if resp.status != 206:
+            resp.release()
+            raise RuntimeError(
+                f"invalid response for url: {self._url}, {resp.status}/{resp.reason}"
+            )
+        length = _content_range_length(resp.headers.get("Content-Range"))
+        etag = resp.headers.get("ETag")
+        if etag and etag.startswith("W/"):
+            # Only a strong validator can be used with `If-Range`
+            etag = None
+        return Content(length, self._read_parts(resp, length, etag))
+
+    @staticmethod
+    async def _read_response(resp: aiohttp.ClientResponse) -> AsyncIterator[bytes]:
+        async with resp:
+            async for chunk in resp.content.iter_chunked(_FILE_BUF_SIZE):
+                yield chunk
+
+    async def _read_part(self, start: int, end: int, etag: Optional[str]) -> bytes:
+        headers = {"Range": f"bytes={start}-{end - 1}"}
+        if etag:
+            headers["If-Range"] = etag
+        async with self._client.get(self._url, headers=headers) as resp:
+            if etag and (resp.status == 200 or resp.headers.get("ETag", etag) != etag):
+                raise RuntimeError(
+                    f"resource changed during download: {self._url}, range {start}-{end - 1},"
+                    f" etag {resp.headers.get('ETag')}, expected {etag}"
+                )
+            if resp.status != 206:
+                raise RuntimeError(
+                    f"invalid response for url: {self._url}, range {start}-{end - 1},"
+                    f" {resp.status}/{resp.reason}"
+                )
+            data = await resp.read()
+        if len(data) != end - start:
+            raise RuntimeError(f"invalid response for url: {self._url}, range {start}-{end - 1}")
+        return data
 
-        return Content.from_reader(length, resp.content)
+    async def _read_parts(
+        self, first: Optional[aiohttp.ClientResponse], length: int, etag: Optional[str] = None
+    ) -> AsyncIterator[bytes]:
+        """Yield the parts of the resource in order, with up to `max_parallel` in flight."""
+
+        async def read_first() -> bytes:
+            assert first is not None
+            async with first:
+                return await first.read()
+
+        loop = asyncio.get_event_loop()
+        parts: Deque[asyncio.Task] = deque()
+        if first is not None:
+            parts.append(loop.create_task(read_first()))
+        starts = iter(range(self._part_size, length, self._part_size))
+        try:
+            while True:
+                for start in itertools.islice(starts, self._max_parallel - len(parts)):
+                    end = min(start + self._part_size, length)
+                    parts.append(loop.create_task(self._read_part(start, end, etag)))
+                if not parts:
+                    break
+                yield await parts.popleft()
+        finally:
+            for task in parts:
+                task.cancel()
+                task.add_done_callback(_retrieve_exception)
 
 
 @dataclass
 class DavStorageProvider(StorageProvider):
+    """A StorageProvider that stores the files on a WebDAV server, in the directory `base_url`.
+
+    The requests are made with `client`, so the connections are pooled by its connector,
+    which should allow at least `max_parallel` connections to the server.
+    """
+
     client: aiohttp.ClientSession
     base_url: str
     auth: Optional[aiohttp.BasicAuth] = None
 
+    part_size: int = DEFAULT_PART_SIZE
+    """Size in bytes of the ranges of a resource downloaded with separate requests."""
+
+    max_parallel: int = DEFAULT_MAX_PARALLEL
+    """Maximum number of ranges of a resource downloaded at the same time."""
+
+    listing_ttl: float = DEFAULT_LISTING_TTL
+    """Time in seconds for which `prop_find()` returns a cached listing, 0 to disable caching."""
+
+    _listing: Optional["asyncio.Task[List[DavResource]]"] = field(
+        default=None, init=False, repr=False
+    )
+    _listing_time: float = field(default=0.0, init=False, repr=False)
+
     def __post_init__(self):
         if self.base_url[-1] != "/":
             self.base_url += "/"
+        if self.part_size < 1 or self.max_parallel < 1:
+            raise ValueError("part_size and max_parallel must be positive")
 
     @classmethod
     async def for_directory(
@@ -110,26 +253,52 @@ class DavStorageProvider(StorageProvider):
         if base_url[-1] != "/":
             base_url += "/"
         col_url = urljoin(base_url, directory_name)
-        response = await client.request(method="MKCOL", url=col_url, auth=auth)
-        if response.status != 201 and response.status != 405:
-            response.raise_for_status()
-        return cls(client, col_url, auth=auth)
+        async with client.request(method="MKCOL", url=col_url, auth=auth) as response:
+            if response.status != 201 and response.status != 405:
+                response.raise_for_status()
+        return cls(client, col_url, auth=auth, **kwargs)
 
     async def upload_stream(self, length: int, stream: AsyncIterator[bytes]) -> Source:
         upload_url = self.__new_url()
-        resp = await self.client.request(method="PUT", url=upload_url, data=stream, auth=self.auth)
-        _logger.debug("upload done: %i", resp.status)
-        if resp.status != 201:
-            raise RuntimeError(
-                f"invalid response for url: {upload_url}, {resp.status}/{resp.reason}"
-            )
-        return _DavSource(self.__export_url(upload_url))
+        # With the length known, the body doesn't need the chunked transfer encoding,
+        # which some WebDAV servers don't support for PUT
+        headers = {"Content-Length": str(length)}
+        async with self.client.request(
+            method="PUT", url=upload_url, data=_coalesce(stream), auth=self.auth, headers=headers
+        ) as resp:
+            _logger.debug("upload done: %i", resp.status)
+            if resp.status != 201:
+                raise RuntimeError(
+                    f"invalid response for url: {upload_url}, {resp.status}/{resp.reason}"
+                )
+        # The directory has a new file
+        self._listing = None
+        return _DavSource(self.__export_url(upload_url), length, self.client)
 
     async def new_destination(self, destination_file: Optional[PathLike] = None) -> Destination:
         upload_url = self.__new_url()
-        return _DavDestination(self.client, self.__export_url(upload_url))
+        return _DavDestination(
+            self.client, self.__export_url(upload_url), self.part_size, self.max_parallel
+        )
 
-    async def prop_find(self):
+    async def prop_find(self) -> List[DavResource]:
+        """Return the resources in the provider's directory.
+
+        The listing is cached for `listing_ttl` seconds, or until a file is uploaded with this
+        provider. Concurrent calls share a single PROPFIND request.
+        """
+        loop = asyncio.get_event_loop()
+        listing = self._listing
+        if (
+            listing is None
+            or loop.time() - self._listing_time >= self.listing_ttl
+            or (listing.done() and (listing.cancelled() or listing.exception()))
+        ):
+            listing = self._listing = loop.create_task(self._prop_find())
+            self._listing_time = loop.time()
+        return list(await asyncio.shield(listing))
+
+    async def _prop_find(self) -> List[DavResource]:
         headers = {"content-type": "text/xml", "depth": "1"}
         data = """<?xml version="1.0"?>
         <a:propfind xmlns:a="DAV:">
@@ -162,3 +331,17 @@ class DavStorageProvider(StorageProvider):
     def __new_url(self):
         name = uuid.uuid4()
         return urljoin(self.base_url, str(name))
+
+
+async def _coalesce(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Join small chunks from `stream`, so that the body of a request is written in big chunks."""
+    chunks: List[bytes] = []
+    buffered = 0
+    async for chunk in stream:
+        chunks.append(chunk)
+        buffered += len(chunk)
+        if buffered >= _FILE_BUF_SIZE:
+            yield b"".join(chunks)
+            chunks, buffered = [], 0
+    if chunks:
+        yield b"".join(chunks)
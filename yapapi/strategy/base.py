@@ -2,10 +2,9 @@
 
 import abc
 import logging
-from copy import deepcopy
 from datetime import datetime, timezone
 from decimal import Decimal
-from typing import Dict, Final, Optional
+from typing import Callable, Dict, Final, List, Optional
 
 from dataclasses import dataclass
 
@@ -91,6 +90,27 @@ logger = logging.getLogger(__name__)
 class BaseMarketStrategy(DemandDecorator, abc.ABC):
     """Base market strategy interface."""
 
+    cache_scores: bool = False
+    """Whether the engine may cache the scores returned by :func:`score_offer`.
+
+    Cached scores are reused for offers from the same provider with the same properties.
+    A strategy whose scores depend on anything else must call :func:`invalidate_scores`
+    whenever that changes.
+    """
+
+    def add_score_invalidation_listener(self, listener: Callable[[Optional[str]], None]) -> None:
+        """Register `listener` to be called with the provider id on :func:`invalidate_scores`."""
+        # `vars()` rather than an attribute lookup, which wrapping strategies forward to the base
+        vars(self).setdefault("_score_invalidation_listeners", []).append(listener)
+
+    def invalidate_scores(self, provider_id: Optional[str] = None) -> None:
+        """Discard cached scores of offers from `provider_id`, or of all offers if it's `None`."""
+        listeners: List[Callable[[Optional[str]], None]] = vars(self).get(
+            "_score_invalidation_listeners", []
+        )
+        for listener in listeners:
+            listener(provider_id)
+
     @abc.abstractmethod
     async def score_offer(self, offer: rest.market.OfferProposal) -> float:
         """Score `offer`. Better offers should get higher scores."""
@@ -160,7 +180,7 @@ class MarketStrategy(BaseMarketStrategy, abc.ABC):
         Includes negotiation of the properties required for mid-agreement payments.
         """
         # Create a new DemandBuilder with a response to a provider offer.
-        updated_demand = deepcopy(our_demand)
+        updated_demand = our_demand.derive()
 
         # only enable mid-agreement-payments when we need a longer expiration
         # and when the provider supports it
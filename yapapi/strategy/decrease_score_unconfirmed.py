@@ -37,9 +37,22 @@ class DecreaseScoreForUnconfirmedAgreement(WrappingMarketStrategy):
          :func:`yapapi.Golem.add_event_consumer`.
         """
         if isinstance(event, events.AgreementConfirmed):
-            self._rejecting_providers.discard(event.provider_id)
+            if event.provider_id in self._rejecting_providers:
+                self._rejecting_providers.remove(event.provider_id)
+                self.invalidate_scores(event.provider_id)
         elif isinstance(event, events.AgreementRejected):
-            self._rejecting_providers.add(event.provider_id)
+            if event.provider_id not in self._rejecting_providers:
+                self._rejecting_providers.add(event.provider_id)
+                self.invalidate_scores(event.provider_id)
+
+    @property
+    def cache_scores(self) -> bool:  # type: ignore[override]
+        """Scores may be cached if the base strategy allows it.
+
+        The cached scores of a provider are invalidated when it's added to or removed from
+        the rejecting providers.
+        """
+        return self.base_strategy.cache_scores
 
     async def decorate_demand(self, demand: DemandBuilder) -> None:
         """Decorate `demand` using the base strategy."""
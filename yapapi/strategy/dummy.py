@@ -26,6 +26,8 @@ class DummyMS(MarketStrategy, object):
     For other offers, returns :const:`SCORE_REJECTED`.
     """
 
+    cache_scores = True
+
     def __init__(
         self,
         max_fixed_price: Decimal = Decimal("0.05"),
@@ -18,6 +18,8 @@ from .base import SCORE_REJECTED, SCORE_TRUSTED, MarketStrategy
 class LeastExpensiveLinearPayuMS(MarketStrategy, object):
     """A strategy that scores offers according to cost for given computation time."""
 
+    cache_scores = True
+
     def __init__(
         self,
         expected_time_secs: int = 60,
@@ -27,6 +27,7 @@ class WrappingMarketStrategy(BaseMarketStrategy, abc.ABC):
         :param base_strategy: the base strategy around which this strategy is wrapped.
         """
         self.base_strategy = base_strategy
+        base_strategy.add_score_invalidation_listener(self.invalidate_scores)
 
     async def decorate_demand(self, demand: DemandBuilder) -> None:
         await self.base_strategy.decorate_demand(demand)
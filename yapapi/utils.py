@@ -3,9 +3,24 @@ import asyncio
 import enum
 import functools
 import logging
+import math
+import time
 import warnings
+from contextlib import contextmanager
 from datetime import datetime, timezone, tzinfo
-from typing import AsyncContextManager, Callable, Dict, List, Optional, Union
+from typing import (
+    AsyncContextManager,
+    Callable,
+    Dict,
+    Final,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from dataclasses import dataclass, field
 
 logger = logging.getLogger(__name__)
 
@@ -289,3 +304,79 @@ def explode_dict(imploded_dict: Dict, separator=".") -> Dict:
         nested_obj[last_part] = value
 
     return obj
+
+
+LATENCY_HISTOGRAM_BUCKETS: Final[int] = 32
+"""Number of buckets of the `LatencyStats` histograms.
+
+The upper bound of the bucket `n` is `2 ** (n - 20)` seconds (i.e. about 1us for the first one),
+the last bucket also counts all longer durations.
+"""
+
+_LATENCY_HISTOGRAM_MIN_EXPONENT: Final[int] = -20
+
+
+def _latency_histogram_bucket_bound(bucket: int) -> float:
+    return 2.0 ** (bucket + _LATENCY_HISTOGRAM_MIN_EXPONENT)
+
+
+@dataclass
+class LatencyStats:
+    """Count, mean, maximum and histogram of the durations of a repeated operation, in seconds.
+
+    The histogram has buckets of exponentially growing width, so recording a duration takes
+    constant time and memory, and the percentiles are accurate to within a factor of 2.
+    """
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+    histogram: List[int] = field(default_factory=lambda: [0] * LATENCY_HISTOGRAM_BUCKETS)
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def record(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        bucket = 0
+        if duration > 0:
+            #   `duration` is in [2 ** (exponent - 1), 2 ** exponent)
+            _, exponent = math.frexp(duration)
+            bucket = max(0, exponent - _LATENCY_HISTOGRAM_MIN_EXPONENT)
+        self.histogram[min(bucket, LATENCY_HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, pct: float) -> float:
+        """Return an upper estimate of the `pct`-th percentile of the durations."""
+        rank = math.ceil(pct / 100 * self.count)
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank and seen:
+                return min(_latency_histogram_bucket_bound(bucket), self.max)
+        return self.max
+
+    def buckets(self) -> List[Tuple[float, int]]:
+        """Return the upper bounds and counts of the non-empty buckets of the histogram."""
+        return [
+            (_latency_histogram_bucket_bound(bucket), count)
+            for bucket, count in enumerate(self.histogram)
+            if count
+        ]
+
+    @contextmanager
+    def measure(self) -> Iterator[None]:
+        """Record the duration of the `with` block (also if it raises an exception)."""
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(time.monotonic() - started_at)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.count} x {self.mean * 1000:.1f}ms"
+            f" (p99 {self.percentile(99) * 1000:.1f}ms, max {self.max * 1000:.1f}ms)"
+        )